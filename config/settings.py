@@ -21,6 +21,12 @@ IMAGES_DIR = BASE_DIR / "img"
 # for URL generation
 IMAGES_DIR_DISPLAY = Path("/img")
 
+# Directory where the compiled taxonomy snapshots are stored
+# (see the build_taxonomy_snapshot command, run when building the Docker image)
+# Not under data/ nor ~/.cache: they are volumes in docker-compose.yml, that
+# would hide the snapshots of the image (and data/ is served by nginx)
+TAXONOMY_SNAPSHOT_DIR = BASE_DIR / "taxonomy_snapshots"
+
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.0/howto/deployment/checklist/
 
@@ -93,6 +99,8 @@ MIDDLEWARE = [
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "simple_history.middleware.HistoryRequestMiddleware",  # django-simple-history
+    "open_prices.common.middleware.IdentityMapMiddleware",
+    "open_prices.common.middleware.ResponseCacheMiddleware",
 ]
 
 APPEND_SLASH = False
@@ -241,6 +249,29 @@ SPECTACULAR_SETTINGS = {
     },
 }
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Shared between the processes (gunicorn workers & Django Q2 cluster) when
+# CACHE_REDIS_URL is set (ex: redis://redis:6379/1), else local to each process
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL")
+if CACHE_REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": CACHE_REDIS_URL,
+        }
+    }
+
+# Cache of the anonymous GET responses (see open_prices/common/response_cache.py)
+# Needs the shared cache: the writes of the other processes would otherwise
+# not invalidate the cached responses
+# kill switch: RESPONSE_CACHE_ENABLED=False
+RESPONSE_CACHE_ENABLED = (
+    os.getenv("RESPONSE_CACHE_ENABLED", "True") == "True"
+    and bool(CACHE_REDIS_URL)
+    and not TESTING
+)
+
 
 # Django Q2
 # https://django-q2.readthedocs.io/
@@ -5,6 +5,7 @@ from freezegun import freeze_time
 from open_prices.challenges import constants as challenge_constants
 from open_prices.challenges.factories import ChallengeFactory
 from open_prices.challenges.models import Challenge
+from open_prices.common.testing import ProcessCacheResetMixin
 
 
 class ChallengeListApiTest(TestCase):
@@ -64,7 +65,7 @@ class ChallengeListOrderApiTest(TestCase):
         self.assertEqual(response.data["items"][0]["id"], self.challenge_2.id)
 
 
-class ChallengeListFilterApiTest(TestCase):
+class ChallengeListFilterApiTest(ProcessCacheResetMixin, TestCase):
     @classmethod
     def setUpTestData(cls):
         cls.url = reverse("api:challenges-list")
@@ -0,0 +1,171 @@
+"""
+Compiled read path for the list endpoints (see api.utils.CompiledListMixin)
+
+A ModelSerializer (with its nested serializers) is compiled once into:
+- the list of the `.values_list()` lookups it needs
+- a row (tuple) -> dict function, with one precomputed getter per field
+No model instance is created, and the output only contains JSON native
+types (Decimal -> float), rendered by the C encoder of the json module.
+The output is identical to the serializer output (see the tests).
+"""
+
+import decimal
+import threading
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models.base import ModelState
+from rest_framework import serializers
+
+# fields whose to_representation() returns the database value unchanged
+IDENTITY_FIELD_CLASS_LIST = (
+    serializers.CharField,
+    serializers.IntegerField,
+    serializers.BooleanField,
+    serializers.JSONField,
+    serializers.PrimaryKeyRelatedField,
+)
+
+COMPILED_SERIALIZER_CACHE_MAX_SIZE = 128
+
+
+class NotCompilableError(Exception):
+    pass
+
+
+class CompiledSerializer:
+    def __init__(self, serializer: serializers.ModelSerializer):
+        self.lookup_list = list()
+        self.row_to_dict = self.compile_serializer(serializer, prefix="")
+
+    def get_lookup_index(self, lookup: str) -> int:
+        if lookup not in self.lookup_list:
+            self.lookup_list.append(lookup)
+        return self.lookup_list.index(lookup)
+
+    def compile_serializer(self, serializer, prefix: str):
+        model = serializer.Meta.model
+        getter_list = [
+            (field.field_name, self.compile_field(field, model, prefix))
+            for field in serializer._readable_fields
+        ]
+
+        def row_to_dict(row):
+            return {field_name: getter(row) for field_name, getter in getter_list}
+
+        return row_to_dict
+
+    def compile_field(self, field, model, prefix: str):
+        if "." in field.source or field.source == "*":
+            raise NotCompilableError(f"{field.field_name}: unsupported source")
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            model_field = None
+
+        # nested object (forward foreign key)
+        if isinstance(field, serializers.BaseSerializer):
+            if (
+                isinstance(field, serializers.ListSerializer)
+                or model_field is None
+                or not (model_field.many_to_one or model_field.one_to_one)
+                or not model_field.concrete
+            ):
+                raise NotCompilableError(f"{field.field_name}: unsupported nesting")
+            fk_index = self.get_lookup_index(prefix + model_field.name)
+            nested_row_to_dict = self.compile_serializer(
+                field, prefix=f"{prefix}{model_field.name}__"
+            )
+            return lambda row: (
+                None if row[fk_index] is None else nested_row_to_dict(row)
+            )
+
+        to_representation = self.get_to_representation(field)
+        # model column
+        if model_field is not None:
+            if not model_field.concrete or model_field.many_to_many:
+                raise NotCompilableError(f"{field.field_name}: not a column")
+            index = self.get_lookup_index(prefix + model_field.name)
+            if to_representation is None:
+                return lambda row: row[index]
+            return lambda row: (
+                None if row[index] is None else to_representation(row[index])
+            )
+
+        # model property: computed on a bare instance (no __init__, no signal)
+        if isinstance(getattr(model, field.source, None), property):
+            attname_index_list = [
+                (
+                    model_field.attname,
+                    self.get_lookup_index(prefix + model_field.name),
+                )
+                for model_field in model._meta.concrete_fields
+            ]
+            source = field.source
+
+            def get_property(row):
+                instance = model.__new__(model)
+                instance._state = ModelState()
+                for attname, index in attname_index_list:
+                    instance.__dict__[attname] = row[index]
+                value = getattr(instance, source)
+                if value is None or to_representation is None:
+                    return value
+                return to_representation(value)
+
+            return get_property
+
+        raise NotCompilableError(f"{field.field_name}: unsupported field")
+
+    def get_to_representation(self, field):
+        """
+        None if the value can be returned unchanged
+        """
+        if isinstance(field, serializers.SerializerMethodField):
+            raise NotCompilableError(f"{field.field_name}: method field")
+        if isinstance(field, IDENTITY_FIELD_CLASS_LIST) and not getattr(
+            field, "pk_field", None
+        ):
+            return None
+        if isinstance(field, serializers.DecimalField):
+            # COERCE_DECIMAL_TO_STRING=False: the JSON encoder returns floats
+            def decimal_to_representation(value):
+                value = field.to_representation(value)
+                if isinstance(value, decimal.Decimal):
+                    return float(value)
+                return value
+
+            return decimal_to_representation
+        return field.to_representation
+
+
+_compiled_serializer_dict = dict()
+_compiled_serializer_lock = threading.Lock()
+
+
+def get_compiled_serializer(
+    serializer: serializers.ModelSerializer,
+) -> CompiledSerializer | None:
+    """
+    Compiled version of the serializer (cached per serializer class and
+    field set, see ?fields=), None if it can't be compiled
+    """
+    key = (serializer.__class__, tuple(serializer.fields))
+    if key in _compiled_serializer_dict:
+        return _compiled_serializer_dict[key]
+    # compiled from a copy without the request
+    serializer = serializer.__class__(
+        context={
+            context_key: value
+            for context_key, value in serializer.context.items()
+            if context_key not in ["request", "view", "format"]
+        }
+    )
+    try:
+        compiled_serializer = CompiledSerializer(serializer)
+    except NotCompilableError:
+        compiled_serializer = None
+    with _compiled_serializer_lock:
+        if len(_compiled_serializer_dict) >= COMPILED_SERIALIZER_CACHE_MAX_SIZE:
+            _compiled_serializer_dict.clear()
+        _compiled_serializer_dict[key] = compiled_serializer
+    return compiled_serializer
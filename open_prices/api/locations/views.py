@@ -20,8 +20,12 @@ from open_prices.api.locations.serializers import (
     LocationNearbySerializer,
     LocationSerializer,
 )
-from open_prices.api.pagination import CustomPagination
-from open_prices.api.utils import get_object_or_drf_404, get_source_from_request
+from open_prices.api.pagination import CustomCursorPagination, CustomPagination
+from open_prices.api.utils import (
+    ConditionalGetMixin,
+    get_object_or_drf_404,
+    get_source_from_request,
+)
 from open_prices.common import openstreetmap, utils
 from open_prices.locations import constants as location_constants
 from open_prices.locations.models import Location
@@ -29,6 +33,7 @@ from open_prices.prices.models import Price
 
 
 class LocationViewSet(
+    ConditionalGetMixin,
     mixins.ListModelMixin,
     mixins.CreateModelMixin,
     mixins.RetrieveModelMixin,
@@ -40,6 +45,8 @@ class LocationViewSet(
     filterset_class = LocationFilter
     ordering_fields = ["id", "created"] + Location.COUNT_FIELDS
     ordering = ["id"]
+    pagination_class = CustomCursorPagination  # opt-in with ?cursor=
+    apply_pending_counter_deltas = True  # price_count, proof_count
 
     def get_serializer_class(self):
         if self.request.method == "POST":
@@ -93,8 +100,7 @@ class LocationViewSet(
     )
     def get_by_osm(self, request, osm_type, osm_id):
         location = get_object_or_drf_404(Location, osm_type=osm_type, osm_id=osm_id)
-        serializer = self.get_serializer(location)
-        return Response(serializer.data)
+        return self.get_object_response(location)
 
     @extend_schema(responses=CountrySerializer(many=True), filters=False)
     @action(detail=False, methods=["GET"], url_path="osm/countries")
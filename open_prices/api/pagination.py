@@ -1,18 +1,68 @@
+import base64
+import binascii
+import datetime
+import json
+
 from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils.functional import cached_property
 from rest_framework.exceptions import ParseError
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 
 
+class CustomPaginator(Paginator):
+    """
+    Use the queryset count strategy if available
+    (see common.managers.EstimatedCountQuerySet), or the count already
+    computed by the view (queryset.pagination_count, see ConditionalGetMixin)
+    """
+
+    count_is_estimate = False
+
+    @cached_property
+    def count(self):
+        pagination_count = getattr(self.object_list, "pagination_count", None)
+        if pagination_count is None:
+            get_pagination_count = getattr(
+                self.object_list, "get_pagination_count", None
+            )
+            if get_pagination_count is None:
+                return super().count
+            pagination_count = get_pagination_count()
+        count, self.count_is_estimate = pagination_count
+        return count
+
+    def validate_number(self, number):
+        if self.count and self.count_is_estimate:
+            # estimates can be too low (stale planner statistics): the page
+            # number is only bounded by max_page_number (see get_page_number)
+            return int(number)
+        return super().validate_number(number)
+
+    def page(self, number):
+        page = super().page(number)
+        if self.count_is_estimate:
+            # not truncated to the estimated count
+            bottom = (page.number - 1) * self.per_page
+            page.object_list = self.object_list[bottom : bottom + self.per_page]
+        return page
+
+
 class CustomPagination(PageNumberPagination):
     """
     docs: https://www.django-rest-framework.org/api-guide/pagination/#custom-pagination-styles  # noqa
     why do we override the pagination keys? we used to have fastapi-pagination before  # noqa
     - overridden keys: results -> items; count -> total
-    - added keys: page, pages, size
+    - added keys: page, pages, size, total_is_estimate
     - removed keys: next, previous
     """
 
+    django_paginator_class = CustomPaginator
+
     ### page size config
     page_size = 10
     page_size_query_param = "size"  # default is None
@@ -50,13 +100,21 @@ class CustomPagination(PageNumberPagination):
                 "pages": self.page.paginator.num_pages,
                 "size": self.page.paginator.per_page,
                 "total": self.page.paginator.count,
+                "total_is_estimate": self.page.paginator.count_is_estimate,
             }
         )
 
     def get_paginated_response_schema(self, schema):
         return {
             "type": "object",
-            "required": ["items", "page", "pages", "size", "total"],
+            "required": [
+                "items",
+                "page",
+                "pages",
+                "size",
+                "total",
+                "total_is_estimate",
+            ],
             "properties": {
                 "items": schema,
                 "page": {
@@ -79,5 +137,173 @@ class CustomPagination(PageNumberPagination):
                     "description": "Total number of items",
                     "example": 1531,
                 },
+                "total_is_estimate": {
+                    "type": "boolean",
+                    "description": "Whether total is the database planner estimate (large results) instead of an exact count",  # noqa
+                    "example": False,
+                },
             },
         }
+
+
+class CursorJSONEncoder(DjangoJSONEncoder):
+    """
+    DjangoJSONEncoder truncates datetimes & times to milliseconds (ECMA-262):
+    the cursor values must be exact, or rows are repeated (ASC) or skipped
+    (DESC) at the page boundaries
+    """
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime | datetime.time):
+            return o.isoformat()
+        return super().default(o)
+
+
+class CustomCursorPagination(CustomPagination):
+    """
+    Opt-in keyset (cursor) pagination: `?cursor=` (empty value for the
+    first page), then the `next_cursor` of the previous response.
+    - ordering: the view ordering (see ordering_fields & order_by) + id
+    (tiebreaker)
+    - the cursor is an opaque token encoding the ordering & the last
+    (order field(s), id) values
+    - no COUNT(*) and no OFFSET: constant cost pages at any depth, no
+    max_page_number
+    - keys: items, size, next_cursor (null on the last page)
+    """
+
+    cursor_query_param = "cursor"
+    cursor_query_description = "Cursor (keyset) pagination. Empty value for the first page, then the `next_cursor` value of the previous page."  # noqa
+
+    def is_cursor_request(self, request):
+        return self.cursor_query_param in request.query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.is_cursor_request(request)
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.size = self.get_page_size(request) or self.page_size
+        ordering = self.get_cursor_ordering(queryset)
+        queryset = queryset.order_by(*ordering)
+        cursor = request.query_params[self.cursor_query_param]
+        if cursor:
+            queryset = queryset.filter(
+                self.get_cursor_filter(
+                    queryset.model, ordering, self.decode_cursor(cursor, ordering)
+                )
+            )
+        result_list = list(queryset[: self.size + 1])
+        self.next_cursor = None
+        if len(result_list) > self.size:
+            result_list = result_list[: self.size]
+            self.next_cursor = self.encode_cursor(ordering, result_list[-1])
+        return result_list
+
+    def get_cursor_ordering(self, queryset) -> list[str]:
+        """
+        The queryset ordering (set by the OrderingFilter), with the primary
+        key appended as tiebreaker
+        """
+        pk_name = queryset.model._meta.pk.name
+        ordering = [
+            field_name
+            for field_name in (
+                queryset.query.order_by or queryset.model._meta.ordering or []
+            )
+            if isinstance(field_name, str)
+        ]
+        if not {pk_name, f"-{pk_name}", "pk", "-pk"} & set(ordering):
+            ordering.append(pk_name)
+        return ordering
+
+    def get_cursor_values(self, ordering: list[str], instance) -> list:
+        return [getattr(instance, field_name.lstrip("-")) for field_name in ordering]
+
+    def encode_cursor(self, ordering: list[str], instance) -> str:
+        cursor_json = json.dumps(
+            [ordering, self.get_cursor_values(ordering, instance)],
+            cls=CursorJSONEncoder,
+        )
+        return base64.urlsafe_b64encode(cursor_json.encode()).decode()
+
+    def decode_cursor(self, cursor: str, ordering: list[str]) -> list:
+        try:
+            cursor_ordering, cursor_values = json.loads(
+                base64.urlsafe_b64decode(cursor.encode())
+            )
+        except (binascii.Error, ValueError, TypeError):
+            raise ParseError("Invalid cursor.") from None
+        if cursor_ordering != ordering or len(cursor_values) != len(ordering):
+            raise ParseError("Invalid cursor (the ordering has changed).")
+        return cursor_values
+
+    def get_cursor_filter(self, model, ordering: list[str], cursor_values: list):
+        """
+        Rows after the cursor, in the ordering:
+        (f1 after v1) OR (f1 = v1 AND f2 after v2) OR ...
+        NULL values follow the Postgres default: last in ASC, first in DESC
+        """
+        cursor_filter = None
+        equal_filter = Q()
+        for field_name, cursor_value in zip(ordering, cursor_values, strict=True):
+            descending = field_name.startswith("-")
+            field_name = field_name.lstrip("-")
+            if cursor_value is not None:
+                try:
+                    cursor_value = model._meta.get_field(field_name).to_python(
+                        cursor_value
+                    )
+                except (FieldDoesNotExist, ValidationError):
+                    raise ParseError("Invalid cursor.") from None
+                after_filter = Q(
+                    **{f"{field_name}__{'lt' if descending else 'gt'}": cursor_value}
+                )
+                if not descending:
+                    after_filter |= Q(**{f"{field_name}__isnull": True})
+                field_equal_filter = Q(**{field_name: cursor_value})
+            else:
+                after_filter = (
+                    Q(**{f"{field_name}__isnull": False}) if descending else None
+                )
+                field_equal_filter = Q(**{f"{field_name}__isnull": True})
+            if after_filter is not None:
+                cursor_filter = (
+                    equal_filter & after_filter
+                    if cursor_filter is None
+                    else cursor_filter | (equal_filter & after_filter)
+                )
+            equal_filter &= field_equal_filter
+        return cursor_filter if cursor_filter is not None else Q(pk__in=[])
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response(
+            {
+                "items": data,
+                "size": self.size,
+                "next_cursor": self.next_cursor,
+            }
+        )
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema["properties"]["next_cursor"] = {
+            "type": "string",
+            "nullable": True,
+            "description": "Cursor of the next page (cursor pagination only, null on the last page). Page & total keys are not returned in this mode.",  # noqa
+        }
+        return response_schema
+
+    def get_schema_operation_parameters(self, view):
+        return super().get_schema_operation_parameters(view) + [
+            {
+                "name": self.cursor_query_param,
+                "required": False,
+                "in": "query",
+                "description": self.cursor_query_description,
+                "schema": {"type": "string"},
+            }
+        ]
@@ -3,6 +3,10 @@ from rest_framework import serializers
 from open_prices.api.locations.serializers import LocationSerializer
 from open_prices.api.products.serializers import ProductFullSerializer
 from open_prices.api.proofs.serializers import ProofSerializer
+from open_prices.api.serializers import (
+    IdentityMapPrimaryKeyRelatedField,
+    SparseFieldsetSerializerMixin,
+)
 from open_prices.common import history
 from open_prices.locations.models import Location
 from open_prices.prices.models import Price
@@ -26,21 +30,23 @@ class PriceSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
-class PriceFullSerializer(PriceSerializer):
+class PriceFullSerializer(SparseFieldsetSerializerMixin, PriceSerializer):
     product = ProductFullSerializer()
     location = LocationSerializer()
     proof = ProofSerializer()  # without location object
 
+    expandable_field_list = ["product", "location", "proof"]
+
     class Meta:
         model = Price
         fields = "__all__"
 
 
 class PriceCreateSerializer(serializers.ModelSerializer):
-    location_id = serializers.PrimaryKeyRelatedField(
+    location_id = IdentityMapPrimaryKeyRelatedField(
         queryset=Location.objects.all(), source="location", required=False
     )
-    proof_id = serializers.PrimaryKeyRelatedField(
+    proof_id = IdentityMapPrimaryKeyRelatedField(
         queryset=Proof.objects.all(), source="proof"
     )
 
@@ -53,6 +59,12 @@ class PriceCreateSerializer(serializers.ModelSerializer):
         self.fields["type"].required = False
 
 
+class PriceBulkCreateSerializer(PriceCreateSerializer):
+    # ids are checked in bulk (see Price.objects.bulk_create_validated)
+    location_id = serializers.IntegerField(required=False)
+    proof_id = serializers.IntegerField()
+
+
 class PriceUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Price
@@ -64,6 +76,10 @@ class PriceStatsSerializer(serializers.Serializer):
     price__min = serializers.DecimalField(max_digits=10, decimal_places=2)
     price__max = serializers.DecimalField(max_digits=10, decimal_places=2)
     price__avg = serializers.DecimalField(max_digits=10, decimal_places=2)
+    price__percentiles = serializers.DictField(
+        child=serializers.DecimalField(max_digits=10, decimal_places=2),
+        required=False,
+    )  # ?percentiles=
 
 
 class PriceHistorySerializer(history.HistorySerializer):
@@ -1,15 +1,19 @@
 from decimal import Decimal
+from unittest.mock import patch
 
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
+from open_prices.challenges.matcher import get_challenge_matcher
 from open_prices.locations import constants as location_constants
 from open_prices.locations.factories import LocationFactory
 from open_prices.locations.models import Location
 from open_prices.moderation.models import FlagReason, FlagStatus
 from open_prices.prices import constants as price_constants
 from open_prices.prices.factories import PriceFactory
-from open_prices.prices.models import Price
+from open_prices.prices.models import Price, PriceRollup
 from open_prices.products.factories import ProductFactory
 from open_prices.products.models import Product
 from open_prices.proofs import constants as proof_constants
@@ -82,10 +86,11 @@ class PriceListApiTest(TestCase):
 
     def test_price_list(self):
         # anonymous
-        # thanks to select_related, we only have 2 queries:
-        # - 1 to count the number of prices
+        # thanks to select_related, we only have 4 queries:
+        # - 2 to count the number of prices (planner estimate + exact count)
+        # - 1 for the conditional GET validators (last updated)
         # - 1 to get the prices and their associated proof/location/product
-        with self.assertNumQueries(1 + 1):
+        with self.assertNumQueries(2 + 1 + 1):
             response = self.client.get(self.url)
             self.assertEqual(response.data["total"], 3)
             self.assertEqual(len(response.data["items"]), 3)
@@ -93,6 +98,89 @@ class PriceListApiTest(TestCase):
             self.assertIn("proof", response.data["items"][0])
             self.assertIn("location", response.data["items"][0])
 
+    def test_price_list_sparse_fieldset(self):
+        url = self.url + "?fields=price,date,product_code"
+        with CaptureQueriesContext(connection) as captured_queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["total"], 3)
+        self.assertEqual(
+            set(response.data["items"][0].keys()), {"price", "product_code", "date"}
+        )
+        # no join, only the selected columns
+        price_query = captured_queries[-1]["sql"]
+        self.assertNotIn("JOIN", price_query)
+        self.assertNotIn('"prices"."currency"', price_query)
+        # expand
+        url = self.url + "?fields=price,location,location_id,proof&expand=location"
+        with CaptureQueriesContext(connection) as captured_queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        item = next(
+            item for item in response.data["items"] if item["location_id"] is not None
+        )
+        self.assertEqual(set(item.keys()), {"price", "location_id", "location"})
+        self.assertIn("osm_id", item["location"])
+        price_query = captured_queries[-1]["sql"]
+        self.assertIn('JOIN "locations"', price_query)
+        self.assertNotIn('JOIN "products"', price_query)
+        self.assertNotIn('JOIN "proofs"', price_query)
+        # expand only
+        response = self.client.get(self.url + "?expand=")
+        self.assertNotIn("product", response.data["items"][0])
+        self.assertIn("product_id", response.data["items"][0])
+        self.assertIn("currency", response.data["items"][0])
+        # invalid
+        for QUERY_PARAMS in ["?fields=unknown", "?expand=owner"]:
+            with self.subTest(QUERY_PARAMS=QUERY_PARAMS):
+                response = self.client.get(self.url + QUERY_PARAMS)
+                self.assertEqual(response.status_code, 400)
+
+    def test_price_list_conditional_get(self):
+        response = self.client.get(self.url)
+        self.assertIn("ETag", response)
+        self.assertIn("Last-Modified", response)
+        # unchanged: 304, without fetching the prices
+        with self.assertNumQueries(2 + 1):  # count & last updated
+            response_not_modified = self.client.get(
+                self.url, headers={"If-None-Match": response["ETag"]}
+            )
+        self.assertEqual(response_not_modified.status_code, 304)
+        self.assertEqual(response_not_modified["ETag"], response["ETag"])
+        # other query string
+        response_other = self.client.get(
+            self.url + "?size=1", headers={"If-None-Match": response["ETag"]}
+        )
+        self.assertEqual(response_other.status_code, 200)
+        # new price
+        price = PriceFactory()
+        response_modified = self.client.get(
+            self.url, headers={"If-None-Match": response["ETag"]}
+        )
+        self.assertEqual(response_modified.status_code, 200)
+        self.assertEqual(response_modified.data["total"], 4)
+        # nested object updated (response cache generation bumped on commit)
+        with self.captureOnCommitCallbacks(execute=True):
+            price.product.save()
+        response_nested_modified = self.client.get(
+            self.url, headers={"If-None-Match": response_modified["ETag"]}
+        )
+        self.assertEqual(response_nested_modified.status_code, 200)
+
+    def test_price_list_cursor_no_conditional_get(self):
+        # cursor pagination: COUNT(*)-free
+        response = self.client.get(self.url + "?cursor=")
+        self.assertNotIn("ETag", response)
+
+    def test_price_list_estimated_count_no_conditional_get(self):
+        # large results: an estimated count does not change on deletes
+        with patch(
+            "open_prices.common.constants.PAGINATION_COUNT_ESTIMATE_THRESHOLD", 1
+        ):
+            response = self.client.get(self.url)
+        self.assertTrue(response.data["total_is_estimate"])
+        self.assertNotIn("ETag", response)
+
 
 class PriceListPaginationApiTest(TestCase):
     @classmethod
@@ -304,10 +392,11 @@ class PriceListFilterApiTest(TestCase):
         self.assertEqual(response.data["total"], 3)
         # product__categories_tags__contains
         url = self.url + "?product__categories_tags__contains=en:breakfasts"
-        # thanks to select_related, we only have 2 queries:
-        # - 1 to count the number of prices
+        # thanks to select_related, we only have 4 queries:
+        # - 2 to count the number of prices (planner estimate + exact count)
+        # - 1 for the conditional GET validators (last updated)
         # - 1 to get the prices (even when filtering on product fields)
-        with self.assertNumQueries(1 + 1):
+        with self.assertNumQueries(2 + 1 + 1):
             response = self.client.get(url)
             self.assertEqual(response.data["total"], 1)
             self.assertIn("product", response.data["items"][0])
@@ -433,10 +522,11 @@ class PriceListFilterApiTest(TestCase):
         self.assertEqual(response.data["total"], 1 + 1)
         # proof__type
         url = self.url + f"?proof__type={proof_constants.TYPE_RECEIPT}"
-        # thanks to select_related, we only have 2 queries:
-        # - 1 to count the number of prices
+        # thanks to select_related, we only have 4 queries:
+        # - 2 to count the number of prices (planner estimate + exact count)
+        # - 1 for the conditional GET validators (last updated)
         # - 1 to get the prices (even when filtering on proof fields)
-        with self.assertNumQueries(1 + 1):
+        with self.assertNumQueries(2 + 1 + 1):
             response = self.client.get(url)
             self.assertEqual(response.data["total"], 1)
             self.assertIn("proof", response.data["items"][0])
@@ -532,6 +622,39 @@ class PriceDetailApiTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.data["id"], self.price.id)
 
+    def test_price_detail_sparse_fieldset(self):
+        response = self.client.get(self.url + "?fields=id,price,product&expand=product")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data.keys()), {"id", "product", "price"})
+        self.assertEqual(response.data["product"]["code"], "8001505005707")
+
+    def test_price_detail_conditional_get(self):
+        response = self.client.get(self.url)
+        self.assertIn("ETag", response)
+        self.assertIn("Last-Modified", response)
+        for HEADERS in [
+            {"If-None-Match": response["ETag"]},
+            {"If-Modified-Since": response["Last-Modified"]},
+        ]:
+            with self.subTest(HEADERS=HEADERS):
+                response_not_modified = self.client.get(self.url, headers=HEADERS)
+                self.assertEqual(response_not_modified.status_code, 304)
+                self.assertEqual(response_not_modified.content, b"")
+        # the nested product was updated
+        self.price.product.save()
+        response_modified = self.client.get(
+            self.url, headers={"If-None-Match": response["ETag"]}
+        )
+        self.assertEqual(response_modified.status_code, 200)
+        self.assertNotEqual(response_modified["ETag"], response["ETag"])
+        # partial save of the price (update_fields)
+        Price.objects.get(id=self.price.id).set_tag("challenge-1")
+        response_tagged = self.client.get(
+            self.url, headers={"If-None-Match": response_modified["ETag"]}
+        )
+        self.assertEqual(response_tagged.status_code, 200)
+        self.assertIn("challenge-1", response_tagged.data["tags"])
+
 
 class PriceCreateApiTest(TestCase):
     @classmethod
@@ -700,20 +823,44 @@ class PriceCreateApiTest(TestCase):
         self.assertIn("product_id", response.data)
         self.assertEqual(response.data["product"]["code"], "8001505005707")
         self.assertEqual(
-            response.data["product"]["price_count"], 0
-        )  # not yet incremented
+            response.data["product"]["price_count"], 1
+        )  # fetched after the price creation (only the id is resolved on save)
         self.assertEqual(Product.objects.get(code="8001505005707").price_count, 1)
         self.assertIn("location_id", response.data)
         self.assertEqual(response.data["location"]["osm_id"], 652825274)
         self.assertEqual(
-            response.data["location"]["price_count"], 0
-        )  # not yet incremented
+            response.data["location"]["price_count"], 1
+        )  # fetched after the price creation (only the id is resolved on save)
         self.assertEqual(
             Location.objects.get(osm_id=652825274, osm_type="NODE").price_count, 1
         )
         p = Price.objects.last()
         self.assertEqual(p.source, "API")  # default value
 
+    def test_price_create_related_objects_fetched_once(self):
+        data = {
+            **self.data,
+            "location_id": self.location_osm.id,
+            "proof_id": self.user_proof_gdpr.id,
+        }
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                self.url,
+                data,
+                headers={"Authorization": f"Bearer {self.user_session.token}"},
+            )
+        self.assertEqual(response.status_code, 201)
+        select_list = [
+            query["sql"] for query in queries if query["sql"].startswith("SELECT")
+        ]
+        # loaded once by the serializer, shared with the validators
+        # (previously: + FK existence check + validator)
+        self.assertEqual(len([sql for sql in select_list if 'FROM "proofs"' in sql]), 1)
+        # loaded once by the serializer + id resolution from the osm fields
+        self.assertEqual(
+            len([sql for sql in select_list if 'FROM "locations"' in sql]), 2
+        )
+
     def test_price_create_with_proof_not_owned(self):
         # not proof owner and proof is not a PRICE_TAG: NOK
         response = self.client.post(
@@ -817,6 +964,134 @@ class PriceCreateApiTest(TestCase):
         )
 
 
+class PriceBulkCreateApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.url = reverse("api:prices-bulk-create")
+        cls.user_session = SessionFactory()
+        cls.location_osm = LocationFactory(**LOCATION_OSM_NODE_652825274)
+        cls.proof = ProofFactory(
+            type=proof_constants.TYPE_RECEIPT,
+            currency="EUR",
+            location_osm_id=cls.location_osm.osm_id,
+            location_osm_type=cls.location_osm.osm_type,
+            date="2024-01-01",
+            owner=cls.user_session.user.user_id,
+        )
+        cls.data = [
+            {
+                **PRICE_8001505005707,
+                "location_osm_id": cls.location_osm.osm_id,
+                "location_osm_type": cls.location_osm.osm_type,
+                "proof_id": cls.proof.id,
+            },
+            {
+                **PRICE_APPLES,
+                "date": "2024-01-01",
+                "location_osm_id": cls.location_osm.osm_id,
+                "location_osm_type": cls.location_osm.osm_type,
+                "proof_id": cls.proof.id,
+            },
+        ]
+
+    def test_price_bulk_create_anonymous(self):
+        response = self.client.post(
+            self.url, self.data, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 403)
+
+    def test_price_bulk_create_wrong_format(self):
+        for data in [{}, [], PRICE_8001505005707]:
+            with self.subTest(data=data):
+                response = self.client.post(
+                    self.url,
+                    data,
+                    headers={"Authorization": f"Bearer {self.user_session.token}"},
+                    content_type="application/json",
+                )
+                self.assertEqual(response.status_code, 400)
+
+    def test_price_bulk_create_with_errors(self):
+        data = [
+            self.data[0],
+            {**self.data[1], "price": None},  # serializer error
+        ]
+        response = self.client.post(
+            self.url,
+            data,
+            headers={"Authorization": f"Bearer {self.user_session.token}"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(response.data), 2)
+        self.assertEqual(response.data[0], {})
+        self.assertIn("price", response.data[1])
+        data = [
+            self.data[0],
+            {**self.data[1], "proof_id": 999},  # model error
+            {**self.data[1], "currency": "USD"},  # model error
+        ]
+        response = self.client.post(
+            self.url,
+            data,
+            headers={"Authorization": f"Bearer {self.user_session.token}"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(response.data), 3)
+        self.assertEqual(response.data[0], {})
+        self.assertIn("proof", response.data[1])
+        self.assertIn("proof", response.data[2])
+        # nothing was created
+        self.assertEqual(Price.objects.count(), 0)
+
+    def test_price_bulk_create(self):
+        response = self.client.post(
+            self.url,
+            self.data,
+            headers={"Authorization": f"Bearer {self.user_session.token}"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data), 2)
+        self.assertEqual(Price.objects.count(), 2)
+        self.assertEqual(response.data[0]["type"], price_constants.TYPE_PRODUCT)
+        self.assertEqual(response.data[0]["product"]["code"], "8001505005707")
+        self.assertEqual(response.data[0]["location"]["id"], self.location_osm.id)
+        self.assertEqual(response.data[0]["proof"]["id"], self.proof.id)
+        self.assertEqual(response.data[1]["type"], price_constants.TYPE_CATEGORY)
+        self.assertEqual(response.data[1]["product"], None)
+        self.assertEqual(response.data[1]["location"]["id"], self.location_osm.id)
+        for price in Price.objects.all():
+            self.assertEqual(price.owner, self.user_session.user.user_id)
+            self.assertEqual(Price.history.filter(id=price.id).count(), 1)
+            self.assertEqual(
+                Price.history.filter(id=price.id).first().history_user_id,
+                self.user_session.user.user_id,
+            )
+        # counts
+        self.assertEqual(Product.objects.get(code="8001505005707").price_count, 1)
+        self.assertEqual(Proof.objects.get(id=self.proof.id).price_count, 2)
+        self.assertEqual(Location.objects.get(id=self.location_osm.id).price_count, 2)
+        self.user_session.user.refresh_from_db()
+        self.assertEqual(self.user_session.user.price_count, 2)
+
+    def test_price_bulk_create_num_queries(self):
+        # the number of queries does not depend on the number of prices
+        data = [{**self.data[0], "product_code": f"800150500570{i}"} for i in range(10)]
+        get_challenge_matcher().refresh_if_stale()  # per process, warm
+        with self.assertNumQueries(41):
+            response = self.client.post(
+                self.url,
+                data,
+                headers={"Authorization": f"Bearer {self.user_session.token}"},
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Price.objects.count(), 10)
+        self.assertEqual(Product.objects.count(), 10)
+
+
 class PriceUpdateApiTest(TestCase):
     @classmethod
     def setUpTestData(cls):
@@ -1114,6 +1389,37 @@ class PriceStatsApiTest(TestCase):
         self.assertEqual(response.data["price__count"], 2)
         self.assertEqual(response.data["price__avg"], Decimal(27.5))
 
+    def test_price_stats_rollups(self):
+        url = self.url + f"?product_code={self.product.code}"
+        response = self.client.get(url)
+        self.assertEqual(response.data["price__count"], 3)
+        # rollup filters (see PRICE_ROLLUP_FILTER_LOOKUP_DICT): served from the
+        # rollups, else calculated on the prices
+        PriceRollup.objects.all().delete()
+        response = self.client.get(url)
+        self.assertEqual(response.data["price__count"], 0)
+        response = self.client.get(url + "&price__gte=0")
+        self.assertEqual(response.data["price__count"], 3)
+        self.assertEqual(response.data["price__avg"], Decimal("23.33"))
+        # invalid filter: same error as the live path
+        response = self.client.get(self.url + "?location_id=abc")
+        self.assertEqual(response.status_code, 400)
+
+    def test_price_stats_percentiles(self):
+        response = self.client.get(self.url + "?percentiles=50,100")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.data["price__percentiles"]), ["50", "100"])
+        self.assertAlmostEqual(
+            response.data["price__percentiles"]["100"], 30, delta=Decimal("0.3")
+        )
+        # live
+        response = self.client.get(self.url + "?percentiles=50&price__gte=0")
+        self.assertEqual(response.data["price__percentiles"], {"50": Decimal("20")})
+        # invalid
+        for percentiles in ["abc", "150"]:
+            response = self.client.get(self.url + f"?percentiles={percentiles}")
+            self.assertEqual(response.status_code, 400)
+
 
 class PriceHistoryApiTest(TestCase):
     @classmethod
@@ -1,28 +1,62 @@
+from django_filters.constants import EMPTY_VALUES
 from django_filters.rest_framework import DjangoFilterBackend
-from drf_spectacular.utils import extend_schema
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiParameter, extend_schema, extend_schema_view
 from rest_framework import filters, mixins, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ParseError
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
 from rest_framework.request import Request
 from rest_framework.response import Response
 
 from open_prices.api.moderation.serializers import FlagCreateSerializer, FlagSerializer
+from open_prices.api.pagination import CustomCursorPagination
 from open_prices.api.prices.filters import PriceFilter
 from open_prices.api.prices.serializers import (
+    PriceBulkCreateSerializer,
     PriceCreateSerializer,
     PriceFullSerializer,
     PriceHistorySerializer,
     PriceStatsSerializer,
     PriceUpdateSerializer,
 )
-from open_prices.api.utils import get_source_from_request
+from open_prices.api.utils import (
+    SPARSE_FIELDSET_PARAMETER_LIST,
+    CompiledListMixin,
+    ConditionalGetMixin,
+    SparseFieldsetMixin,
+    get_source_from_request,
+)
 from open_prices.common.authentication import CustomAuthentication
 from open_prices.common.permission import OnlyObjectOwnerOrModeratorIsAllowedWrite
 from open_prices.prices import constants as price_constants
-from open_prices.prices.models import Price
+from open_prices.prices.models import Price, PriceRollup
+
+
+def get_price_type(price_data: dict) -> str:
+    return price_data.get("type") or (
+        price_constants.TYPE_PRODUCT
+        if price_data.get("product_code")
+        else price_constants.TYPE_CATEGORY
+    )
+
+
+PRICE_STATS_PERCENTILES_PARAMETER = OpenApiParameter(
+    name="percentiles",
+    type=OpenApiTypes.STR,
+    description="Comma-separated list of percentiles (0-100) to return in price__percentiles (e.g. 50,90). Estimated (1% relative error) when the filters allow the stats to be served from the rollups.",  # noqa
+    required=False,
+)
 
 
+@extend_schema_view(
+    list=extend_schema(parameters=SPARSE_FIELDSET_PARAMETER_LIST),
+    retrieve=extend_schema(parameters=SPARSE_FIELDSET_PARAMETER_LIST),
+)
 class PriceViewSet(
+    ConditionalGetMixin,
+    SparseFieldsetMixin,
+    CompiledListMixin,
     mixins.ListModelMixin,
     mixins.RetrieveModelMixin,
     mixins.CreateModelMixin,
@@ -42,6 +76,7 @@ class PriceViewSet(
     filterset_class = PriceFilter
     ordering_fields = ["id", "price", "date", "created"]
     ordering = ["id"]
+    pagination_class = CustomCursorPagination  # opt-in with ?cursor=
 
     def get_authenticators(self):
         if self.request and self.request.method in ["GET"]:
@@ -51,7 +86,10 @@ class PriceViewSet(
     def get_queryset(self):
         queryset = self.queryset
         if self.request.method in ["GET"]:
-            queryset = self.queryset.select_related("product", "location", "proof")
+            if self.is_sparse_fieldset_request():
+                queryset = self.trim_queryset(queryset)
+            else:
+                queryset = self.queryset.select_related("product", "location", "proof")
         return queryset
 
     def get_serializer_class(self):
@@ -66,11 +104,7 @@ class PriceViewSet(
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         # get type
-        type = serializer.validated_data.get("type") or (
-            price_constants.TYPE_PRODUCT
-            if serializer.validated_data.get("product_code")
-            else price_constants.TYPE_CATEGORY
-        )
+        type = get_price_type(serializer.validated_data)
         # get owner
         owner = self.request.user.user_id
         # get source
@@ -82,11 +116,99 @@ class PriceViewSet(
             self.serializer_class(price).data, status=status.HTTP_201_CREATED
         )
 
-    @extend_schema(responses=PriceStatsSerializer, filters=True)
+    @extend_schema(
+        request=PriceBulkCreateSerializer(many=True),
+        responses=PriceFullSerializer(many=True),
+    )
+    @action(detail=False, methods=["POST"], url_path="bulk")
+    def bulk_create(self, request: Request) -> Response:
+        # validate
+        serializer = PriceBulkCreateSerializer(
+            data=request.data,
+            many=True,
+            allow_empty=False,
+            max_length=price_constants.PRICE_BULK_CREATE_MAX_SIZE,
+        )
+        serializer.is_valid(raise_exception=True)
+        # get owner
+        owner = self.request.user.user_id
+        # get source
+        source = get_source_from_request(self.request)
+        # validate (model rules) & save
+        price_list, error_list = Price.objects.bulk_create_validated(
+            [
+                Price(
+                    **{
+                        **price_data,
+                        "type": get_price_type(price_data),
+                        "owner": owner,
+                        "source": source,
+                    }
+                )
+                for price_data in serializer.validated_data
+            ]
+        )
+        if any(error_list):
+            return Response(error_list, status=status.HTTP_400_BAD_REQUEST)
+        # return full prices
+        return Response(
+            self.serializer_class(price_list, many=True).data,
+            status=status.HTTP_201_CREATED,
+        )
+
+    def get_percentile_list(self) -> list[float] | None:
+        value = self.request.query_params.get("percentiles")
+        if not value:
+            return None
+        try:
+            percentile_list = [float(item) for item in value.split(",") if item]
+        except ValueError:
+            raise ParseError("Invalid percentiles.") from None
+        if not all(0 <= percentile <= 100 for percentile in percentile_list):
+            raise ParseError("Invalid percentiles (must be between 0 and 100).")
+        return percentile_list
+
+    def get_rollup_filter_dict(self) -> dict | None:
+        """
+        Rollup filters (see PriceRollup) matching the request filters.
+        None if a filter is not a rollup dimension (or is invalid)
+        """
+        filterset = self.filterset_class(
+            self.request.query_params,
+            queryset=self.get_queryset(),
+            request=self.request,
+        )
+        if not filterset.is_valid():
+            return None  # the live path returns the errors
+        rollup_filter_dict = dict()
+        for filter_name, value in filterset.form.cleaned_data.items():
+            if value in EMPTY_VALUES:
+                continue
+            if filter_name not in price_constants.PRICE_ROLLUP_FILTER_LOOKUP_DICT:
+                return None
+            rollup_filter_dict[
+                price_constants.PRICE_ROLLUP_FILTER_LOOKUP_DICT[filter_name]
+            ] = value
+        return rollup_filter_dict
+
+    @extend_schema(
+        responses=PriceStatsSerializer,
+        filters=True,
+        parameters=[PRICE_STATS_PERCENTILES_PARAMETER],
+    )
     @action(detail=False, methods=["GET"])
     def stats(self, request: Request) -> Response:
-        qs = self.filter_queryset(self.get_queryset())
-        return Response(qs.calculate_stats(), status=200)
+        """
+        Served from the price rollups when all the filters are rollup
+        dimensions, else calculated on the filtered prices
+        """
+        percentile_list = self.get_percentile_list()
+        rollup_filter_dict = self.get_rollup_filter_dict()
+        if rollup_filter_dict is not None:
+            qs = PriceRollup.objects.filter(**rollup_filter_dict)
+        else:
+            qs = self.filter_queryset(self.get_queryset())
+        return Response(qs.calculate_stats(percentile_list), status=200)
 
     @extend_schema(responses=PriceHistorySerializer(many=True))
     @action(detail=True, methods=["GET"])
@@ -1,5 +1,8 @@
 from rest_framework import serializers
 
+from open_prices.common import constants
+from open_prices.prices.models import Price
+from open_prices.products import constants as product_constants
 from open_prices.products.models import Product
 
 
@@ -7,3 +10,66 @@ class ProductFullSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = "__all__"
+
+
+class ProductPriceHistoryParamsSerializer(serializers.Serializer):
+    bucket = serializers.ChoiceField(choices=["week", "month"], default="month")
+    currency = serializers.ChoiceField(
+        choices=constants.CURRENCY_CHOICES, required=False
+    )
+    country = serializers.CharField(min_length=2, max_length=2, required=False)
+
+
+class ProductPriceHistorySerializer(serializers.Serializer):
+    bucket_start = serializers.DateField()
+    currency = serializers.CharField()
+    price__count = serializers.IntegerField()
+    price__min = serializers.DecimalField(max_digits=10, decimal_places=2)
+    price__median = serializers.DecimalField(max_digits=10, decimal_places=2)
+    price__max = serializers.DecimalField(max_digits=10, decimal_places=2)
+
+
+class ProductLookupSerializer(serializers.Serializer):
+    codes = serializers.ListField(
+        child=serializers.RegexField(r"^\d+$", max_length=100),
+        min_length=1,
+        max_length=product_constants.PRODUCT_LOOKUP_MAX_SIZE,
+    )
+    location_id = serializers.IntegerField(required=False)
+    lat = serializers.FloatField(min_value=-90, max_value=90, required=False)
+    lon = serializers.FloatField(min_value=-180, max_value=180, required=False)
+    radius_km = serializers.FloatField(
+        min_value=0,
+        default=product_constants.PRODUCT_LOOKUP_RADIUS_KM_DEFAULT,
+    )
+
+    def validate(self, data):
+        if ("lat" in data) != ("lon" in data):
+            raise serializers.ValidationError("lat and lon must be set together")
+        if "location_id" in data and "lat" in data:
+            raise serializers.ValidationError(
+                "location_id and lat/lon cannot be set together"
+            )
+        return data
+
+
+class ProductLookupPriceSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Price
+        fields = [
+            "id",
+            "price",
+            "price_is_discounted",
+            "price_without_discount",
+            "price_per",
+            "currency",
+            "date",
+            "location",
+            "proof",
+        ]
+
+
+class ProductLookupResultSerializer(serializers.Serializer):
+    code = serializers.CharField()
+    product = ProductFullSerializer(allow_null=True)
+    latest_price = ProductLookupPriceSerializer(allow_null=True)
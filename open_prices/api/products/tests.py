@@ -1,6 +1,11 @@
+import datetime
+from decimal import Decimal
+
 from django.test import TestCase
 from django.urls import reverse
 
+from open_prices.locations.factories import LocationFactory
+from open_prices.prices.factories import PriceFactory
 from open_prices.products.factories import ProductFactory
 from open_prices.users.factories import SessionFactory
 
@@ -187,6 +192,171 @@ class ProductDetailApiTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.data["code"], "0123456789100")
 
+    def test_product_detail_by_code_conditional_get(self):
+        url = reverse("api:products-get-by-code", args=[self.product.code])
+        response = self.client.get(url)
+        with self.assertNumQueries(1 + 1):  # product & pending counter deltas
+            response_not_modified = self.client.get(
+                url, headers={"If-None-Match": response["ETag"]}
+            )
+        self.assertEqual(response_not_modified.status_code, 304)
+        self.product.save()
+        response_modified = self.client.get(
+            url, headers={"If-None-Match": response["ETag"]}
+        )
+        self.assertEqual(response_modified.status_code, 200)
+
+
+class ProductPriceHistoryApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = ProductFactory(**PRODUCT_8001505005707)
+        cls.url = reverse("api:products-price-history", args=[cls.product.id])
+        location_fr = LocationFactory(osm_address_country_code="FR")
+        location_ch = LocationFactory(osm_address_country_code="CH")
+        for location, currency, date, price in [
+            (location_fr, "EUR", "2024-01-05", Decimal("2")),
+            (location_fr, "EUR", "2024-01-20", Decimal("3")),
+            (location_ch, "CHF", "2024-01-10", Decimal("4")),
+            (location_fr, "EUR", "2024-02-14", Decimal("2.5")),
+        ]:
+            PriceFactory(
+                product_code=cls.product.code,
+                location_osm_id=location.osm_id,
+                location_osm_type=location.osm_type,
+                currency=currency,
+                date=date,
+                price=price,
+            )
+
+    def test_product_price_history_unknown(self):
+        url = reverse("api:products-price-history", args=[999])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 404)
+
+    def test_product_price_history(self):
+        # 1 for the product, 1 for the buckets
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [
+                (history["bucket_start"], history["currency"])
+                for history in response.data
+            ],
+            [
+                (datetime.date(2024, 1, 1), "CHF"),
+                (datetime.date(2024, 1, 1), "EUR"),
+                (datetime.date(2024, 2, 1), "EUR"),
+            ],
+        )
+        self.assertEqual(response.data[1]["price__count"], 2)
+        self.assertEqual(response.data[1]["price__min"], Decimal("2"))
+        self.assertEqual(response.data[1]["price__max"], Decimal("3"))
+        # week
+        response = self.client.get(self.url, {"bucket": "week"})
+        self.assertEqual(len(response.data), 4)
+        self.assertEqual(response.data[0]["bucket_start"], datetime.date(2024, 1, 1))
+
+    def test_product_price_history_filters(self):
+        response = self.client.get(self.url, {"currency": "EUR"})
+        self.assertEqual(len(response.data), 2)
+        response = self.client.get(self.url, {"country": "ch"})
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data[0]["currency"], "CHF")
+        # estimated (sketch relative error)
+        self.assertAlmostEqual(
+            response.data[0]["price__median"], Decimal("4"), delta=Decimal("0.04")
+        )
+
+    def test_product_price_history_invalid_params(self):
+        for params in [{"bucket": "day"}, {"currency": "ABC"}, {"country": "FRA"}]:
+            with self.subTest(params=params):
+                response = self.client.get(self.url, params)
+                self.assertEqual(response.status_code, 400)
+
+
+class ProductLookupApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.url = reverse("api:products-lookup")
+        cls.product = ProductFactory(**PRODUCT_8001505005707)
+        cls.product_2 = ProductFactory(code="0123456789100")
+        cls.location = LocationFactory(osm_lat=45.1, osm_lon=5.7)
+        cls.location_nearby = LocationFactory(osm_lat=45.11, osm_lon=5.71)
+        cls.location_far = LocationFactory(osm_lat=48.8, osm_lon=2.3)
+        for product, location, date, price in [
+            (cls.product, cls.location, "2024-01-05", Decimal("2")),
+            (cls.product, cls.location, "2024-02-05", Decimal("2.5")),
+            (cls.product, cls.location_far, "2024-03-05", Decimal("3")),
+            (cls.product_2, cls.location_nearby, "2024-01-10", Decimal("1")),
+            (cls.product_2, cls.location_nearby, None, Decimal("9")),  # undated
+        ]:
+            PriceFactory(
+                product_code=product.code,
+                location_osm_id=location.osm_id,
+                location_osm_type=location.osm_type,
+                date=date,
+                price=price,
+            )
+
+    def post(self, data):
+        return self.client.post(self.url, data, content_type="application/json")
+
+    def test_product_lookup(self):
+        # anonymous, 1 query for the products, 1 for the prices
+        with self.assertNumQueries(2):
+            response = self.post(
+                {"codes": ["8001505005707", "123456789100", "999", "8001505005707"]}
+            )
+        self.assertEqual(response.status_code, 200)
+        # normalized, deduplicated, in the order of the request
+        self.assertEqual(
+            [result["code"] for result in response.data],
+            ["8001505005707", "0123456789100", "00000999"],
+        )
+        self.assertEqual(response.data[0]["product"]["id"], self.product.id)
+        self.assertEqual(response.data[0]["latest_price"]["price"], 3)
+        self.assertEqual(response.data[1]["latest_price"]["price"], 1)
+        self.assertIsNone(response.data[2]["product"])
+        self.assertIsNone(response.data[2]["latest_price"])
+
+    def test_product_lookup_location(self):
+        response = self.post(
+            {
+                "codes": ["8001505005707", "0123456789100"],
+                "location_id": self.location.id,
+            }
+        )
+        self.assertEqual(response.data[0]["latest_price"]["price"], 2.5)
+        self.assertEqual(response.data[0]["latest_price"]["location"], self.location.id)
+        self.assertIsNone(response.data[1]["latest_price"])
+        # nearby
+        with self.assertNumQueries(2):
+            response = self.post(
+                {
+                    "codes": ["8001505005707", "0123456789100"],
+                    "lat": 45.1,
+                    "lon": 5.7,
+                    "radius_km": 5,
+                }
+            )
+        self.assertEqual(response.data[0]["latest_price"]["price"], 2.5)
+        self.assertEqual(response.data[1]["latest_price"]["price"], 1)
+
+    def test_product_lookup_invalid(self):
+        for data in [
+            {},
+            {"codes": []},
+            {"codes": ["abc"]},
+            {"codes": ["1"] * 501},
+            {"codes": ["1"], "lat": 45.1},
+            {"codes": ["1"], "lat": 45.1, "lon": 5.7, "location_id": 1},
+        ]:
+            with self.subTest(data=data):
+                response = self.post(data)
+                self.assertEqual(response.status_code, 400)
+
 
 class ProductCreateApiTest(TestCase):
     @classmethod
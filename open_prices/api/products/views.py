@@ -1,4 +1,6 @@
 from django_filters.rest_framework import DjangoFilterBackend
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiParameter, extend_schema
 from openfoodfacts import Flavor
 from openfoodfacts.barcode import normalize_barcode
 from rest_framework import filters, mixins, viewsets
@@ -7,19 +9,36 @@ from rest_framework.permissions import IsAuthenticatedOrReadOnly
 from rest_framework.request import Request
 from rest_framework.response import Response
 
+from open_prices.api.pagination import CustomCursorPagination
 from open_prices.api.products.filters import ProductFilter
-from open_prices.api.products.serializers import ProductFullSerializer
-from open_prices.api.utils import get_object_or_drf_404
+from open_prices.api.products.serializers import (
+    ProductFullSerializer,
+    ProductLookupResultSerializer,
+    ProductLookupSerializer,
+    ProductPriceHistoryParamsSerializer,
+    ProductPriceHistorySerializer,
+)
+from open_prices.api.utils import (
+    CompiledListMixin,
+    ConditionalGetMixin,
+    get_object_or_drf_404,
+)
 from open_prices.common.authentication import CustomAuthentication
 from open_prices.common.openfoodfacts import (
     create_or_update_product_in_off,
     upload_product_image_in_off,
 )
+from open_prices.locations.models import Location
+from open_prices.prices.models import Price, PriceHistoryBucket
 from open_prices.products.models import Product
 
 
 class ProductViewSet(
-    mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet
+    ConditionalGetMixin,
+    CompiledListMixin,
+    mixins.ListModelMixin,
+    mixins.RetrieveModelMixin,
+    viewsets.GenericViewSet,
 ):
     authentication_classes = []  # see get_authenticators
     permission_classes = [IsAuthenticatedOrReadOnly]
@@ -31,6 +50,8 @@ class ProductViewSet(
         Product.OFF_SCORE_FIELDS + Product.COUNT_FIELDS + ["id", "created"]
     )
     ordering = ["id"]
+    pagination_class = CustomCursorPagination  # opt-in with ?cursor=
+    apply_pending_counter_deltas = True  # price_count
 
     def get_authenticators(self):
         if self.request and self.request.method in ["GET"]:
@@ -41,8 +62,114 @@ class ProductViewSet(
     def get_by_code(self, request: Request, code):
         code = normalize_barcode(code)
         product = get_object_or_drf_404(Product, code=code)
-        serializer = self.get_serializer(product)
-        return Response(serializer.data)
+        return self.get_object_response(product)
+
+    @extend_schema(
+        request=ProductLookupSerializer,
+        responses=ProductLookupResultSerializer(many=True),
+    )
+    @action(
+        detail=False,
+        methods=["POST"],
+        url_path="lookup",
+        permission_classes=[],  # read-only: allow anonymous lookups
+    )
+    def lookup(self, request: Request) -> Response:
+        """
+        Products & their latest price (at the location, or nearby) of a list
+        of barcodes, in the order of the request (e.g. a shelf scan).
+        2 queries, whatever the number of barcodes.
+        """
+        serializer = ProductLookupSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        validated_data = serializer.validated_data
+        code_list = list(dict.fromkeys(map(normalize_barcode, validated_data["codes"])))
+        product_dict = {
+            product.code: product
+            for product in Product.objects.filter(code__in=code_list)
+        }
+        price_queryset = Price.objects.all()
+        if "location_id" in validated_data:
+            price_queryset = price_queryset.filter(
+                location_id=validated_data["location_id"]
+            )
+        elif "lat" in validated_data:
+            price_queryset = price_queryset.filter(
+                location_id__in=Location.objects.nearby(
+                    validated_data["lat"],
+                    validated_data["lon"],
+                    validated_data["radius_km"],
+                ).values("id")
+            )
+        latest_price_dict = dict()
+        if product_dict:
+            latest_price_dict = {
+                price.product_id: price
+                for price in price_queryset.latest_per_product(
+                    [product.id for product in product_dict.values()]
+                )
+            }
+        result_list = [
+            {
+                "code": code,
+                "product": product_dict.get(code),
+                "latest_price": (
+                    latest_price_dict.get(product_dict[code].id)
+                    if code in product_dict
+                    else None
+                ),
+            }
+            for code in code_list
+        ]
+        return Response(
+            ProductLookupResultSerializer(result_list, many=True).data, status=200
+        )
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="bucket",
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                enum=["week", "month"],
+                default="month",
+                required=False,
+            ),
+            OpenApiParameter(
+                name="currency",
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                required=False,
+            ),
+            OpenApiParameter(
+                name="country",
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                required=False,
+                description="Country code of the price locations (e.g. FR)",
+            ),
+        ],
+        responses=ProductPriceHistorySerializer(many=True),
+        filters=False,
+    )
+    @action(detail=True, methods=["GET"], url_path="price-history")
+    def price_history(self, request: Request, pk=None) -> Response:
+        """
+        Price count, min, median (estimated) & max of the product, per week
+        or month & currency (served from the price history buckets)
+        """
+        params_serializer = ProductPriceHistoryParamsSerializer(
+            data=request.query_params
+        )
+        params_serializer.is_valid(raise_exception=True)
+        product = self.get_object()
+        history_list = PriceHistoryBucket.objects.get_history(
+            product.id,
+            bucket=params_serializer.validated_data["bucket"].upper(),
+            currency=params_serializer.validated_data.get("currency"),
+            country_code=params_serializer.validated_data.get("country", "").upper(),
+        )
+        return Response(history_list, status=200)
 
     @action(
         detail=False,
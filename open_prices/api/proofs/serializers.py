@@ -1,9 +1,11 @@
 from rest_framework import serializers
 
 from open_prices.api.locations.serializers import LocationSerializer
+from open_prices.api.serializers import IdentityMapPrimaryKeyRelatedField
 from open_prices.common import history
 from open_prices.locations.models import Location
 from open_prices.prices.models import Price
+from open_prices.proofs import constants as proof_constants
 from open_prices.proofs.models import (
     PriceTag,
     PriceTagPrediction,
@@ -57,7 +59,7 @@ class ProofFullSerializer(ProofSerializer):
 
 class ProofUploadSerializer(serializers.ModelSerializer):
     file = serializers.FileField(required=True, use_url=False)
-    location_id = serializers.PrimaryKeyRelatedField(
+    location_id = IdentityMapPrimaryKeyRelatedField(
         queryset=Location.objects.all(), source="location", required=False
     )
 
@@ -103,7 +105,7 @@ class DraftProofAnonymizeRequestSerializer(serializers.Serializer):
 
 
 class ProofCreateSerializer(serializers.ModelSerializer):
-    location_id = serializers.PrimaryKeyRelatedField(
+    location_id = IdentityMapPrimaryKeyRelatedField(
         queryset=Location.objects.all(), source="location", required=False
     )
 
@@ -146,18 +148,24 @@ class PriceTagFullSerializer(serializers.ModelSerializer):
     price_id = serializers.PrimaryKeyRelatedField(read_only=True)
     predictions = PriceTagPredictionSerializer(many=True, read_only=True)
     proof = ProofHalfFullSerializer()
-    image_path = serializers.CharField(read_only=True)  # from model property
+    image_path = serializers.SerializerMethodField()  # from model property
 
     class Meta:
         model = PriceTag
         exclude = ["price"]
 
+    def get_image_path(self, obj) -> str | None:
+        # the crop is not generated yet
+        if obj.image_status == proof_constants.IMAGE_DERIVATIVES_STATUS_PENDING:
+            return None
+        return obj.image_path
+
 
 class PriceTagCreateSerializer(serializers.ModelSerializer):
-    proof_id = serializers.PrimaryKeyRelatedField(
+    proof_id = IdentityMapPrimaryKeyRelatedField(
         queryset=Proof.objects.all(), source="proof"
     )
-    price_id = serializers.PrimaryKeyRelatedField(
+    price_id = IdentityMapPrimaryKeyRelatedField(
         queryset=Price.objects.all(), source="price", required=False
     )
 
@@ -167,7 +175,7 @@ class PriceTagCreateSerializer(serializers.ModelSerializer):
 
 
 class PriceTagUpdateSerializer(serializers.ModelSerializer):
-    price_id = serializers.PrimaryKeyRelatedField(
+    price_id = IdentityMapPrimaryKeyRelatedField(
         queryset=Price.objects.all(), source="price"
     )
 
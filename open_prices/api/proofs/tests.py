@@ -1,6 +1,7 @@
 import os
 import shutil
 import tempfile
+import unittest
 from decimal import Decimal
 from io import BytesIO
 from pathlib import Path
@@ -8,8 +9,9 @@ from pathlib import Path
 import cv2
 import numpy as np
 from django.conf import settings
+from django.db import connection
 from django.test import TestCase
-from django.test.utils import override_settings
+from django.test.utils import CaptureQueriesContext, override_settings
 from django.urls import reverse
 from PIL import Image
 
@@ -106,10 +108,11 @@ class ProofListApiTest(TestCase):
 
     def test_proof_list(self):
         # anonymous
-        # thanks to select_related, we only have 2 queries:
-        # - 1 to count the number of proofs of the user
+        # thanks to select_related, we only have 4 queries:
+        # - 2 to count the number of proofs of the user (planner estimate + exact count)
+        # - 1 for the conditional GET validators (last updated)
         # - 1 to get the proofs and their associated location
-        with self.assertNumQueries(2):
+        with self.assertNumQueries(4):
             response = self.client.get(self.url)
             self.assertEqual(response.status_code, 200)
             # Only 3 proofs, excluding the draft proof
@@ -212,7 +215,8 @@ class ProofListFilterApiTest(TestCase):
         )
         self.assertEqual(response.status_code, 200)
         self.assertEqual(
-            list(response.data.keys()), ["items", "page", "pages", "size", "total"]
+            list(response.data.keys()),
+            ["items", "page", "pages", "size", "total", "total_is_estimate"],
         )
         self.assertEqual(len(response.data["items"]), 1)
         self.assertEqual(response.data["items"][0]["id"], self.proof.id)
@@ -223,7 +227,15 @@ class ProofListFilterApiTest(TestCase):
         )
         self.assertEqual(response.status_code, 200)
         self.assertEqual(
-            response.data, {"items": [], "page": 1, "pages": 1, "size": 10, "total": 0}
+            response.data,
+            {
+                "items": [],
+                "page": 1,
+                "pages": 1,
+                "size": 10,
+                "total": 0,
+                "total_is_estimate": False,
+            },
         )
 
     def test_proof_list_filter_by_location(self):
@@ -397,6 +409,34 @@ class ProofUploadApiTest(TestCase):
         )
         self.assertEqual(response.status_code, 400)
 
+    def test_proof_create_related_objects_fetched_once(self):
+        location = LocationFactory(**LOCATION_OSM_NODE_652825274)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                self.url,
+                {
+                    **self.data,
+                    "file": create_fake_image(color="purple"),
+                    "location_id": location.id,
+                },
+                headers={"Authorization": f"Bearer {self.user_session.token}"},
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["location"]["id"], location.id)
+        # loaded once by the serializer + id resolution from the osm fields
+        # (previously: + FK existence check + validator)
+        self.assertEqual(
+            len(
+                [
+                    query
+                    for query in queries
+                    if query["sql"].startswith("SELECT")
+                    and 'FROM "locations"' in query["sql"]
+                ]
+            ),
+            2,
+        )
+
     def test_proof_create_without_fields(self):
         # without file: NOK
         data = self.data.copy()
@@ -558,14 +598,23 @@ class ProofUploadApiTest(TestCase):
         # This image is a duplicate (same MD5 hash, same owner, same type,
         # same date, same location)
         # We should get a HTTP 200 with the existing proof
-        response = self.client.post(
-            self.url,
-            data_2,
-            headers={"Authorization": f"Bearer {self.user_session.token}"},
-        )
+        image_file_count = len(list(settings.IMAGES_DIR.glob("*/*")))
+        with unittest.mock.patch(
+            "open_prices.api.proofs.views.store_temp_file"
+        ) as mock_store_temp_file:
+            response = self.client.post(
+                self.url,
+                data_2,
+                headers={"Authorization": f"Bearer {self.user_session.token}"},
+            )
+            # no image work
+            mock_store_temp_file.assert_not_called()
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.data["id"], proof_id)
         self.assertEqual(response.data.get("detail"), "duplicate")
+        # the image is not stored, the temporary file is removed
+        self.assertEqual(len(list(settings.IMAGES_DIR.glob("*/*"))), image_file_count)
+        self.assertEqual(list(settings.IMAGES_DIR.glob(".upload-*")), [])
 
         # Different date => create a new proof
         response = self.client.post(
@@ -1234,11 +1283,11 @@ class PriceTagListApiTest(TestCase):
 
     def test_price_tag_list(self):
         # Check that we can access price tags anonymously
-        # We only have 3 queries:
-        # - 1 to count the number of price tags
+        # We only have 4 queries:
+        # - 2 to count the number of price tags (planner estimate + exact count)
         # - 1 to get the price tags and their associated proof
         # - 1 to get the price tag predictions (prefetch related)
-        with self.assertNumQueries(3):
+        with self.assertNumQueries(4):
             response = self.client.get(self.url)
             self.assertEqual(response.status_code, 200)
 
@@ -1333,6 +1382,12 @@ class PriceTagDetailApiTest(TestCase):
         self.assertNotIn("price", response.data)  # not returned in "detail"
         self.assertEqual(response.data["price_id"], self.price.id)
         self.assertIn("image_path", response.data)  # but will return a 404
+        # crop not generated yet
+        PriceTag.objects.filter(id=self.price_tag_2.id).update(
+            image_status=proof_constants.IMAGE_DERIVATIVES_STATUS_PENDING
+        )
+        response = self.client.get(self.url)
+        self.assertIsNone(response.data["image_path"])
 
 
 class PriceTagCreateApiTest(TestCase):
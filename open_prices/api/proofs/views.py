@@ -16,6 +16,7 @@ from rest_framework.request import Request
 from rest_framework.response import Response
 
 from open_prices.api.moderation.serializers import FlagCreateSerializer, FlagSerializer
+from open_prices.api.pagination import CustomCursorPagination
 from open_prices.api.proofs.filters import (
     PriceTagFilter,
     ProofFilter,
@@ -36,7 +37,11 @@ from open_prices.api.proofs.serializers import (
     ProofUploadSerializer,
     ReceiptItemFullSerializer,
 )
-from open_prices.api.utils import get_source_from_request
+from open_prices.api.utils import (
+    CompiledListMixin,
+    ConditionalGetMixin,
+    get_source_from_request,
+)
 from open_prices.common import openfoodfacts as common_openfoodfacts
 from open_prices.common.authentication import (
     CustomAuthentication,
@@ -51,27 +56,40 @@ from open_prices.proofs.constants import TYPE_RECEIPT
 from open_prices.proofs.ml.price_tags import extract_from_price_tag
 from open_prices.proofs.models import PriceTag, Proof, ReceiptItem
 from open_prices.proofs.utils import (
-    compute_file_md5,
     save_anonymized_receipt,
-    store_file,
+    store_temp_file,
+    stream_file_to_temp,
 )
 
 
 def base_upload(request: Request, draft: bool = False) -> Response:
-    # build proof
     file = request.data.get("file")
     if not file:
         return Response(
             {"file": ["This field is required."]},
             status=status.HTTP_400_BAD_REQUEST,
         )
-    # NOTE: image will be stored even if the proof serializer fails...
-    file_path, mimetype, image_thumb_path = store_file(file)
-    image_md5_hash = compute_file_md5(file)
+    # stream the upload to a temporary file (hashed on the way): the image is
+    # only stored (& thumbnailed) once the proof is validated & not a duplicate
+    temp_file_path, image_md5_hash = stream_file_to_temp(file)
+    try:
+        return create_proof_from_temp_file(
+            request, file, temp_file_path, image_md5_hash, draft=draft
+        )
+    finally:
+        # no-op if the file was moved to the images directory
+        temp_file_path.unlink(missing_ok=True)
+
+
+def create_proof_from_temp_file(
+    request: Request,
+    file,
+    temp_file_path: Path,
+    image_md5_hash: str,
+    draft: bool = False,
+) -> Response:
+    # build proof
     proof_create_data = {
-        "file_path": file_path,
-        "mimetype": mimetype,
-        "image_thumb_path": image_thumb_path,
         "draft": draft,
         **{
             key: request.data.get(key)
@@ -111,6 +129,7 @@ def base_upload(request: Request, draft: bool = False) -> Response:
     # We check if a proof with the same MD5 hash already exists,
     # uploaded by the same user, with the same type, location and date.
     # If yes, we return it instead of creating a new one
+    # (the uploaded file is not stored)
     duplicate_proof = Proof.objects.filter(
         image_md5_hash=image_md5_hash,
         owner=owner,
@@ -121,8 +140,6 @@ def base_upload(request: Request, draft: bool = False) -> Response:
         date=serializer.validated_data.get("date"),
     ).first()
     if duplicate_proof:
-        # We remove the uploaded file as it's a duplicate
-        (settings.IMAGES_DIR / file_path).unlink(missing_ok=True)
         response_status_code = status.HTTP_200_OK
         # see note in common/openfoodfacts.py
         if common_openfoodfacts.is_smoothie_app_version_leq_4_20(source):
@@ -133,7 +150,16 @@ def base_upload(request: Request, draft: bool = False) -> Response:
             status=response_status_code,
         )
 
+    # store the image (its thumbnail is generated by a task)
+    file_path, mimetype = store_temp_file(temp_file_path, file)
     save_kwargs = {
+        "file_path": file_path,
+        "mimetype": mimetype,
+        "image_derivatives_status": (
+            proof_constants.IMAGE_DERIVATIVES_STATUS_PENDING
+            if mimetype.startswith("image")
+            else None
+        ),
         "owner": owner,
         "image_md5_hash": image_md5_hash,
         "source": source,
@@ -148,6 +174,8 @@ def base_upload(request: Request, draft: bool = False) -> Response:
 
 
 class ProofViewSet(
+    ConditionalGetMixin,
+    CompiledListMixin,
     mixins.ListModelMixin,
     mixins.RetrieveModelMixin,
     mixins.UpdateModelMixin,
@@ -166,6 +194,8 @@ class ProofViewSet(
     filterset_class = ProofFilter
     ordering_fields = ["id", "date", "price_count", "created"]
     ordering = ["id"]
+    pagination_class = CustomCursorPagination  # opt-in with ?cursor=
+    apply_pending_counter_deltas = True  # price_count, prediction_count
 
     def get_authenticators(self):
         if self.request and self.request.method in ["GET"]:
@@ -398,6 +428,7 @@ class PriceTagViewSet(
     filterset_class = PriceTagFilter
     ordering_fields = ["id", "proof_id", "status", "created"]
     ordering = ["id"]
+    pagination_class = CustomCursorPagination  # opt-in with ?cursor=
 
     def get_authenticators(self):
         if self.request and self.request.method in ["GET"]:
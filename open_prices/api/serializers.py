@@ -1,5 +1,42 @@
 from rest_framework import serializers
 
+from open_prices.common import identity_map
+
 
 class StatusSerializer(serializers.Serializer):
     status = serializers.CharField()
+
+
+class IdentityMapPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Share the loaded object with the validators & set_* helpers of the
+    request (see common/identity_map.py)
+    """
+
+    def to_internal_value(self, data):
+        instance = super().to_internal_value(data)
+        identity_map.add_object(instance)
+        return instance
+
+
+class SparseFieldsetSerializerMixin:
+    """
+    Prune the serialized fields with the `fields` & `expand` context keys
+    (see api.utils.SparseFieldsetMixin). None: no pruning.
+    - expand: nested relations to keep (the `<relation>_id` field remains)
+    - fields: top-level fields to keep
+    """
+
+    expandable_field_list: list[str] = []
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = self.context.get("fields")
+        expand = self.context.get("expand")
+        for field_name in list(self.fields):
+            if (fields is not None and field_name not in fields) or (
+                expand is not None
+                and field_name in self.expandable_field_list
+                and field_name not in expand
+            ):
+                self.fields.pop(field_name)
@@ -1,11 +1,26 @@
 import base64
+import datetime
+from decimal import Decimal
+from unittest.mock import patch
 
 from django.db.models.signals import post_save
 from django.test import TestCase
 from django.urls import reverse
 from factory.django import mute_signals
 
+from open_prices.api.compiled_serializers import get_compiled_serializer
+from open_prices.api.prices.serializers import PriceFullSerializer
+from open_prices.api.products.serializers import ProductFullSerializer
+from open_prices.api.proofs.serializers import ProofHalfFullSerializer
+from open_prices.api.utils import CompiledListMixin
+from open_prices.locations import constants as location_constants
+from open_prices.locations.factories import LocationFactory
+from open_prices.prices import constants as price_constants
 from open_prices.prices.factories import PriceFactory
+from open_prices.prices.models import Price
+from open_prices.products.factories import ProductFactory
+from open_prices.proofs import constants as proof_constants
+from open_prices.proofs.factories import ProofFactory
 from open_prices.users.factories import SessionFactory
 
 
@@ -44,7 +59,14 @@ class PaginationTest(TestCase):
     def test_pagination_size(self):
         # default
         response = self.client.get(self.url)
-        for pagination_key in ["items", "page", "pages", "size", "total"]:
+        for pagination_key in [
+            "items",
+            "page",
+            "pages",
+            "size",
+            "total",
+            "total_is_estimate",
+        ]:
             with self.subTest(pagination_key=pagination_key):
                 self.assertIn(pagination_key, response.data)
         self.assertEqual(response.data["total"], 1000)
@@ -69,6 +91,33 @@ class PaginationTest(TestCase):
         self.assertEqual(response.data["pages"], 1000)
         self.assertEqual(response.data["size"], 1)
 
+    def test_pagination_total_is_estimate(self):
+        # small result: exact count
+        response = self.client.get(self.url)
+        self.assertEqual(response.data["total"], 1000)
+        self.assertFalse(response.data["total_is_estimate"])
+        # large result: planner estimate
+        with patch(
+            "open_prices.common.constants.PAGINATION_COUNT_ESTIMATE_THRESHOLD", 1
+        ):
+            response = self.client.get(self.url)
+        self.assertGreater(response.data["total"], 0)
+        self.assertTrue(response.data["total_is_estimate"])
+        self.assertEqual(len(response.data["items"]), 10)
+        # estimate lower than the real count: the page is not truncated
+        with (
+            patch(
+                "open_prices.common.constants.PAGINATION_COUNT_ESTIMATE_THRESHOLD", 1
+            ),
+            patch(
+                "open_prices.common.managers.EstimatedCountQuerySet.get_row_estimate",
+                return_value=5,
+            ),
+        ):
+            response = self.client.get(self.url + "?page=2")
+        self.assertEqual(response.data["total"], 5)
+        self.assertEqual(len(response.data["items"]), 10)
+
     def test_pagination_page_number(self):
         # size=1 & page=1
         url = self.url + "?size=1&page=1"
@@ -132,3 +181,188 @@ class PaginationTest(TestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, 400)  # invalid page number
         self.assertIn("Invalid page", response.json()["detail"])
+
+
+class CursorPaginationTest(TestCase):
+    """
+    Cursor (keyset) pagination mode (opt-in with ?cursor=).
+    We'll run these tests on the Price list endpoint.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        date_list = [datetime.date(2024, 1, day) for day in [1, 2, 2, 3]] + [None]
+        with mute_signals(post_save):
+            for index in range(25):
+                PriceFactory(date=date_list[index % 5], price=index % 4)
+        cls.url = reverse("api:prices-list")
+
+    def walk_pages(self, params=""):
+        """Return the ids of all the pages, and the number of pages"""
+        id_list = list()
+        page_count = 0
+        cursor = ""
+        while cursor is not None:
+            response = self.client.get(
+                self.url, {"cursor": cursor, "size": 4} | dict(params)
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn("total", response.data)
+            id_list += [price["id"] for price in response.data["items"]]
+            page_count += 1
+            self.assertLessEqual(page_count, Price.objects.count())  # no loop
+            cursor = response.data["next_cursor"]
+        return id_list, page_count
+
+    def test_cursor_pagination(self):
+        # first page
+        response = self.client.get(self.url, {"cursor": ""})
+        for pagination_key in ["items", "size", "next_cursor"]:
+            with self.subTest(pagination_key=pagination_key):
+                self.assertIn(pagination_key, response.data)
+        self.assertEqual(len(response.data["items"]), 10)  # default size
+        self.assertEqual(response.data["size"], 10)
+        # all the pages (default ordering: id)
+        id_list, page_count = self.walk_pages()
+        self.assertEqual(
+            id_list, list(Price.objects.order_by("id").values_list("id", flat=True))
+        )
+        self.assertEqual(page_count, 7)  # 25 / 4
+
+    def test_cursor_pagination_ordering(self):
+        for order_by, ordering in [
+            ("-date", ["-date", "id"]),  # with NULL dates
+            ("date", ["date", "id"]),
+            ("price,-date", ["price", "-date", "id"]),
+            ("-id", ["-id"]),
+        ]:
+            with self.subTest(order_by=order_by):
+                id_list, _ = self.walk_pages({"order_by": order_by})
+                self.assertEqual(
+                    id_list,
+                    list(
+                        Price.objects.order_by(*ordering).values_list("id", flat=True)
+                    ),
+                )
+
+    def test_cursor_pagination_ordering_datetime(self):
+        # all the prices created in the same millisecond
+        created = datetime.datetime(2024, 1, 1, 12, tzinfo=datetime.UTC)
+        for index, price in enumerate(Price.objects.order_by("-id")):
+            Price.objects.filter(id=price.id).update(
+                created=created + datetime.timedelta(microseconds=index)
+            )
+        for order_by, ordering in [
+            ("created", ["created", "id"]),
+            ("-created", ["-created", "id"]),
+        ]:
+            for size in [1, 4]:
+                with self.subTest(order_by=order_by, size=size):
+                    id_list, _ = self.walk_pages({"order_by": order_by, "size": size})
+                    self.assertEqual(
+                        id_list,
+                        list(
+                            Price.objects.order_by(*ordering).values_list(
+                                "id", flat=True
+                            )
+                        ),
+                    )
+
+    def test_cursor_pagination_no_count(self):
+        response = self.client.get(self.url, {"cursor": "", "size": 4})
+        with self.assertNumQueries(1):  # no COUNT(*)
+            self.client.get(
+                self.url, {"cursor": response.data["next_cursor"], "size": 4}
+            )
+
+    def test_cursor_pagination_invalid_cursor(self):
+        response = self.client.get(self.url, {"cursor": "invalid"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Invalid cursor", response.json()["detail"])
+        # the cursor was generated with another ordering
+        response = self.client.get(self.url, {"cursor": "", "order_by": "-date"})
+        response = self.client.get(
+            self.url, {"cursor": response.data["next_cursor"], "order_by": "price"}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("ordering has changed", response.json()["detail"])
+
+
+class CompiledListTest(TestCase):
+    """
+    Differential test: the compiled list path must return exactly the
+    same bytes as the serializers
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        location_osm = LocationFactory(osm_brand="Carrefour", osm_name="Café «Bio»")
+        location_online = LocationFactory(
+            type=location_constants.TYPE_ONLINE, website_url="https://example.org"
+        )
+        ProductFactory(
+            code="8001505005707",
+            product_name="Crème fraîche — épaisse",
+            categories_tags=["en:dairies", "en:creams"],
+            nutriscore_grade="c",
+            product_quantity=200.5,
+        )
+        proof = ProofFactory(
+            type=proof_constants.TYPE_RECEIPT,
+            location_osm_id=location_osm.osm_id,
+            location_osm_type=location_osm.osm_type,
+            date="2024-01-01",
+            currency="EUR",
+            receipt_price_total=Decimal("12.35"),
+        )
+        ProofFactory(
+            type=proof_constants.TYPE_PRICE_TAG,
+            location_id=location_online.id,
+        )
+        PriceFactory(
+            product_code="8001505005707",
+            price=Decimal("1.99"),
+            price_is_discounted=True,
+            price_without_discount=Decimal("2.50"),
+            currency="EUR",
+            date="2024-01-01",
+            proof_id=proof.id,
+            location_osm_id=location_osm.osm_id,
+            location_osm_type=location_osm.osm_type,
+        )
+        PriceFactory(
+            type=price_constants.TYPE_CATEGORY,
+            category_tag="en:apples",
+            labels_tags=["en:organic"],
+            price=Decimal("3.10"),
+            price_per=price_constants.PRICE_PER_KILOGRAM,
+            location_id=location_online.id,
+            location_osm_id=None,
+            location_osm_type=None,
+        )
+        PriceFactory(price=0, location_osm_id=None, location_osm_type=None)
+
+    def test_serializers_compiled(self):
+        for serializer_class in [
+            PriceFullSerializer,
+            ProofHalfFullSerializer,
+            ProductFullSerializer,
+        ]:
+            with self.subTest(serializer_class=serializer_class):
+                self.assertIsNotNone(get_compiled_serializer(serializer_class()))
+
+    def test_compiled_list_same_output(self):
+        for url in [
+            reverse("api:prices-list"),
+            reverse("api:prices-list") + "?order_by=-price&size=2&page=2",
+            reverse("api:prices-list") + "?fields=price,date,product_code",
+            reverse("api:prices-list") + "?expand=location",
+            reverse("api:proofs-list"),
+            reverse("api:products-list"),
+        ]:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                with patch.object(CompiledListMixin, "use_compiled_serializer", False):
+                    response_serializer = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.content, response_serializer.content)
@@ -9,6 +9,7 @@ from open_prices.api.badges.serializers import UserBadgeSerializer
 from open_prices.api.pagination import CustomPagination
 from open_prices.api.users.filters import UserFilter
 from open_prices.api.users.serializers import UserSerializer
+from open_prices.common.models import CounterDelta
 from open_prices.users.models import User
 
 
@@ -29,6 +30,12 @@ class UserViewSet(
             return self.queryset.has_prices()
         return self.queryset
 
+    def retrieve(self, request: Request, *args, **kwargs) -> Response:
+        user = self.get_object()
+        # exact counts: add the pending counter deltas (see CounterDelta)
+        CounterDelta.objects.apply_pending(user)
+        return Response(self.get_serializer(user).data)
+
     @extend_schema(responses=UserBadgeSerializer(many=True), filters=False)
     @action(detail=True, methods=["GET"])
     def badges(self, request: Request, user_id=None) -> Response:
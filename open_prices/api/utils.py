@@ -1,6 +1,20 @@
+import datetime
+import hashlib
+
 import django_filters
 from django.core.validators import EMPTY_VALUES
+from django.db.models import Max
 from django.http import Http404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiParameter
+from rest_framework.exceptions import ParseError
+from rest_framework.response import Response
+
+from open_prices.api.compiled_serializers import get_compiled_serializer
+from open_prices.common import constants, response_cache
+from open_prices.common.models import CounterDelta
 
 
 class ArrayFieldElementContainsFilter(django_filters.CharFilter):
@@ -40,3 +54,252 @@ def get_source_from_request(request):
     if app_page:
         app_name += f" - {app_page}"
     return app_name
+
+
+def get_instance_last_modified(instance) -> datetime.datetime | None:
+    """
+    Most recent `updated` of the instance and of its loaded (select_related)
+    related objects, which are nested in the serialized output
+    """
+    updated_list = [getattr(instance, "updated", None)]
+    for field in instance._meta.concrete_fields:
+        if field.is_relation and field.is_cached(instance):
+            related_object = field.get_cached_value(instance)
+            updated_list.append(getattr(related_object, "updated", None))
+    return max(filter(None, updated_list), default=None)
+
+
+class ConditionalGetMixin:
+    """
+    Conditional GET: ETag & Last-Modified response headers, and
+    304 Not Modified if the If-None-Match / If-Modified-Since request
+    headers match. Checked before serialization.
+    - retrieve: `updated` of the object (and of its nested objects), also
+    bumped by the derived data writes (counts, image derivatives)
+    - list: MAX(updated) & count of the filtered queryset, the count being
+    the one of the pagination (see EstimatedCountQuerySet, not computed
+    twice), and the response cache generations of the models in the
+    output (deletes, nested objects). Only for exact counts (an estimate
+    does not change on deletes), and not in cursor pagination mode, which
+    must stay COUNT(*)-free
+    The ETag also depends on the serializer (& serializer_version), on
+    the query string (pagination, ordering, fields...), and on the pending
+    counter deltas (apply_pending_counter_deltas: exact counts, see
+    CounterDelta).
+    """
+
+    serializer_version = 1  # bump when the serialized output changes
+    apply_pending_counter_deltas = False  # models with buffered count fields
+    pagination_count = None  # (count, count_is_estimate), see list
+
+    def get_etag(self, *validator_list) -> str:
+        signature = "|".join(
+            [
+                self.get_serializer_class().__name__,
+                str(self.serializer_version),
+                self.request.GET.urlencode(),
+                *[str(validator) for validator in validator_list],
+            ]
+        )
+        return quote_etag(hashlib.md5(signature.encode()).hexdigest())
+
+    def get_conditional_response(
+        self, get_response, last_modified: datetime.datetime | None, *validator_list
+    ):
+        """
+        get_response is only called if the client copy is outdated
+        """
+        etag = self.get_etag(last_modified, *validator_list)
+        last_modified_timestamp = (
+            int(last_modified.timestamp()) if last_modified else None
+        )
+        response = get_conditional_response(
+            self.request, etag=etag, last_modified=last_modified_timestamp
+        )
+        if response is None:
+            response = get_response()
+            if not (200 <= response.status_code < 300):
+                return response
+        response["ETag"] = etag
+        if last_modified_timestamp is not None:
+            response["Last-Modified"] = http_date(last_modified_timestamp)
+        return response
+
+    def get_object_response(self, instance):
+        validator_list = [instance.pk]
+        if self.apply_pending_counter_deltas:
+            pending_delta_dict = CounterDelta.objects.apply_pending(instance)
+            validator_list += sorted(pending_delta_dict.items())
+        return self.get_conditional_response(
+            lambda: Response(self.get_serializer(instance).data),
+            get_instance_last_modified(instance),
+            *validator_list,
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_object_response(self.get_object())
+
+    def get_list_generation_model_label_list(self, model) -> list[str]:
+        view_name = getattr(self.request.resolver_match, "view_name", None)
+        return constants.RESPONSE_CACHE_ENDPOINT_DICT.get(
+            view_name, [model._meta.label]
+        )
+
+    def list(self, request, *args, **kwargs):
+        is_cursor_request = getattr(self.paginator, "is_cursor_request", None)
+        if is_cursor_request and is_cursor_request(request):
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        get_pagination_count = getattr(queryset, "get_pagination_count", None)
+        self.pagination_count = (
+            get_pagination_count()
+            if get_pagination_count
+            else (queryset.count(), False)
+        )
+        count, count_is_estimate = self.pagination_count
+        if count_is_estimate:
+            return super().list(request, *args, **kwargs)
+        last_modified = queryset.order_by().aggregate(last_modified=Max("updated"))[
+            "last_modified"
+        ]
+        return self.get_conditional_response(
+            lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs),
+            last_modified,
+            count,
+            *response_cache.get_generation_list(
+                self.get_list_generation_model_label_list(queryset.model)
+            ),
+        )
+
+    def paginate_queryset(self, queryset):
+        if self.pagination_count is not None:
+            # already computed for the list validators (see CustomPaginator)
+            queryset.pagination_count = self.pagination_count
+        return super().paginate_queryset(queryset)
+
+
+SPARSE_FIELDSET_PARAMETER_LIST = [
+    OpenApiParameter(
+        name="fields",
+        type=OpenApiTypes.STR,
+        description="Comma-separated list of the fields to return (default: all)",
+        required=False,
+    ),
+    OpenApiParameter(
+        name="expand",
+        type=OpenApiTypes.STR,
+        description="Comma-separated list of the relations to return as nested objects (default: all). The other relations are only returned as ids.",  # noqa
+        required=False,
+    ),
+]
+
+
+class SparseFieldsetMixin:
+    """
+    Sparse fieldsets & relation expansion (list & retrieve):
+    - ?fields=price,date,product_code: only these top-level fields
+    - ?expand=product,location: only these nested relations (the other
+    relations are returned as `<relation>_id`)
+    The queryset is trimmed to match: only() the serialized columns, and
+    select_related() the expanded relations.
+    See api.serializers.SparseFieldsetSerializerMixin
+    """
+
+    fields_query_param = "fields"
+    expand_query_param = "expand"
+    sparse_fieldset_action_list = ["list", "retrieve"]
+
+    def get_query_param_list(self, query_param: str) -> list[str] | None:
+        if self.action not in self.sparse_fieldset_action_list:
+            return None
+        value = self.request.query_params.get(query_param)
+        if value is None:
+            return None
+        return [item.strip() for item in value.split(",") if item.strip()]
+
+    def get_sparse_fieldset(self) -> tuple[list[str] | None, list[str] | None]:
+        """
+        Return (fields, expand), None if not requested
+        """
+        if not hasattr(self, "_sparse_fieldset"):
+            self._sparse_fieldset = self.parse_sparse_fieldset()
+        return self._sparse_fieldset
+
+    def parse_sparse_fieldset(self) -> tuple[list[str] | None, list[str] | None]:
+        fields = self.get_query_param_list(self.fields_query_param)
+        expand = self.get_query_param_list(self.expand_query_param)
+        serializer_class = self.get_serializer_class()
+        if fields is not None:
+            unknown_field_list = sorted(set(fields) - set(serializer_class().fields))
+            if unknown_field_list:
+                raise ParseError(f"Invalid fields: {', '.join(unknown_field_list)}")
+        if expand is not None:
+            unknown_field_list = sorted(
+                set(expand) - set(serializer_class.expandable_field_list)
+            )
+            if unknown_field_list:
+                raise ParseError(f"Invalid expand: {', '.join(unknown_field_list)}")
+        return fields, expand
+
+    def is_sparse_fieldset_request(self) -> bool:
+        return self.get_sparse_fieldset() != (None, None)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["fields"], context["expand"] = self.get_sparse_fieldset()
+        return context
+
+    def trim_queryset(self, queryset):
+        """
+        Select only the columns (and join only the relations) of the
+        pruned serializer
+        """
+        fields, _ = self.get_sparse_fieldset()
+        expandable_field_list = self.get_serializer_class().expandable_field_list
+        model_field_name_set = {field.name for field in queryset.model._meta.fields}
+        only_field_set = set()
+        select_related_field_set = set()
+        for serializer_field in self.get_serializer().fields.values():
+            field_name = serializer_field.source.split(".")[0]
+            if field_name not in model_field_name_set:
+                continue
+            only_field_set.add(field_name)
+            if serializer_field.field_name in expandable_field_list:
+                select_related_field_set.add(field_name)
+        queryset = queryset.select_related(*sorted(select_related_field_set))
+        if fields is not None:
+            queryset = queryset.only(*sorted(only_field_set))
+        return queryset
+
+
+class CompiledListMixin:
+    """
+    Fast read path for the list action: .values_list() rows mapped by the
+    compiled serializer (see api/compiled_serializers.py), instead of one
+    model instance per row walked by the serializer fields.
+    Falls back to the default list if the serializer can't be compiled,
+    and in cursor pagination mode (the cursor is read from instances).
+    """
+
+    use_compiled_serializer = True
+
+    def list(self, request, *args, **kwargs):
+        is_cursor_request = getattr(self.paginator, "is_cursor_request", None)
+        compiled_serializer = (
+            get_compiled_serializer(self.get_serializer())
+            if self.use_compiled_serializer
+            else None
+        )
+        if compiled_serializer is None or (
+            is_cursor_request and is_cursor_request(request)
+        ):
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset()).values_list(
+            *compiled_serializer.lookup_list
+        )
+        page = self.paginate_queryset(queryset)
+        row_to_dict = compiled_serializer.row_to_dict
+        if page is None:
+            return Response([row_to_dict(row) for row in queryset])
+        return self.get_paginated_response([row_to_dict(row) for row in page])
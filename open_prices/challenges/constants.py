@@ -13,3 +13,7 @@ CHALLENGE_STATUS_CHOICES = [(key, key) for key in CHALLENGE_STATUS_LIST]
 
 
 CHALLENGE_TAG_PREFIX = "challenge-"
+
+# in-process challenge matcher (see challenges/matcher.py)
+CHALLENGE_MATCHER_VERSION_CACHE_KEY = "challenge_matcher_version"
+CHALLENGE_MATCHER_MAX_AGE_SECONDS = 60
@@ -0,0 +1,187 @@
+import dataclasses
+import datetime
+import time
+import uuid
+
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+
+from open_prices.challenges import constants as challenge_constants
+from open_prices.challenges.models import Challenge
+from open_prices.prices import constants as price_constants
+
+
+@dataclasses.dataclass(frozen=True)
+class CompiledChallenge:
+    """
+    Snapshot of a Challenge, with pre-built sets used to match prices
+    without any query.
+    """
+
+    id: int
+    tag: str
+    is_published: bool
+    start_date: datetime.date | None
+    end_date: datetime.date | None
+    start_date_with_time: datetime.datetime | None
+    end_date_with_time: datetime.datetime | None
+    categories: frozenset[str]
+    categories_full: frozenset[str]
+    location_ids: frozenset[int]
+
+    @classmethod
+    def from_challenge(cls, challenge: Challenge, location_id_list: list = None):
+        if location_id_list is None:
+            location_id_list = challenge.location_id_list()
+        return cls(
+            id=challenge.id,
+            tag=challenge.tag,
+            is_published=challenge.is_published,
+            start_date=challenge.start_date,
+            end_date=challenge.end_date,
+            start_date_with_time=challenge.start_date_with_time,
+            end_date_with_time=challenge.end_date_with_time,
+            categories=frozenset(challenge.categories or []),
+            categories_full=frozenset(challenge.categories_full or []),
+            location_ids=frozenset(location_id_list),
+        )
+
+    @property
+    def is_ongoing(self) -> bool:
+        """
+        Mirror of the Challenge.status property
+        """
+        if not self.is_published or self.start_date is None or self.end_date is None:
+            return False
+        today = timezone.now().date()
+        return str(self.start_date) <= str(today) <= str(self.end_date)
+
+    def matches(self, price) -> bool:
+        """
+        Mirror of the Price in_challenge queryset
+        """
+        if self.start_date_with_time is None or self.end_date_with_time is None:
+            return False
+        dates_match = (
+            self.start_date_with_time <= price.created <= self.end_date_with_time
+        )
+        categories_match = (
+            not self.categories
+            or (
+                price.type == price_constants.TYPE_CATEGORY
+                and price.category_tag in self.categories_full
+            )
+            or (
+                price.type == price_constants.TYPE_PRODUCT
+                and price.product
+                and not self.categories.isdisjoint(price.product.categories_tags or [])
+            )
+        )
+        locations_match = not self.location_ids or (
+            bool(price.location_id) and price.location_id in self.location_ids
+        )
+        return bool(dates_match and categories_match and locations_match)
+
+
+class ChallengeMatcher:
+    """
+    Per-process cache of the published & not completed challenges.
+    - reloaded when the version stamp changes (bumped on Challenge save,
+    delete & locations change), or after CHALLENGE_MATCHER_MAX_AGE_SECONDS
+    (the stamp is only shared between processes if the cache backend is)
+    - the ongoing status is computed at match time (no reload needed when
+    a challenge starts or ends)
+    - tests: the database is rolled back between tests, but not the
+    matcher (nor the stamp, bumped on commit): reset it around the tests
+    that create published challenges
+
+    Usage: Price.update_tags, Challenge.set_price_tags
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.version = None
+        self.loaded_at = None
+        self.challenge_list = list()
+
+    def is_stale(self) -> bool:
+        if self.loaded_at is None:
+            return True
+        if (
+            time.monotonic() - self.loaded_at
+            > challenge_constants.CHALLENGE_MATCHER_MAX_AGE_SECONDS
+        ):
+            return True
+        return self.version != cache.get(
+            challenge_constants.CHALLENGE_MATCHER_VERSION_CACHE_KEY
+        )
+
+    def load(self):
+        """
+        - 1 query for the challenges
+        - 1 query for their locations
+        """
+        version = cache.get(challenge_constants.CHALLENGE_MATCHER_VERSION_CACHE_KEY)
+        challenge_list = list(
+            Challenge.objects.published().filter(
+                Q(end_date=None) | Q(end_date__gte=timezone.now().date())
+            )
+        )
+        location_id_dict = {challenge.id: [] for challenge in challenge_list}
+        for challenge_id, location_id in Challenge.locations.through.objects.filter(
+            challenge_id__in=location_id_dict.keys()
+        ).values_list("challenge_id", "location_id"):
+            location_id_dict[challenge_id].append(location_id)
+        self.challenge_list = [
+            CompiledChallenge.from_challenge(challenge, location_id_dict[challenge.id])
+            for challenge in challenge_list
+        ]
+        self.version = version
+        self.loaded_at = time.monotonic()
+
+    def refresh_if_stale(self):
+        if self.is_stale():
+            self.load()
+
+    def get(self, challenge_id: int) -> CompiledChallenge | None:
+        self.refresh_if_stale()
+        return next(
+            (
+                challenge
+                for challenge in self.challenge_list
+                if challenge.id == challenge_id
+            ),
+            None,
+        )
+
+    def ongoing_challenges(self) -> list[CompiledChallenge]:
+        self.refresh_if_stale()
+        return [challenge for challenge in self.challenge_list if challenge.is_ongoing]
+
+    def match(self, price) -> list[CompiledChallenge]:
+        """
+        Return the ongoing challenges the price is in
+        """
+        return [
+            challenge
+            for challenge in self.ongoing_challenges()
+            if challenge.matches(price)
+        ]
+
+
+challenge_matcher = ChallengeMatcher()
+
+
+def get_challenge_matcher() -> ChallengeMatcher:
+    return challenge_matcher
+
+
+def bump_challenge_matcher_version():
+    cache.set(
+        challenge_constants.CHALLENGE_MATCHER_VERSION_CACHE_KEY,
+        uuid.uuid4().hex,
+        timeout=None,
+    )
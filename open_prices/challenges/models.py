@@ -1,8 +1,9 @@
+import logging
 from datetime import datetime, timedelta
 
 from django.contrib.postgres.fields import ArrayField
 from django.core.validators import ValidationError
-from django.db import models
+from django.db import models, transaction
 from django.db.models import Case, Count, F, Func, Q, Value, When, signals
 from django.dispatch import receiver
 from django.utils import timezone
@@ -13,6 +14,8 @@ from open_prices.common import openfoodfacts as common_openfoodfacts
 from open_prices.common import utils
 from open_prices.locations.models import Location
 
+logger = logging.getLogger(__name__)
+
 
 class ChallengeQuerySet(models.QuerySet):
     def published(self):
@@ -198,22 +201,76 @@ class Challenge(models.Model):
         from open_prices.prices.models import Price
 
         Price.objects.filter(tags__contains=[self.tag]).update(
-            tags=Func(F("tags"), Value(self.tag), function="array_remove")
+            tags=Func(F("tags"), Value(self.tag), function="array_remove"),
+            updated=timezone.now(),  # conditional GET (see ConditionalGetMixin)
         )
 
     def reset_proof_tags(self):
         from open_prices.proofs.models import Proof
 
         Proof.objects.filter(tags__contains=[self.tag]).update(
-            tags=Func(F("tags"), Value(self.tag), function="array_remove")
+            tags=Func(F("tags"), Value(self.tag), function="array_remove"),
+            updated=timezone.now(),  # conditional GET (see ConditionalGetMixin)
+        )
+
+    def check_price_tags(self) -> dict:
+        """
+        Compare the SQL path (Price in_challenge queryset) with the
+        in-process one (ChallengeMatcher), on the prices created during
+        the challenge. Mismatches are logged.
+        Return a dict with the price ids only matched by one of the paths.
+        """
+        from open_prices.challenges.matcher import (
+            CompiledChallenge,
+            get_challenge_matcher,
         )
+        from open_prices.prices.models import Price
+
+        compiled_challenge = get_challenge_matcher().get(
+            self.id
+        ) or CompiledChallenge.from_challenge(self)
+        sql_price_id_set = set(
+            Price.objects.in_challenge(self).values_list("id", flat=True)
+        )
+        matcher_price_id_set = {
+            price.id
+            for price in Price.objects.select_related("product")
+            .filter(
+                created__gte=self.start_date_with_time,
+                created__lte=self.end_date_with_time,
+            )
+            .only(
+                "id",
+                "type",
+                "category_tag",
+                "location_id",
+                "created",
+                "product__categories_tags",
+            )
+            .iterator()
+            if compiled_challenge.matches(price)
+        }
+        mismatch_dict = {
+            "sql_only": sorted(sql_price_id_set - matcher_price_id_set),
+            "matcher_only": sorted(matcher_price_id_set - sql_price_id_set),
+        }
+        if mismatch_dict["sql_only"] or mismatch_dict["matcher_only"]:
+            logger.warning(
+                "Challenge %s: price tags mismatch between the SQL & in-process matchers: %s",
+                self.id,
+                mismatch_dict,
+            )
+        return mismatch_dict
 
     def set_price_tags(self):
         from open_prices.prices.models import Price
 
+        if self.status == challenge_constants.CHALLENGE_STATUS_ONGOING:
+            self.check_price_tags()
         # TODO: manage cases where prices/proofs are removed from the challenge
         Price.objects.in_challenge(self).exclude(tags__contains=[self.tag]).update(
-            tags=Func(F("tags"), Value(self.tag), function="array_append")
+            tags=Func(F("tags"), Value(self.tag), function="array_append"),
+            updated=timezone.now(),  # conditional GET (see ConditionalGetMixin)
         )
 
     def set_proof_tags(self):
@@ -221,7 +278,8 @@ class Challenge(models.Model):
 
         # TODO: manage cases where prices/proofs are removed from the challenge
         Proof.objects.in_challenge(self).exclude(tags__contains=[self.tag]).update(
-            tags=Func(F("tags"), Value(self.tag), function="array_append")
+            tags=Func(F("tags"), Value(self.tag), function="array_append"),
+            updated=timezone.now(),  # conditional GET (see ConditionalGetMixin)
         )
 
     def calculate_stats(self):
@@ -382,6 +440,15 @@ class Challenge(models.Model):
         self.save(update_fields=["stats"])
 
 
+@receiver(signals.post_save, sender=Challenge)
+@receiver(signals.post_delete, sender=Challenge)
+@receiver(signals.m2m_changed, sender=Challenge.locations.through)
+def challenge_post_save_bump_challenge_matcher_version(sender, instance, **kwargs):
+    from open_prices.challenges.matcher import bump_challenge_matcher_version
+
+    transaction.on_commit(bump_challenge_matcher_version)
+
+
 @receiver(signals.post_save, sender=Challenge)
 def challenge_post_create_init_categories_full_and_stats(
     sender, instance, created, **kwargs
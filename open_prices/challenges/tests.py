@@ -1,10 +1,13 @@
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.test import TestCase
 from freezegun import freeze_time
 
 from open_prices.challenges import constants as challenge_constants
 from open_prices.challenges.factories import ChallengeFactory
+from open_prices.challenges.matcher import ChallengeMatcher, get_challenge_matcher
 from open_prices.challenges.models import Challenge
+from open_prices.common.testing import ProcessCacheResetMixin
 from open_prices.locations.factories import LocationFactory
 from open_prices.prices import constants as price_constants
 from open_prices.prices.factories import PriceFactory
@@ -24,11 +27,7 @@ PRODUCT_8001505005707 = {
 }
 
 
-class ChallengeModelSaveTest(TestCase):
-    @classmethod
-    def setUpTestData(cls):
-        pass
-
+class ChallengeModelSaveTest(ProcessCacheResetMixin, TestCase):
     def test_challenge_date_validation(self):
         ChallengeFactory(is_published=False, start_date=None, end_date=None)
         ChallengeFactory(is_published=False, start_date=None, end_date="2024-06-30")
@@ -97,7 +96,7 @@ class ChallengeModelSaveTest(TestCase):
         self.assertIsNotNone(c.stats)
 
 
-class ChallengeQuerySetTest(TestCase):
+class ChallengeQuerySetTest(ProcessCacheResetMixin, TestCase):
     @classmethod
     def setUpTestData(cls):
         cls.challenge_upcoming = ChallengeFactory(
@@ -115,7 +114,7 @@ class ChallengeQuerySetTest(TestCase):
         self.assertEqual(Challenge.objects.published().count(), 2)
 
 
-class ChallengeStatusQuerySetAndPropertyTest(TestCase):
+class ChallengeStatusQuerySetAndPropertyTest(ProcessCacheResetMixin, TestCase):
     @classmethod
     def setUpTestData(cls):
         cls.challenge_draft = ChallengeFactory(is_published=False, end_date=None)
@@ -210,7 +209,7 @@ class ChallengeStatusQuerySetAndPropertyTest(TestCase):
             self.assertEqual(Challenge.objects.for_update_task().count(), 3)
 
 
-class ChallengePropertyTest(TestCase):
+class ChallengePropertyTest(ProcessCacheResetMixin, TestCase):
     @classmethod
     def setUpTestData(cls):
         cls.location = LocationFactory()
@@ -286,6 +285,17 @@ class ChallengePropertyTest(TestCase):
         self.challenge_ongoing.set_price_tags()
         self.assertEqual(Price.objects.has_tag(self.challenge_ongoing.tag).count(), 3)
         self.assertIn("test", self.price_with_existing_tag.tags)
+        # conditional GET
+        self.assertGreater(
+            Price.objects.get(id=self.price_with_existing_tag.id).updated,
+            self.price_with_existing_tag.updated,
+        )
+
+    def test_check_price_tags(self):
+        self.assertEqual(
+            self.challenge_ongoing.check_price_tags(),
+            {"sql_only": [], "matcher_only": []},
+        )
 
     def test_set_proof_tags(self):
         self.assertEqual(Proof.objects.count(), 2)
@@ -294,6 +304,10 @@ class ChallengePropertyTest(TestCase):
         self.challenge_ongoing.set_proof_tags()
         self.assertEqual(Proof.objects.has_tag(self.challenge_ongoing.tag).count(), 1)
         self.assertIn("test", self.proof_in_challenge.tags)
+        self.assertGreater(
+            Proof.objects.get(id=self.proof_in_challenge.id).updated,
+            self.proof_in_challenge.updated,
+        )
 
     def test_reset_price_tags(self):
         self.assertEqual(Price.objects.count(), 5)
@@ -388,3 +402,105 @@ class ChallengePropertyTest(TestCase):
                 }
             ],
         )
+
+
+class ChallengeMatcherTest(ProcessCacheResetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.location = LocationFactory()
+        cls.challenge_ongoing = ChallengeFactory(
+            is_published=True,
+            start_date="2024-12-30",
+            end_date="2025-01-30",
+            categories=["en:breakfasts", "en:spreads"],
+            locations=[cls.location],
+        )
+        cls.challenge_completed = ChallengeFactory(
+            is_published=True, start_date="2024-06-30", end_date="2024-07-30"
+        )
+        cls.product_8001505005707 = ProductFactory(**PRODUCT_8001505005707)
+        with freeze_time("2025-01-01"):
+            cls.price_in_challenge = PriceFactory(
+                product_code="8001505005707",
+                product=cls.product_8001505005707,
+                location_id=cls.location.id,
+                location_osm_id=cls.location.osm_id,
+                location_osm_type=cls.location.osm_type,
+            )
+            cls.price_not_in_challenge = PriceFactory(
+                product_code="8001505005707", product=cls.product_8001505005707
+            )
+
+    def setUp(self):
+        super().setUp()
+        cache.delete(challenge_constants.CHALLENGE_MATCHER_VERSION_CACHE_KEY)
+        self.matcher = ChallengeMatcher()
+
+    @freeze_time("2025-01-01")
+    def test_match(self):
+        with self.assertNumQueries(2):  # challenges & locations
+            self.matcher.refresh_if_stale()
+        self.assertEqual(
+            [challenge.id for challenge in self.matcher.ongoing_challenges()],
+            [self.challenge_ongoing.id],
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                [c.id for c in self.matcher.match(self.price_in_challenge)],
+                [self.challenge_ongoing.id],
+            )
+            self.assertEqual(self.matcher.match(self.price_not_in_challenge), [])
+
+    def test_ongoing_status_computed_at_match_time(self):
+        with freeze_time("2024-12-01"):  # before the challenge
+            self.assertEqual(self.matcher.ongoing_challenges(), [])
+        with freeze_time("2025-01-01"):
+            self.assertEqual(len(self.matcher.ongoing_challenges()), 1)
+
+    @freeze_time("2025-01-01")
+    def test_match_warm(self):
+        # the process-wide matcher, as used by Price.update_tags
+        challenge_matcher = get_challenge_matcher()
+        challenge_matcher.refresh_if_stale()
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                [c.id for c in challenge_matcher.match(self.price_in_challenge)],
+                [self.challenge_ongoing.id],
+            )
+            self.assertEqual(challenge_matcher.match(self.price_not_in_challenge), [])
+
+    @freeze_time("2025-01-01")
+    def test_challenge_save_invalidates_matcher(self):
+        challenge_matcher = get_challenge_matcher()
+        challenge_matcher.refresh_if_stale()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.challenge_ongoing.categories = ["en:tomatoes"]
+            self.challenge_ongoing.save()
+        self.assertTrue(challenge_matcher.is_stale())
+        self.assertEqual(challenge_matcher.match(self.price_in_challenge), [])
+        # new prices are not tagged anymore
+        price = PriceFactory(
+            product_code="8001505005707",
+            product=self.product_8001505005707,
+            location_id=self.location.id,
+            location_osm_id=self.location.osm_id,
+            location_osm_type=self.location.osm_type,
+        )
+        price.update_tags()
+        self.assertNotIn(self.challenge_ongoing.tag, price.tags)
+
+    @freeze_time("2025-01-01")
+    def test_version_bump_on_challenge_change(self):
+        self.matcher.refresh_if_stale()
+        self.assertFalse(self.matcher.is_stale())
+        # challenge save
+        with self.captureOnCommitCallbacks(execute=True):
+            self.challenge_ongoing.categories = ["en:tomatoes"]
+            self.challenge_ongoing.save()
+        self.assertTrue(self.matcher.is_stale())
+        self.assertEqual(self.matcher.match(self.price_in_challenge), [])
+        self.assertFalse(self.matcher.is_stale())
+        # locations change
+        with self.captureOnCommitCallbacks(execute=True):
+            self.challenge_ongoing.locations.clear()
+        self.assertTrue(self.matcher.is_stale())
@@ -0,0 +1,31 @@
+from django.apps import AppConfig
+
+
+class CommonConfig(AppConfig):
+    name = "open_prices.common"
+
+    def ready(self):
+        from django.db.models import signals
+        from django_q.signals import post_execute_in_worker, pre_execute
+
+        from open_prices.common import constants, identity_map, response_cache
+        from open_prices.common.taxonomy import warm_taxonomy_snapshots
+        from open_prices.proofs.utils import (
+            task_post_execute_clear_decoded_image_cache,
+        )
+
+        # map the taxonomy snapshots before the first request
+        warm_taxonomy_snapshots()
+        # task-scoped identity map
+        pre_execute.connect(identity_map.task_pre_execute)
+        post_execute_in_worker.connect(identity_map.task_post_execute)
+        # task-scoped decoded image cache (proof ML steps)
+        post_execute_in_worker.connect(task_post_execute_clear_decoded_image_cache)
+        # anonymous GET response cache invalidation
+        for model_label in constants.RESPONSE_CACHE_GENERATION_BUMP_DICT:
+            model = self.apps.get_model(model_label)
+            for signal in [signals.post_save, signals.post_delete]:
+                signal.connect(
+                    response_cache.model_post_save_or_delete_bump_generations,
+                    sender=model,
+                )
@@ -13,3 +13,63 @@ SOURCE_MOBILE = "MOBILE"  # Smoothie - OpenFoodFacts
 SOURCE_API = "API"  # API
 SOURCE_OTHER = "OTHER"  # None, MyMeals
 SOURCE_LIST = [SOURCE_WEB, SOURCE_MOBILE, SOURCE_API, SOURCE_OTHER]
+
+# counter deltas (see common.models.CounterDelta)
+COUNTER_DELTA_FOLD_BATCH_SIZE = 1000
+COUNTER_DELTA_FOLD_CACHE_KEY = "counter_delta_fold_enqueued"
+COUNTER_DELTA_FOLD_DEBOUNCE_SECONDS = 10
+
+# per-process id resolution caches (see common.id_cache.IdResolutionCache)
+ID_CACHE_MAX_SIZE = 10000
+ID_CACHE_MAX_AGE_SECONDS = 60 * 60
+ID_CACHE_STATS_LOG_INTERVAL = 10000  # log the hit rate every N lookups
+
+# compiled taxonomy snapshots (see common.taxonomy)
+TAXONOMY_SNAPSHOT_TYPE_LIST = ["category", "label", "origin"]
+
+# count strategy of the paginated list endpoints
+# (see common.managers.EstimatedCountQuerySet)
+PAGINATION_COUNT_ESTIMATE_THRESHOLD = 100000  # planner estimate above: no COUNT(*)
+PAGINATION_COUNT_CACHE_TIMEOUT_SECONDS = 60
+
+# anonymous GET response cache (see common.response_cache)
+# view name -> models (generations) the responses depend on
+RESPONSE_CACHE_ENDPOINT_DICT = {
+    "api:prices-list": [
+        "prices.Price",
+        "products.Product",
+        "locations.Location",
+        "proofs.Proof",
+    ],
+    "api:prices-detail": [
+        "prices.Price",
+        "products.Product",
+        "locations.Location",
+        "proofs.Proof",
+    ],
+    "api:products-detail": ["products.Product"],
+    "api:products-get-by-code": ["products.Product"],
+    "api:products-price-history": ["prices.Price", "products.Product"],
+    "api:locations-detail": ["locations.Location"],
+    "api:locations-get-by-osm": ["locations.Location"],
+    "api:challenges-list": ["challenges.Challenge"],
+    "api:challenges-detail": ["challenges.Challenge"],
+}
+# model written -> generations bumped (counts, nested objects...)
+RESPONSE_CACHE_GENERATION_BUMP_DICT = {
+    "prices.Price": [
+        "prices.Price",
+        "products.Product",
+        "locations.Location",
+        "proofs.Proof",
+    ],
+    "proofs.Proof": ["proofs.Proof", "locations.Location"],
+    "products.Product": ["products.Product"],
+    "locations.Location": ["locations.Location"],
+    "challenges.Challenge": ["challenges.Challenge"],
+}
+RESPONSE_CACHE_TIMEOUT_SECONDS = 60  # safety net (bulk updates don't send signals)
+RESPONSE_CACHE_STATS_LOG_INTERVAL = 10000  # log the hit rates every N lookups
+
+# mergeable quantile sketches (see common.quantile_sketch)
+QUANTILE_SKETCH_RELATIVE_ACCURACY = 0.01  # 1% relative error on the quantiles
@@ -1,4 +1,4 @@
-from django.db.models import Func
+from django.db.models import Aggregate, FloatField, Func
 
 
 class LevenshteinLessEqual(Func):
@@ -32,3 +32,20 @@ class LevenshteinLessEqual(Func):
             max_d=max_d,
             **extras,
         )
+
+
+class PercentileCont(Aggregate):
+    """Continuous percentile (interpolated between the 2 closest values),
+    as an ordered-set aggregate.
+
+    See
+    https://www.postgresql.org/docs/current/functions-aggregate.html#FUNCTIONS-ORDEREDSET-TABLE.
+    """
+
+    function = "PERCENTILE_CONT"
+    template = "%(function)s(%(percentile)s) WITHIN GROUP (ORDER BY %(expressions)s)"
+    output_field = FloatField()
+
+    def __init__(self, expression, percentile: float, **extra):
+        # validated float: safe to inline in the SQL
+        super().__init__(expression, percentile=float(percentile), **extra)
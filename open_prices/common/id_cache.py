@@ -0,0 +1,105 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.db import transaction
+
+from open_prices.common import constants
+
+logger = logging.getLogger(__name__)
+
+
+class IdResolutionCache:
+    """
+    Bounded per-process LRU cache: natural key -> primary key
+    (e.g. barcode -> product id), to skip the get_or_create SELECT of
+    the most written products & locations.
+    - entries expire after max_age_seconds (rows deleted by another
+    process are only evicted locally by the delete signals: saves using
+    a stale id are retried, see utils.save_retrying_stale_ids)
+    - entries are only added once the transaction is committed
+    (a rolled back INSERT would leave a dangling id)
+    - hit/miss counters (see stats), logged every N lookups
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_size: int = constants.ID_CACHE_MAX_SIZE,
+        max_age_seconds: int = constants.ID_CACHE_MAX_AGE_SECONDS,
+    ):
+        self.name = name
+        self.max_size = max_size
+        self.max_age_seconds = max_age_seconds
+        self.lock = threading.Lock()
+        self.entry_dict = OrderedDict()  # key -> (id, timestamp)
+        self.key_dict = dict()  # id -> key
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entry_dict.get(key)
+            if entry is not None and (
+                time.monotonic() - entry[1] > self.max_age_seconds
+            ):
+                self._delete(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+            else:
+                self.entry_dict.move_to_end(key)
+                self.hits += 1
+            if (self.hits + self.misses) % constants.ID_CACHE_STATS_LOG_INTERVAL == 0:
+                logger.info("ID cache stats: %s", self._stats())
+        return entry[0] if entry else None
+
+    def set(self, key, id):
+        with self.lock:
+            self._delete(key)
+            self.entry_dict[key] = (id, time.monotonic())
+            self.key_dict[id] = key
+            while len(self.entry_dict) > self.max_size:
+                evicted_key, (evicted_id, _) = self.entry_dict.popitem(last=False)
+                self.key_dict.pop(evicted_id, None)
+
+    def set_on_commit(self, key, id):
+        transaction.on_commit(lambda: self.set(key, id))
+
+    def _delete(self, key):
+        entry = self.entry_dict.pop(key, None)
+        if entry is not None:
+            self.key_dict.pop(entry[0], None)
+
+    def delete(self, key):
+        with self.lock:
+            self._delete(key)
+
+    def delete_id(self, id):
+        with self.lock:
+            key = self.key_dict.get(id)
+            if key is not None:
+                self._delete(key)
+
+    def clear(self):
+        with self.lock:
+            self.entry_dict.clear()
+            self.key_dict.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def _stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "name": self.name,
+            "size": len(self.entry_dict),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+    def stats(self) -> dict:
+        with self.lock:
+            return self._stats()
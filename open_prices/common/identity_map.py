@@ -0,0 +1,52 @@
+import contextvars
+from contextlib import contextmanager
+
+from django.db import models
+
+# (model label, pk) -> instance, for the current request / task
+# None outside of a scope: nothing is shared
+_identity_map_var = contextvars.ContextVar("identity_map", default=None)
+# scopes opened by the django-q pre_execute signal (see task_pre_execute)
+_task_token_list = list()
+
+
+@contextmanager
+def identity_map_scope():
+    """
+    Share the related objects (Location, Proof...) loaded during a
+    request / task, between the serializers, the validators and the
+    set_* helpers: each object is fetched at most once.
+    Nested scopes start empty.
+    """
+    token = _identity_map_var.set(dict())
+    try:
+        yield
+    finally:
+        _identity_map_var.reset(token)
+
+
+def _get_key(model, pk):
+    return (model._meta.concrete_model._meta.label, str(pk))
+
+
+def get_object(model, pk) -> models.Model | None:
+    identity_map = _identity_map_var.get()
+    if identity_map is None or pk is None:
+        return None
+    return identity_map.get(_get_key(model, pk))
+
+
+def add_object(instance: models.Model | None) -> None:
+    identity_map = _identity_map_var.get()
+    if identity_map is None or instance is None or instance.pk is None:
+        return
+    identity_map[_get_key(instance, instance.pk)] = instance
+
+
+def task_pre_execute(sender, func, task, **kwargs):
+    _task_token_list.append(_identity_map_var.set(dict()))
+
+
+def task_post_execute(sender, func, task, **kwargs):
+    if _task_token_list:
+        _identity_map_var.reset(_task_token_list.pop())
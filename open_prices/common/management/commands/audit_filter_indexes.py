@@ -0,0 +1,182 @@
+import json
+import re
+from collections import Counter
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand
+from django.http import HttpRequest, QueryDict
+from django.urls import Resolver404, resolve
+from rest_framework.exceptions import APIException
+
+# nginx / gunicorn access log line: ... "GET /api/v1/prices?... HTTP/1.1" ...
+ACCESS_LOG_REQUEST_REGEX = re.compile(r'"GET (?P<url>\S+) HTTP/[\d.]+"')
+# not filters: left out of the summary
+NON_FILTER_QUERY_PARAM_LIST = ["page", "size", "fields", "expand"]
+
+
+def get_url_from_line(line: str) -> str | None:
+    """
+    Access log line or bare URL (/api/v1/prices?...) -> URL
+    """
+    match = ACCESS_LOG_REQUEST_REGEX.search(line)
+    if match:
+        return match.group("url")
+    line = line.strip()
+    if line.startswith(("/", "http://", "https://")):
+        return line
+    return None
+
+
+def get_list_queryset(url: str):
+    """
+    Replay a list request through its viewset (filters, ordering & page
+    slice), without running it. None if the URL is not a list endpoint.
+    """
+    split_url = urlsplit(url)
+    try:
+        match = resolve(split_url.path)
+    except Resolver404:
+        return None
+    view_class = getattr(match.func, "cls", None)
+    action_dict = getattr(match.func, "actions", None) or dict()
+    if view_class is None or action_dict.get("get") != "list":
+        return None
+    request = HttpRequest()
+    request.method = "GET"
+    request.path = request.path_info = split_url.path
+    request.GET = QueryDict(split_url.query)
+    # mirror of ViewSetMixin.as_view() & APIView.dispatch()
+    view = view_class(**match.func.initkwargs)
+    view.action_map = action_dict
+    view.action = "list"
+    view.request, view.args, view.kwargs = request, (), match.kwargs
+    view.format_kwarg = None
+    view.request = view.initialize_request(request)
+    view.headers = dict()
+    queryset = view.filter_queryset(view.get_queryset())
+    if view.paginator is None:
+        return queryset
+    page_size = view.paginator.get_page_size(view.request) or 10
+    try:
+        page_number = max(int(request.GET.get("page", 1)), 1)
+    except ValueError:
+        page_number = 1
+    offset = (page_number - 1) * page_size
+    return queryset[offset : offset + page_size]
+
+
+def get_plan_node_list(plan: dict) -> list[dict]:
+    node_list = [plan]
+    for child_plan in plan.get("Plans", []):
+        node_list.extend(get_plan_node_list(child_plan))
+    return node_list
+
+
+def get_seq_scan_list(plan: dict, min_rows: int) -> list[tuple[str, int]]:
+    """
+    Sequential scans reading at least min_rows rows: (relation, rows) list.
+    Rows read = rows returned + rows removed by the filter (actual rows
+    with ANALYZE, else the planner estimate)
+    """
+    seq_scan_list = list()
+    for node in get_plan_node_list(plan):
+        if node["Node Type"] != "Seq Scan":
+            continue
+        if "Actual Rows" in node:
+            row_count = (
+                node["Actual Rows"] + node.get("Rows Removed by Filter", 0)
+            ) * node.get("Actual Loops", 1)
+        else:
+            row_count = node["Plan Rows"]
+        if row_count >= min_rows:
+            seq_scan_list.append((node["Relation Name"], row_count))
+    return seq_scan_list
+
+
+def get_filter_signature(url: str) -> str:
+    query_dict = QueryDict(urlsplit(url).query)
+    param_list = sorted(
+        param for param in query_dict if param not in NON_FILTER_QUERY_PARAM_LIST
+    )
+    return f"{urlsplit(url).path} [{', '.join(param_list)}]"
+
+
+class Command(BaseCommand):
+    """Replay a corpus of list requests (e.g. extracted from the access logs)
+    through the API filtersets, EXPLAIN each query, and report the
+    sequential scans & slow plans. Used to check (and justify) the indexes
+    of the filtered tables."""
+
+    help = "Report the sequential scans & slow plans of logged list requests."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "path",
+            help="Access log or file with one URL per line (/api/v1/prices?...)",
+        )
+        parser.add_argument(
+            "--slow-ms",
+            type=float,
+            default=100,
+            help="Execution time above which a plan is reported (default: 100)",
+        )
+        parser.add_argument(
+            "--min-seq-scan-rows",
+            type=int,
+            default=10000,
+            help="Sequential scans reading less rows are ignored (default: 10000)",
+        )
+        parser.add_argument(
+            "--no-analyze",
+            action="store_true",
+            help="EXPLAIN only (planner estimates, the queries are not run)",
+        )
+
+    def handle(self, *args, **options) -> None:
+        analyze = not options["no_analyze"]
+        query_count, skipped_count, slow_count, seq_scan_count = 0, 0, 0, 0
+        seq_scan_counter = Counter()
+        with open(options["path"]) as f:
+            url_list = [url for url in map(get_url_from_line, f) if url]
+        for url in url_list:
+            try:
+                queryset = get_list_queryset(url)
+            except APIException:  # invalid filters
+                queryset = None
+            if queryset is None:
+                skipped_count += 1
+                continue
+            query_count += 1
+            explain_output = queryset.explain(
+                format="json", analyze=analyze, buffers=analyze
+            )
+            explain = json.loads(explain_output)[0]
+            seq_scan_list = get_seq_scan_list(
+                explain["Plan"], options["min_seq_scan_rows"]
+            )
+            execution_time = explain.get("Execution Time")
+            is_slow = execution_time is not None and (
+                execution_time >= options["slow_ms"]
+            )
+            if not (seq_scan_list or is_slow):
+                continue
+            slow_count += is_slow
+            seq_scan_count += bool(seq_scan_list)
+            for relation, _ in seq_scan_list:
+                seq_scan_counter[(relation, get_filter_signature(url))] += 1
+            report_list = [
+                f"SEQ SCAN {relation} ({row_count} rows)"
+                for relation, row_count in seq_scan_list
+            ]
+            if execution_time is not None:
+                report_list.append(f"{execution_time:.1f} ms")
+            self.stdout.write(f"[{', '.join(report_list)}] {url}")
+
+        self.stdout.write(
+            f"Queries: {query_count} ({skipped_count} skipped), slow: {slow_count}, "
+            f"with a sequential scan: {seq_scan_count}"
+        )
+        if seq_scan_counter:
+            self.stdout.write("Sequential scans per relation & filters:")
+            for (relation, signature), count in seq_scan_counter.most_common():
+                self.stdout.write(f"  {relation} {signature}: {count}")
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from open_prices.common import constants
+from open_prices.common.taxonomy import write_taxonomy_snapshot
+
+
+class Command(BaseCommand):
+    """Compile the category/label/origin taxonomies into binary snapshots,
+    memory-mapped by every process at startup (see common/taxonomy.py)."""
+
+    help = "Compile the taxonomies into binary snapshots."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force-download",
+            action="store_true",
+            help="Download the latest version of the taxonomies.",
+        )
+
+    def handle(self, *args, **options) -> None:
+        for taxonomy_type in constants.TAXONOMY_SNAPSHOT_TYPE_LIST:
+            path = write_taxonomy_snapshot(
+                taxonomy_type, force_download=options["force_download"]
+            )
+            self.stdout.write(f"{taxonomy_type} taxonomy snapshot written to {path}")
@@ -1,6 +1,13 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
 from django.db import connections
 from django.db.models import Manager, QuerySet
 
+from open_prices.common import constants
+
 
 class ApproximateCountQuerySet(QuerySet):
     """Use PostgreSQL's pg_class.reltuples for fast approximate counting.
@@ -32,3 +39,47 @@ class ApproximateCountQuerySet(QuerySet):
 
 
 ApproximateCountManager = Manager.from_queryset(ApproximateCountQuerySet)
+
+
+class EstimatedCountQuerySet(QuerySet):
+    """Count strategy for the paginated list endpoints (see CustomPaginator).
+
+    An exact COUNT(*) over a filtered queryset can cost more than the page
+    itself. Above PAGINATION_COUNT_ESTIMATE_THRESHOLD, the planner's row
+    estimate (EXPLAIN) is returned instead, flagged as an estimate.
+    Below, the exact count is memoized in the cache (short TTL) per query
+    signature, so that repeated filters do not re-count.
+    """
+
+    def get_count_cache_key(self) -> str:
+        sql, params = self.order_by().query.sql_with_params()
+        query_signature = f"{self.model._meta.label}:{sql}:{params!r}"
+        return "pagination_count:" + hashlib.md5(query_signature.encode()).hexdigest()
+
+    def get_row_estimate(self) -> int:
+        queryset = self.order_by()
+        if queryset.query.select_related:
+            queryset = queryset.select_related(None)
+        explain = json.loads(queryset.explain(format="json"))
+        return int(explain[0]["Plan"]["Plan Rows"])
+
+    def get_pagination_count(self) -> tuple[int, bool]:
+        """
+        Return (count, count_is_estimate)
+        """
+        count_cache_key = self.get_count_cache_key()
+        if not settings.TESTING:
+            count = cache.get(count_cache_key)
+            if count is not None:
+                return count, False
+        row_estimate = self.get_row_estimate()
+        if row_estimate >= constants.PAGINATION_COUNT_ESTIMATE_THRESHOLD:
+            return row_estimate, True
+        count = self.count()
+        if not settings.TESTING:
+            cache.set(
+                count_cache_key,
+                count,
+                timeout=constants.PAGINATION_COUNT_CACHE_TIMEOUT_SECONDS,
+            )
+        return count, False
@@ -4,6 +4,9 @@ from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import exception_handler
 
+from open_prices.common import response_cache
+from open_prices.common.identity_map import identity_map_scope
+
 
 def custom_exception_handler(exc: Exception, context: View):
     """
@@ -18,3 +21,49 @@ def custom_exception_handler(exc: Exception, context: View):
         return Response(data=data, status=status.HTTP_400_BAD_REQUEST)
 
     return response
+
+
+class IdentityMapMiddleware:
+    """
+    Request-scoped identity map (see common/identity_map.py)
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with identity_map_scope():
+            return self.get_response(request)
+
+
+class ResponseCacheMiddleware:
+    """
+    Cache of the anonymous GET responses (see common/response_cache.py)
+    - only the endpoints of RESPONSE_CACHE_ENDPOINT_DICT
+    - invalidated by the generation stamps of the models they depend on
+    - X-Cache response header: HIT or MISS
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.response_cache_key = None
+        response = self.get_response(request)
+        if request.response_cache_key:
+            response_cache.set_cached_response(request.response_cache_key, response)
+            response["X-Cache"] = "MISS"
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_name = request.resolver_match.view_name
+        if not response_cache.is_request_cacheable(request, view_name):
+            return None
+        cache_key = response_cache.get_response_cache_key(request, view_name)
+        response = response_cache.get_cached_response(request, cache_key)
+        response_cache.response_cache_stats.record(view_name, hit=response is not None)
+        if response is None:
+            request.response_cache_key = cache_key
+            return None
+        response["X-Cache"] = "HIT"
+        return response
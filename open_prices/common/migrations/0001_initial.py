@@ -0,0 +1,43 @@
+# Generated by Django 5.2.14 on 2026-10-17 07:19
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name="CounterDelta",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("target", models.CharField(max_length=100)),
+                ("object_id", models.CharField()),
+                ("field_name", models.CharField(max_length=100)),
+                ("delta", models.IntegerField()),
+                ("created", models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                "verbose_name": "Counter delta",
+                "verbose_name_plural": "Counter deltas",
+                "db_table": "counter_deltas",
+                "indexes": [
+                    models.Index(
+                        fields=["target", "object_id"],
+                        name="counter_del_target_33c9d7_idx",
+                    )
+                ],
+            },
+        ),
+    ]
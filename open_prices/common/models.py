@@ -0,0 +1,175 @@
+from collections import Counter, defaultdict
+from functools import partial
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import Case, F, Sum, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from django_q.tasks import async_task
+
+from open_prices.common import constants
+
+
+class CounterDeltaQuerySet(models.QuerySet):
+    def for_instance(self, instance, field_name_list: list[str] | None = None):
+        queryset = self.filter(
+            target=instance._meta.label_lower, object_id=str(instance.pk)
+        )
+        if field_name_list:
+            queryset = queryset.filter(field_name__in=field_name_list)
+        return queryset
+
+    def add(self, delta_list: list[tuple]):
+        """
+        Append counter deltas (instead of updating the target rows directly,
+        to avoid lock contention on popular rows).
+        - delta_list: list of (model, object_id, field_name, delta) tuples
+        - deltas without object_id are skipped
+        - deltas on the same row & field are merged
+        """
+        delta_counter = Counter()
+        for model, object_id, field_name, delta in delta_list:
+            if object_id:
+                delta_counter[
+                    (model._meta.label_lower, str(object_id), field_name)
+                ] += delta
+        counter_delta_list = [
+            self.model(
+                target=target, object_id=object_id, field_name=field_name, delta=delta
+            )
+            for (target, object_id, field_name), delta in delta_counter.items()
+            if delta
+        ]
+        if counter_delta_list:
+            self.bulk_create(counter_delta_list)
+            fold_counter_deltas_soon()
+
+    def fold(self, batch_size: int = constants.COUNTER_DELTA_FOLD_BATCH_SIZE):
+        """
+        Apply a batch of pending deltas to their target rows, then delete them
+        - 1 UPDATE per target table & field
+        - skip_locked: can run concurrently
+        - `updated` is bumped (conditional GET, see ConditionalGetMixin),
+        and so are the response cache generations (no signals)
+        Return the number of folded deltas.
+        """
+        from open_prices.common import response_cache
+
+        with transaction.atomic():
+            counter_delta_list = list(
+                self.select_for_update(skip_locked=True).order_by("id")[:batch_size]
+            )
+            delta_dict = defaultdict(Counter)
+            for counter_delta in counter_delta_list:
+                delta_dict[(counter_delta.target, counter_delta.field_name)][
+                    counter_delta.object_id
+                ] += counter_delta.delta
+            for (target, field_name), object_delta_counter in delta_dict.items():
+                model = apps.get_model(target)
+                update_kwargs = dict()
+                if any(field.name == "updated" for field in model._meta.fields):
+                    update_kwargs["updated"] = timezone.now()
+                # _base_manager: also update filtered out rows (e.g. draft proofs)
+                model._base_manager.filter(pk__in=object_delta_counter.keys()).update(
+                    **update_kwargs,
+                    **{
+                        field_name: Greatest(
+                            F(field_name)
+                            + Case(
+                                *[
+                                    When(pk=object_id, then=Value(delta))
+                                    for object_id, delta in object_delta_counter.items()
+                                ],
+                                default=Value(0),
+                                output_field=models.IntegerField(),
+                            ),
+                            Value(0),
+                        )
+                    },
+                )
+                if model._meta.label in constants.RESPONSE_CACHE_GENERATION_BUMP_DICT:
+                    transaction.on_commit(
+                        partial(response_cache.bump_generations, model._meta.label)
+                    )
+            self.filter(id__in=[cd.id for cd in counter_delta_list]).delete()
+        return len(counter_delta_list)
+
+    def discard(self, instance, field_name_list: list[str]):
+        """
+        Delete the pending deltas of an instance
+        Usage: before recalculating its counts (see update_*_count methods)
+        """
+        self.for_instance(instance, field_name_list).delete()
+
+    def pending_for(self, instance, field_name_list: list[str] | None = None):
+        """
+        Sum of the pending (not yet folded) deltas of an instance, by field
+        - 1 query
+        """
+        return dict(
+            self.for_instance(instance, field_name_list)
+            .values("field_name")
+            .annotate(delta_sum=Sum("delta"))
+            .values_list("field_name", "delta_sum")
+        )
+
+    def apply_pending(self, instance, field_name_list: list[str] | None = None):
+        """
+        Add the pending deltas to the in-memory count fields of the instance
+        (nothing is saved), to get exact counts on reads (see detail views).
+        Return the pending deltas (e.g. for the ETag).
+        """
+        pending_delta_dict = self.pending_for(instance, field_name_list)
+        for field_name, delta in pending_delta_dict.items():
+            setattr(instance, field_name, max(getattr(instance, field_name) + delta, 0))
+        return pending_delta_dict
+
+
+class CounterDelta(models.Model):
+    """
+    Append-only log of changes to the denormalized count fields
+    (price_count, proof_count, prediction_count).
+    Folded into the target rows in batches (see fold_counter_deltas_task):
+    the count fields are eventually consistent (up to the fold debounce and
+    the every-minute cron), except in sync mode where they are folded
+    right away. Detail reads stay exact by adding the pending deltas
+    (see CounterDeltaQuerySet.apply_pending).
+    """
+
+    target = models.CharField(max_length=100)  # model label, e.g. "proofs.proof"
+    object_id = models.CharField()
+    field_name = models.CharField(max_length=100)
+    delta = models.IntegerField()
+
+    created = models.DateTimeField(default=timezone.now)
+
+    objects = models.Manager.from_queryset(CounterDeltaQuerySet)()
+
+    class Meta:
+        db_table = "counter_deltas"
+        indexes = [
+            models.Index(fields=["target", "object_id"]),
+        ]
+        verbose_name = "Counter delta"
+        verbose_name_plural = "Counter deltas"
+
+
+def fold_counter_deltas_soon():
+    """
+    - sync mode (dev, tests): fold right away, so that counts stay exact
+    - else: enqueue a fold task once the transaction is committed (at most
+    once per debounce window). The cron task catches up on the rest.
+    """
+    if settings.Q_CLUSTER["sync"]:
+        CounterDelta.objects.fold()
+    elif cache.add(
+        constants.COUNTER_DELTA_FOLD_CACHE_KEY,
+        True,
+        timeout=constants.COUNTER_DELTA_FOLD_DEBOUNCE_SECONDS,
+    ):
+        transaction.on_commit(
+            lambda: async_task("open_prices.common.tasks.fold_counter_deltas_task")
+        )
@@ -1,5 +1,4 @@
 import datetime
-import functools
 import re
 from logging import getLogger
 
@@ -18,13 +17,10 @@ from openfoodfacts import (
     ProductDataset,
 )
 from openfoodfacts.images import generate_image_url
-from openfoodfacts.taxonomy import (
-    create_taxonomy_mapping,
-    get_taxonomy,
-    map_to_canonical_id,
-)
 from openfoodfacts.types import COUNTRY_CODE_TO_NAME, JSONType
 
+from open_prices.common.taxonomy import get_taxonomy_snapshot
+
 logger = getLogger(__name__)
 
 OFF_CREATE_FIELDS = [
@@ -43,15 +39,7 @@ OFF_CREATE_FIELDS = [
     "creator",
     "unique_scans_n",
 ]
-OFF_UPDATE_FIELDS = OFF_CREATE_FIELDS + ["source", "source_last_synced"]
-
-
-# Taxonomy mapping generation takes ~200ms, so we cache it to avoid
-# recomputing it for each request.
-_cached_create_taxonomy_mapping = functools.lru_cache()(create_taxonomy_mapping)
-# Also cache the get_taxonomy function to avoid reading from disk at each
-# request.
-_cached_get_taxonomy = functools.lru_cache()(get_taxonomy)
+OFF_UPDATE_FIELDS = OFF_CREATE_FIELDS + ["source", "source_last_synced", "updated"]
 
 
 def normalize_taxonomized_tags(taxonomy_type: str, value_tags: list[str]) -> list[str]:
@@ -68,21 +56,19 @@ def normalize_taxonomized_tags(taxonomy_type: str, value_tags: list[str]) -> lis
             f"Invalid taxonomy type: {taxonomy_type}. Expected one of 'category', 'label', or 'origin'."
         )
 
-    # Use the cached version of the get_taxonomy function to avoid
-    # creating it multiple times.
-    category_taxonomy = _cached_get_taxonomy(taxonomy_type)
+    # Taxonomy parsing & mapping generation takes ~200ms, so we use the
+    # compiled snapshot (memory-mapped, loaded at startup).
+    # See common/taxonomy.py
+    taxonomy_snapshot = get_taxonomy_snapshot(taxonomy_type)
     # the tag (category or label tag) can be provided by the mobile app in any
     # language, with language prefix (ex: `fr: Boissons`).
     # We need to map it to the canonical id (ex: `en:beverages`) to store it
     # in the database.
-    # The `map_to_canonical_id` function maps the value (ex:
+    # The `map_to_canonical_id` method maps the value (ex:
     # `fr: Boissons`) to the canonical id (ex: `en:beverages`).
-    # We use the cached version of this function to avoid
-    # creating it multiple times.
     # If the entry does not exist in the taxonomy, the tag will
     # be set to the tag version of the value (ex: `fr:boissons`).
-    taxonomy_mapping = _cached_create_taxonomy_mapping(category_taxonomy)
-    mapped_tags = map_to_canonical_id(taxonomy_mapping, value_tags)
+    mapped_tags = taxonomy_snapshot.map_to_canonical_id(value_tags)
     # Keep the order of the tags as they were provided
     return [mapped_tags[k] for k in mapped_tags]
 
@@ -99,20 +85,13 @@ def get_taxonomy_children_tags_from_parent_list(
 
     TODO: manage parent_list categories coming from different taxonomies (food & non-food)
     """
-    taxonomy = _cached_get_taxonomy(taxonomy_type)
+    taxonomy_snapshot = get_taxonomy_snapshot(taxonomy_type)
     children_tags = [] if not include_parent_list else parent_list.copy()
 
     for parent in parent_list:
-        parent_node = taxonomy[parent]
-
         # the parent node might not be in this taxonomy (e.g. non-food)
         # the parent node might not have children
-        if not (parent_node and parent_node.children):
-            continue
-
-        parent_children_node_list = parent_node.get_children_hierarchy()
-        parent_children_node_id_list = [node.id for node in parent_children_node_list]
-        children_tags.extend(parent_children_node_id_list)
+        children_tags.extend(taxonomy_snapshot.get_children_node_id_list(parent))
 
     # remove duplicates
     children_tags = list(set(children_tags))
@@ -344,7 +323,10 @@ def import_product_db(
             if existing_product_filter_qs_first:
                 products_to_update.append(
                     Product(
-                        **{"id": existing_product_filter_qs_first.id}, **product_dict
+                        **{"id": existing_product_filter_qs_first.id},
+                        **product_dict,
+                        # not set by bulk_update (auto_now)
+                        updated=product_dict["source_last_synced"],
                     )
                 )
                 updated_count += 1
@@ -0,0 +1,99 @@
+"""
+Mergeable quantile sketch (DDSketch-like, see https://arxiv.org/abs/1908.10693)
+
+Positive values are counted in logarithmic buckets: bucket i holds the
+values in (gamma^(i-1), gamma^i], with gamma = (1 + alpha) / (1 - alpha).
+Any quantile is then returned with a relative error of at most alpha.
+Values <= 0 are counted in a separate "zero" bucket.
+Two sketches are merged by adding their bucket counts: the sketches of
+the price rollups (see prices.models.PriceRollup) can be combined over
+any set of rows.
+"""
+
+import math
+
+from open_prices.common import constants
+
+
+def get_gamma(relative_accuracy: float) -> float:
+    return (1 + relative_accuracy) / (1 - relative_accuracy)
+
+
+def get_bucket_index(value: float, relative_accuracy: float) -> int:
+    """
+    Python mirror of the SQL expression used to fill the sketches
+    (see PriceRollupQuerySet.build_rollup_list)
+    """
+    return math.ceil(math.log(value) / math.log(get_gamma(relative_accuracy)))
+
+
+class QuantileSketch:
+    def __init__(
+        self,
+        zero_count: int = 0,
+        bucket_dict: dict | None = None,
+        relative_accuracy: float = constants.QUANTILE_SKETCH_RELATIVE_ACCURACY,
+    ):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = get_gamma(relative_accuracy)
+        self.zero_count = zero_count
+        self.bucket_dict = dict(bucket_dict or {})  # bucket index -> count
+
+    @classmethod
+    def from_json(cls, data: dict, **kwargs) -> "QuantileSketch":
+        return cls(
+            zero_count=data.get("zero", 0),
+            # JSON keys are strings
+            bucket_dict={
+                int(index): count for index, count in data.get("bins", {}).items()
+            },
+            **kwargs,
+        )
+
+    def to_json(self) -> dict:
+        return {
+            "zero": self.zero_count,
+            "bins": {
+                str(index): count for index, count in sorted(self.bucket_dict.items())
+            },
+        }
+
+    @property
+    def count(self) -> int:
+        return self.zero_count + sum(self.bucket_dict.values())
+
+    def add(self, value: float, count: int = 1) -> None:
+        if value <= 0:
+            self.zero_count += count
+        else:
+            index = get_bucket_index(value, self.relative_accuracy)
+            self.bucket_dict[index] = self.bucket_dict.get(index, 0) + count
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge sketches with different accuracies")
+        self.zero_count += other.zero_count
+        for index, count in other.bucket_dict.items():
+            self.bucket_dict[index] = self.bucket_dict.get(index, 0) + count
+        return self
+
+    def get_bucket_value(self, index: int) -> float:
+        # middle of the bucket (relative error <= alpha on both sides)
+        return 2 * self.gamma**index / (self.gamma + 1)
+
+    def quantile(self, q: float) -> float | None:
+        """
+        Value at quantile q (0 <= q <= 1), None if the sketch is empty
+        """
+        count = self.count
+        if not count:
+            return None
+        rank = q * (count - 1)
+        cumulative_count = self.zero_count
+        if rank < cumulative_count:
+            return 0.0
+        for index in sorted(self.bucket_dict):
+            cumulative_count += self.bucket_dict[index]
+            if rank < cumulative_count:
+                return self.get_bucket_value(index)
+        return self.get_bucket_value(max(self.bucket_dict))
@@ -0,0 +1,173 @@
+import hashlib
+import logging
+import threading
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpRequest, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe, urlencode
+
+from open_prices.common import constants
+from open_prices.common.authentication import has_token_from_cookie_or_header
+
+logger = logging.getLogger(__name__)
+
+GENERATION_CACHE_KEY_PREFIX = "response_cache_generation"
+RESPONSE_CACHE_KEY_PREFIX = "response_cache"
+# responses are only cached for requests without credentials
+ANONYMOUS_OWNER = "anonymous"
+# conditional GET validators (see api.utils.ConditionalGetMixin)
+CACHED_HEADER_LIST = ["ETag", "Last-Modified"]
+
+
+def get_generation_cache_key(model_label: str) -> str:
+    return f"{GENERATION_CACHE_KEY_PREFIX}:{model_label}"
+
+
+def get_generation_list(model_label_list: list[str]) -> list[str]:
+    """
+    Current generation stamps of the models (1 cache round-trip).
+    Missing stamps (never bumped, or evicted) are initialized with a new
+    random stamp: an evicted stamp never matches older entries again.
+    """
+    key_list = [get_generation_cache_key(label) for label in model_label_list]
+    generation_dict = cache.get_many(key_list)
+    for key in key_list:
+        if key not in generation_dict:
+            cache.add(key, uuid.uuid4().hex, timeout=None)
+            generation_dict[key] = cache.get(key)
+    return [generation_dict[key] for key in key_list]
+
+
+def bump_generations(model_label: str) -> None:
+    """
+    A model was written: invalidate the cached responses depending on it
+    (see RESPONSE_CACHE_GENERATION_BUMP_DICT)
+    """
+    cache.set_many(
+        {
+            get_generation_cache_key(label): uuid.uuid4().hex
+            for label in constants.RESPONSE_CACHE_GENERATION_BUMP_DICT[model_label]
+        },
+        timeout=None,
+    )
+
+
+def model_post_save_or_delete_bump_generations(sender, instance, **kwargs):
+    # after the commit: a concurrent request could otherwise cache the
+    # previous rows with the new stamp
+    transaction.on_commit(lambda: bump_generations(sender._meta.label))
+
+
+def get_normalized_query_string(request: HttpRequest) -> str:
+    # sorted keys (?a=1&b=2 == ?b=2&a=1), values order kept (order_by)
+    return urlencode(sorted(request.GET.lists()), doseq=True)
+
+
+def get_response_cache_key(request: HttpRequest, view_name: str) -> str:
+    generation_list = get_generation_list(
+        constants.RESPONSE_CACHE_ENDPOINT_DICT[view_name]
+    )
+    request_signature = "|".join(
+        [request.path, get_normalized_query_string(request), *generation_list]
+    )
+    return ":".join(
+        [
+            RESPONSE_CACHE_KEY_PREFIX,
+            view_name,
+            ANONYMOUS_OWNER,
+            hashlib.md5(request_signature.encode()).hexdigest(),
+        ]
+    )
+
+
+def is_request_cacheable(request: HttpRequest, view_name: str | None) -> bool:
+    return (
+        settings.RESPONSE_CACHE_ENABLED
+        and request.method == "GET"
+        and view_name in constants.RESPONSE_CACHE_ENDPOINT_DICT
+        # authenticated responses can depend on the owner
+        and not has_token_from_cookie_or_header(request)
+    )
+
+
+def get_cached_response(request: HttpRequest, cache_key: str) -> HttpResponse | None:
+    """
+    Return the cached response, or a 304 if the client copy matches
+    its validators (If-None-Match / If-Modified-Since)
+    """
+    entry = cache.get(cache_key)
+    if entry is None:
+        return None
+    status, content_type, content, header_dict = entry
+    response = HttpResponse(content, status=status, content_type=content_type)
+    for header, value in header_dict.items():
+        response[header] = value
+    return get_conditional_response(
+        request,
+        etag=header_dict.get("ETag"),
+        last_modified=parse_http_date_safe(header_dict.get("Last-Modified", "")),
+        response=response,
+    )
+
+
+def set_cached_response(cache_key: str, response: HttpResponse) -> None:
+    if response.status_code != 200 or response.streaming:
+        return
+    header_dict = {
+        header: response[header] for header in CACHED_HEADER_LIST if header in response
+    }
+    cache.set(
+        cache_key,
+        (response.status_code, response["Content-Type"], response.content, header_dict),
+        timeout=constants.RESPONSE_CACHE_TIMEOUT_SECONDS,
+    )
+
+
+class ResponseCacheStats:
+    """
+    Per-process hit/miss counters, per endpoint (view name),
+    logged every RESPONSE_CACHE_STATS_LOG_INTERVAL lookups
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits = defaultdict(int)
+        self.misses = defaultdict(int)
+
+    def record(self, view_name: str, hit: bool) -> None:
+        with self.lock:
+            if hit:
+                self.hits[view_name] += 1
+            else:
+                self.misses[view_name] += 1
+            lookups = sum(self.hits.values()) + sum(self.misses.values())
+            if lookups % constants.RESPONSE_CACHE_STATS_LOG_INTERVAL == 0:
+                logger.info("Response cache stats: %s", self._stats())
+
+    def clear(self) -> None:
+        with self.lock:
+            self.hits.clear()
+            self.misses.clear()
+
+    def _stats(self) -> dict:
+        stats = dict()
+        for view_name in sorted(set(self.hits) | set(self.misses)):
+            hits, misses = self.hits[view_name], self.misses[view_name]
+            stats[view_name] = {
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": round(hits / (hits + misses), 4),
+            }
+        return stats
+
+    def stats(self) -> dict:
+        with self.lock:
+            return self._stats()
+
+
+response_cache_stats = ResponseCacheStats()
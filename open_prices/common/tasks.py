@@ -12,13 +12,20 @@ from open_prices.api.prices.serializers import PriceSerializer
 from open_prices.api.proofs.serializers import ProofSerializer
 from open_prices.badges.models import Badge
 from open_prices.challenges.models import Challenge
+from open_prices.common import constants
 from open_prices.common.history import history_clean_duplicate_command
+from open_prices.common.models import CounterDelta
 from open_prices.common.openfoodfacts import import_product_db
 from open_prices.common.utils import export_model_to_jsonl_gz
 from open_prices.locations.models import Location
 from open_prices.moderation import rules as moderation_rules
 from open_prices.moderation.rules import create_flags_from_price_outliers
-from open_prices.prices.models import Price, PriceStatistics5y
+from open_prices.prices.models import (
+    Price,
+    PriceHistoryBucket,
+    PriceRollup,
+    PriceStatistics5y,
+)
 from open_prices.products.models import Product
 from open_prices.proofs.models import Proof
 from open_prices.stats.models import TotalStats
@@ -58,6 +65,15 @@ def import_all_product_db_task():
     import_opf_db_task()
 
 
+def fold_counter_deltas_task():
+    """
+    Apply the pending counter deltas to the denormalized counts
+    (loop until there is less than a batch left)
+    """
+    while CounterDelta.objects.fold() == constants.COUNTER_DELTA_FOLD_BATCH_SIZE:
+        pass
+
+
 def update_total_stats_task():
     TotalStats.update_task()
 
@@ -136,6 +152,19 @@ def create_flags_from_price_outliers_and_update_view():
     PriceStatistics5y.refresh_materialized_view()
 
 
+def rebuild_price_rollups_task():
+    """
+    Recalculate the price rollups & history buckets (see PriceRollup &
+    PriceHistoryBucket): catches up on the writes that bypass the signals
+    (queryset updates, location country changes, failed tasks...)
+    """
+    rollup_count = PriceRollup.objects.rebuild()
+    bucket_count = PriceHistoryBucket.objects.rebuild()
+    logger.info(
+        f"Rebuilt {rollup_count} price rollups & {bucket_count} history buckets"
+    )
+
+
 CRON_SCHEDULES = {
     "import_obf_db_task": ("0 15 * * *", {}),  # daily at 15:00
     "import_opff_db_task": ("10 15 * * *", {}),  # daily at 15:10
@@ -153,6 +182,7 @@ CRON_SCHEDULES = {
     "update_user_counts_task": ("0 2 * * *", {}),  # daily at 02:00
     "update_badge_task": ("5 2 * * *", {}),  # daily at 02:05
     "update_total_stats_task": ("10 2 * * *", {}),  # daily at 02:10
+    "rebuild_price_rollups_task": ("15 2 * * *", {}),  # daily at 02:15
     "update_location_counts_task": (
         "20 2 * * 1",  # every start of the week (at 02:20)
         {},
@@ -162,6 +192,7 @@ CRON_SCHEDULES = {
         {"timeout": 10 * 60 * 60},  # 10 hours
     ),
     "proof_draft_cleanup_task": ("*/5 * * * *", {}),  # every 5 minutes
+    "fold_counter_deltas_task": ("* * * * *", {}),  # every minute
 }
 
 for task_name, (task_cron, q_options) in CRON_SCHEDULES.items():
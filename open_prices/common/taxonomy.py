@@ -0,0 +1,326 @@
+import logging
+import mmap
+import struct
+import threading
+import zlib
+from pathlib import Path
+
+from django.conf import settings
+from openfoodfacts.taxonomy import (
+    Taxonomy,
+    create_taxonomy_mapping,
+    get_tag,
+    get_taxonomy,
+)
+
+from open_prices.common import constants
+
+logger = logging.getLogger(__name__)
+
+# magic, version, node count, edge count, key count,
+# key slot count, node slot count
+SNAPSHOT_HEADER = struct.Struct("<4sIIIIII")
+SNAPSHOT_MAGIC = b"OPTX"
+SNAPSHOT_VERSION = 1
+EMPTY_SLOT = -1
+
+
+def _pad(buffer: bytes) -> bytes:
+    # keep every section 4-byte aligned (memoryview.cast)
+    return buffer + b"\0" * (-len(buffer) % 4)
+
+
+def _pack_strings(string_list: list[str]) -> tuple[bytes, bytes]:
+    """
+    Return (offsets, blob): string i is blob[offsets[i]:offsets[i + 1]]
+    """
+    encoded_list = [string.encode() for string in string_list]
+    offset_list = [0]
+    for encoded in encoded_list:
+        offset_list.append(offset_list[-1] + len(encoded))
+    return struct.pack(f"<{len(offset_list)}I", *offset_list), b"".join(encoded_list)
+
+
+def _build_hash_table(encoded_key_list: list[bytes]) -> list[int]:
+    """
+    Open addressing (linear probing) hash table: slot -> key index.
+    Sized to the next power of 2 with a load factor <= 0.5
+    """
+    slot_count = 1
+    while slot_count < 2 * max(len(encoded_key_list), 1):
+        slot_count *= 2
+    slot_list = [EMPTY_SLOT] * slot_count
+    for index, encoded_key in enumerate(encoded_key_list):
+        slot = zlib.crc32(encoded_key) & (slot_count - 1)
+        while slot_list[slot] != EMPTY_SLOT:
+            slot = (slot + 1) & (slot_count - 1)
+        slot_list[slot] = index
+    return slot_list
+
+
+def build_taxonomy_snapshot(taxonomy: Taxonomy) -> bytes:
+    """
+    Compile a taxonomy into a compact binary snapshot:
+    - interned node ids (node index -> canonical tag)
+    - synonym -> node index hash table (see create_taxonomy_mapping)
+    - node id -> node index hash table
+    - children adjacency array (CSR: child_offsets + child_indexes)
+    """
+    node_id_list = sorted(node.id for node in taxonomy.iter_nodes())
+    node_index_dict = {node_id: index for index, node_id in enumerate(node_id_list)}
+
+    # synonyms (names & synonyms in every language) -> canonical node index
+    taxonomy_mapping = create_taxonomy_mapping(taxonomy)
+    key_list = sorted(taxonomy_mapping)
+    key_node_list = [node_index_dict[taxonomy_mapping[key]] for key in key_list]
+
+    child_offset_list = [0]
+    child_index_list = list()
+    for node_id in node_id_list:
+        child_index_list.extend(
+            node_index_dict[child.id] for child in taxonomy[node_id].children
+        )
+        child_offset_list.append(len(child_index_list))
+
+    node_offsets, node_blob = _pack_strings(node_id_list)
+    key_offsets, key_blob = _pack_strings(key_list)
+    key_slot_list = _build_hash_table([key.encode() for key in key_list])
+    node_slot_list = _build_hash_table([node_id.encode() for node_id in node_id_list])
+
+    header = SNAPSHOT_HEADER.pack(
+        SNAPSHOT_MAGIC,
+        SNAPSHOT_VERSION,
+        len(node_id_list),
+        len(child_index_list),
+        len(key_list),
+        len(key_slot_list),
+        len(node_slot_list),
+    )
+    return b"".join(
+        [
+            header,
+            node_offsets,
+            _pad(node_blob),
+            key_offsets,
+            _pad(key_blob),
+            struct.pack(f"<{len(key_node_list)}I", *key_node_list),
+            struct.pack(f"<{len(key_slot_list)}i", *key_slot_list),
+            struct.pack(f"<{len(node_slot_list)}i", *node_slot_list),
+            struct.pack(f"<{len(child_offset_list)}I", *child_offset_list),
+            struct.pack(f"<{len(child_index_list)}I", *child_index_list),
+        ]
+    )
+
+
+class TaxonomySnapshot:
+    """
+    Read-only view over a compiled taxonomy snapshot (see
+    build_taxonomy_snapshot). When opened from a file, the snapshot is
+    memory-mapped: the pages are shared by all the processes (gunicorn &
+    django-q workers) through the OS page cache.
+    """
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        view = memoryview(buffer)
+        if len(view) < SNAPSHOT_HEADER.size:
+            raise ValueError("Invalid taxonomy snapshot (too short)")
+        (
+            magic,
+            version,
+            node_count,
+            edge_count,
+            key_count,
+            key_slot_count,
+            node_slot_count,
+        ) = SNAPSHOT_HEADER.unpack_from(view)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise ValueError("Invalid taxonomy snapshot (magic or version mismatch)")
+        self.node_count = node_count
+        self.key_count = key_count
+
+        position = SNAPSHOT_HEADER.size
+
+        def read_section(length: int, format: str | None = None):
+            nonlocal position
+            section = view[position : position + length]
+            position += length + (-length % 4)
+            return section.cast(format) if format else section
+
+        self.node_offsets = read_section(4 * (node_count + 1), "I")
+        self.node_blob = read_section(self.node_offsets[-1])
+        self.key_offsets = read_section(4 * (key_count + 1), "I")
+        self.key_blob = read_section(self.key_offsets[-1])
+        self.key_nodes = read_section(4 * key_count, "I")
+        self.key_slots = read_section(4 * key_slot_count, "i")
+        self.node_slots = read_section(4 * node_slot_count, "i")
+        self.child_offsets = read_section(4 * (node_count + 1), "I")
+        self.child_indexes = read_section(4 * edge_count, "I")
+
+    @classmethod
+    def from_path(cls, path: Path) -> "TaxonomySnapshot":
+        with open(path, "rb") as f:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    @classmethod
+    def from_taxonomy(cls, taxonomy: Taxonomy) -> "TaxonomySnapshot":
+        return cls(build_taxonomy_snapshot(taxonomy))
+
+    def get_node_id(self, node_index: int) -> str:
+        return bytes(
+            self.node_blob[
+                self.node_offsets[node_index] : self.node_offsets[node_index + 1]
+            ]
+        ).decode()
+
+    def _lookup(self, slots, offsets, blob, key: str) -> int | None:
+        encoded_key = key.encode()
+        slot_mask = len(slots) - 1
+        slot = zlib.crc32(encoded_key) & slot_mask
+        while (index := slots[slot]) != EMPTY_SLOT:
+            if blob[offsets[index] : offsets[index + 1]] == encoded_key:
+                return index
+            slot = (slot + 1) & slot_mask
+        return None
+
+    def get_node_index(self, node_id: str) -> int | None:
+        return self._lookup(self.node_slots, self.node_offsets, self.node_blob, node_id)
+
+    def get_canonical_id(self, tag: str) -> str | None:
+        """
+        Synonym tag (ex: "fr:boissons") -> canonical id (ex: "en:beverages")
+        """
+        key_index = self._lookup(self.key_slots, self.key_offsets, self.key_blob, tag)
+        if key_index is None:
+            return None
+        return self.get_node_id(self.key_nodes[key_index])
+
+    def map_to_canonical_id(self, value_list: list[str]) -> dict[str, str]:
+        """
+        Same output as openfoodfacts.taxonomy.map_to_canonical_id
+        """
+        for value in value_list:
+            if len(value) < 3 or value[2] != ":":
+                raise ValueError(
+                    f"Invalid value: '{value}', expected value to be in 'lang:tag' format"
+                )
+
+        output = dict()
+        for value in value_list:
+            tag = get_tag(value)
+            output[value] = (
+                self.get_canonical_id(tag)
+                # language-independent entry
+                or self.get_canonical_id(f"xx:{tag[3:]}")
+                or tag
+            )
+        return output
+
+    def get_children_node_id_list(self, node_id: str) -> list[str]:
+        """
+        All the children (direct and indirect) of a node.
+        Empty if the node is not in the taxonomy.
+        """
+        node_index = self.get_node_index(node_id)
+        if node_index is None:
+            return []
+        seen_node_index_set = set()
+        node_index_stack = [node_index]
+        while node_index_stack:
+            parent_index = node_index_stack.pop()
+            for child_index in self.child_indexes[
+                self.child_offsets[parent_index] : self.child_offsets[parent_index + 1]
+            ]:
+                if child_index not in seen_node_index_set:
+                    seen_node_index_set.add(child_index)
+                    node_index_stack.append(child_index)
+        return [self.get_node_id(index) for index in seen_node_index_set]
+
+
+_taxonomy_snapshot_dict: dict[str, TaxonomySnapshot] = dict()
+_taxonomy_snapshot_lock = threading.Lock()
+
+
+def get_taxonomy_snapshot_path(taxonomy_type: str) -> Path:
+    return Path(settings.TAXONOMY_SNAPSHOT_DIR) / f"off-{taxonomy_type}.bin"
+
+
+def write_taxonomy_snapshot(taxonomy_type: str, force_download: bool = False) -> Path:
+    """
+    Compile the (downloaded) taxonomy into its snapshot file.
+    The file is replaced atomically: processes that already mapped the
+    previous snapshot keep reading it until they are restarted.
+    """
+    taxonomy = get_taxonomy(taxonomy_type, force_download=force_download)
+    path = get_taxonomy_snapshot_path(taxonomy_type)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".bin.tmp")
+    tmp_path.write_bytes(build_taxonomy_snapshot(taxonomy))
+    tmp_path.replace(path)
+    return path
+
+
+def load_taxonomy_snapshot(
+    taxonomy_type: str, fallback: bool = True
+) -> TaxonomySnapshot | None:
+    """
+    Memory-map the snapshot file of a taxonomy.
+    If the file is missing (build_taxonomy_snapshot command not run), and
+    fallback is True, compile the snapshot in memory from the taxonomy
+    (slow: parse + mapping generation).
+    """
+    path = get_taxonomy_snapshot_path(taxonomy_type)
+    if path.exists():
+        try:
+            return TaxonomySnapshot.from_path(path)
+        except ValueError:
+            logger.warning("Invalid taxonomy snapshot %s, ignoring it", path)
+    if not fallback:
+        return None
+    logger.warning(
+        "No taxonomy snapshot for %s (%s), compiling it in memory "
+        "(run the build_taxonomy_snapshot command)",
+        taxonomy_type,
+        path,
+    )
+    return TaxonomySnapshot.from_taxonomy(get_taxonomy(taxonomy_type))
+
+
+def get_taxonomy_snapshot(taxonomy_type: str) -> TaxonomySnapshot:
+    taxonomy_snapshot = _taxonomy_snapshot_dict.get(taxonomy_type)
+    if taxonomy_snapshot is None:
+        with _taxonomy_snapshot_lock:
+            if taxonomy_type not in _taxonomy_snapshot_dict:
+                _taxonomy_snapshot_dict[taxonomy_type] = load_taxonomy_snapshot(
+                    taxonomy_type
+                )
+            taxonomy_snapshot = _taxonomy_snapshot_dict[taxonomy_type]
+    return taxonomy_snapshot
+
+
+def warm_taxonomy_snapshots() -> None:
+    """
+    Called at startup (see CommonConfig.ready): map the snapshot files,
+    so that the first request does not pay the loading cost.
+    Missing snapshots are left to be compiled lazily (no download at
+    startup), with a warning: the image should ship them.
+    """
+    for taxonomy_type in constants.TAXONOMY_SNAPSHOT_TYPE_LIST:
+        if taxonomy_type in _taxonomy_snapshot_dict:
+            continue
+        taxonomy_snapshot = load_taxonomy_snapshot(taxonomy_type, fallback=False)
+        if taxonomy_snapshot is None:
+            logger.warning(
+                "No taxonomy snapshot for %s (%s): it will be compiled in memory "
+                "by each process (slow)",
+                taxonomy_type,
+                get_taxonomy_snapshot_path(taxonomy_type),
+            )
+            continue
+        with _taxonomy_snapshot_lock:
+            _taxonomy_snapshot_dict.setdefault(taxonomy_type, taxonomy_snapshot)
+
+
+def clear_taxonomy_snapshots() -> None:
+    with _taxonomy_snapshot_lock:
+        _taxonomy_snapshot_dict.clear()
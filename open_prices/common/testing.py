@@ -0,0 +1,32 @@
+from open_prices.challenges.matcher import get_challenge_matcher
+from open_prices.locations.models import location_id_cache
+from open_prices.products.models import product_id_cache
+
+
+def reset_process_caches():
+    """
+    Reset the per-process caches: unlike the database, they are not
+    rolled back between tests
+    """
+    get_challenge_matcher().reset()
+    product_id_cache.clear()
+    location_id_cache.clear()
+
+
+class ProcessCacheResetMixin:
+    """
+    Test case mixin: reset the per-process caches before setUpTestData,
+    and before & after each test.
+    Usage: the test cases relying on the challenge matcher, or committing
+    transactions (the id caches are only filled on commit)
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        reset_process_caches()
+        super().setUpClass()
+
+    def setUp(self):
+        reset_process_caches()
+        self.addCleanup(reset_process_caches)
+        super().setUp()
@@ -1,24 +1,65 @@
+import multiprocessing
+import tempfile
 from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
 
 from django.conf import settings
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
 from django.urls import reverse
+from freezegun import freeze_time
+from openfoodfacts.taxonomy import (
+    create_taxonomy_mapping,
+    get_taxonomy,
+    map_to_canonical_id,
+)
 from rest_framework.test import APIRequestFactory
 
+from open_prices.common import identity_map
 from open_prices.common import openfoodfacts as common_openfoodfacts
 from open_prices.common.authentication import (
     get_token_from_cookie,
     get_token_from_header,
     has_token_from_cookie_or_header,
 )
+from open_prices.common.id_cache import IdResolutionCache
+from open_prices.common.management.commands.audit_filter_indexes import (
+    get_seq_scan_list,
+    get_url_from_line,
+)
+from open_prices.common.models import CounterDelta
+from open_prices.common.quantile_sketch import QuantileSketch
+from open_prices.common.response_cache import (
+    bump_generations,
+    response_cache_stats,
+)
+from open_prices.common.taxonomy import (
+    TaxonomySnapshot,
+    get_taxonomy_snapshot,
+    load_taxonomy_snapshot,
+    warm_taxonomy_snapshots,
+    write_taxonomy_snapshot,
+)
+from open_prices.common.testing import ProcessCacheResetMixin
 from open_prices.common.utils import (
+    get_related_object,
     is_float,
     match_decimal_with_float,
     truncate_decimal,
     url_add_missing_https,
     url_keep_only_domain,
 )
+from open_prices.locations.factories import LocationFactory
+from open_prices.locations.models import Location
+from open_prices.prices.factories import PriceFactory
+from open_prices.prices.models import Price
+from open_prices.products.models import Product
+from open_prices.proofs.factories import ProofFactory
+from open_prices.proofs.models import Proof
 from open_prices.users.factories import SessionFactory
+from open_prices.users.models import User
 
 PRICE_8001505005707 = {
     "product_code": "8001505005707",
@@ -195,6 +236,161 @@ class OpenFoodFactsTest(TestCase):
             self.assertEqual(result, expected_result)
 
 
+class TaxonomySnapshotTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # not in setUpTestData: memoryviews can't be deep-copied
+        cls.taxonomy = get_taxonomy("category")
+        cls.taxonomy_snapshot = TaxonomySnapshot.from_taxonomy(cls.taxonomy)
+
+    def test_map_to_canonical_id(self):
+        value_list = [
+            "en:apples",
+            "fr: Pommes",
+            "FR:Tomates",
+            "fr:soupe-aux-lentilles",
+            "en:unknown-category",
+        ]
+        self.assertEqual(
+            self.taxonomy_snapshot.map_to_canonical_id(value_list),
+            map_to_canonical_id(create_taxonomy_mapping(self.taxonomy), value_list),
+        )
+        self.assertRaises(
+            ValueError, self.taxonomy_snapshot.map_to_canonical_id, ["apples"]
+        )
+
+    def test_get_children_node_id_list(self):
+        for node in self.taxonomy.iter_nodes():
+            with self.subTest(node_id=node.id):
+                self.assertEqual(
+                    sorted(self.taxonomy_snapshot.get_children_node_id_list(node.id)),
+                    sorted(child.id for child in node.get_children_hierarchy()),
+                )
+        self.assertEqual(
+            self.taxonomy_snapshot.get_children_node_id_list("en:unknown-category"), []
+        )
+
+    def test_snapshot_file(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with override_settings(TAXONOMY_SNAPSHOT_DIR=tmp_dir):
+                self.assertIsNone(load_taxonomy_snapshot("category", fallback=False))
+                path = write_taxonomy_snapshot("category")
+                taxonomy_snapshot = load_taxonomy_snapshot("category", fallback=False)
+                self.assertEqual(
+                    taxonomy_snapshot.get_canonical_id("fr:pommes"), "en:apples"
+                )
+                self.assertEqual(taxonomy_snapshot.node_count, len(self.taxonomy))
+                # invalid file: ignored
+                path.write_bytes(b"invalid")
+                self.assertIsNone(load_taxonomy_snapshot("category", fallback=False))
+
+    def test_warm_missing_snapshot_logs_warning(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with (
+                override_settings(TAXONOMY_SNAPSHOT_DIR=tmp_dir),
+                patch.dict(
+                    "open_prices.common.taxonomy._taxonomy_snapshot_dict", clear=True
+                ),
+            ):
+                with self.assertLogs(
+                    "open_prices.common.taxonomy", level="WARNING"
+                ) as logs:
+                    warm_taxonomy_snapshots()
+                self.assertIn("No taxonomy snapshot for category", logs.output[0])
+
+    def test_get_taxonomy_snapshot(self):
+        self.assertIs(
+            get_taxonomy_snapshot("category"), get_taxonomy_snapshot("category")
+        )
+        self.assertEqual(
+            common_openfoodfacts.normalize_taxonomized_tags("category", ["fr:pommes"]),
+            ["en:apples"],
+        )
+        self.assertCountEqual(
+            common_openfoodfacts.get_taxonomy_children_tags_from_parent_list(
+                "category", ["en:spreads", "en:fats"], include_parent_list=True
+            ),
+            [
+                "en:spreads",
+                "en:fats",
+                "en:sweet-spreads",
+                "en:hazelnut-spreads",
+                "en:chocolate-spreads",
+                "en:cocoa-and-hazelnuts-spreads",
+            ],
+        )
+
+
+class AuditFilterIndexesCommandTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        PriceFactory()
+
+    def test_get_url_from_line(self):
+        self.assertEqual(
+            get_url_from_line(
+                '1.2.3.4 - - [17/Oct/2026:09:00:00 +0000] "GET /api/v1/prices?product_code=123 HTTP/1.1" 200 512'  # noqa
+            ),
+            "/api/v1/prices?product_code=123",
+        )
+        self.assertEqual(get_url_from_line("/api/v1/proofs\n"), "/api/v1/proofs")
+        self.assertIsNone(get_url_from_line("POST something"))
+
+    def test_get_seq_scan_list(self):
+        plan = {
+            "Node Type": "Limit",
+            "Plans": [
+                {
+                    "Node Type": "Seq Scan",
+                    "Relation Name": "prices",
+                    "Actual Rows": 10,
+                    "Rows Removed by Filter": 990,
+                    "Actual Loops": 1,
+                },
+                {"Node Type": "Seq Scan", "Relation Name": "products", "Plan Rows": 5},
+            ],
+        }
+        self.assertEqual(get_seq_scan_list(plan, 100), [("prices", 1000)])
+        self.assertEqual(
+            get_seq_scan_list(plan, 0), [("prices", 1000), ("products", 5)]
+        )
+
+    def test_command(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".log") as f:
+            f.write(
+                "\n".join(
+                    [
+                        '"GET /api/v1/prices?product_code=123&order_by=-date HTTP/1.1"',
+                        "/api/v1/proofs?tags__contains=challenge-1&page=2",
+                        "/api/v1/prices?location_id=abc",  # invalid filter
+                        "/api/v1/prices/1",  # not a list endpoint
+                        "/unknown",
+                    ]
+                )
+            )
+            f.flush()
+            for extra_args in [[], ["--no-analyze"]]:
+                with self.subTest(extra_args=extra_args):
+                    output = StringIO()
+                    call_command(
+                        "audit_filter_indexes",
+                        f.name,
+                        "--slow-ms=0",
+                        *extra_args,
+                        stdout=output,
+                    )
+                    summary = output.getvalue().splitlines()[-1]
+                    if extra_args:  # no execution time
+                        self.assertIn("Queries: 2 (3 skipped), slow: 0", summary)
+                    else:
+                        self.assertIn("Queries: 2 (3 skipped), slow: 2", summary)
+                        self.assertIn(
+                            "/api/v1/prices?product_code=123&order_by=-date",
+                            output.getvalue(),
+                        )
+
+
 class UtilsTest(TestCase):
     @classmethod
     def setUpTestData(cls):
@@ -256,3 +452,385 @@ class UtilsTest(TestCase):
             url_keep_only_domain("abc.hostname.com"),
             "https://abc.hostname.com",
         )
+
+
+class IdentityMapTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.location = LocationFactory()
+        cls.price_list = PriceFactory.create_batch(
+            2,
+            location_osm_id=cls.location.osm_id,
+            location_osm_type=cls.location.osm_type,
+        )
+
+    def test_identity_map_scope(self):
+        # outside of a scope: nothing is shared
+        identity_map.add_object(self.location)
+        self.assertIsNone(identity_map.get_object(Location, self.location.id))
+        with identity_map.identity_map_scope():
+            identity_map.add_object(self.location)
+            self.assertIs(
+                identity_map.get_object(Location, str(self.location.id)),
+                self.location,
+            )
+            # nested scope (e.g. sync task): starts empty
+            with identity_map.identity_map_scope():
+                self.assertIsNone(identity_map.get_object(Location, self.location.id))
+            self.assertIs(
+                identity_map.get_object(Location, self.location.id), self.location
+            )
+        self.assertIsNone(identity_map.get_object(Location, self.location.id))
+
+    def test_task_scope(self):
+        with identity_map.identity_map_scope():
+            identity_map.add_object(self.location)
+            identity_map.task_pre_execute(sender="django_q", func=None, task={})
+            self.assertIsNone(identity_map.get_object(Location, self.location.id))
+            identity_map.task_post_execute(sender="django_q", func=None, task={})
+            self.assertIs(
+                identity_map.get_object(Location, self.location.id), self.location
+            )
+
+    def test_get_related_object(self):
+        price_1, price_2 = (Price.objects.get(id=price.id) for price in self.price_list)
+        with identity_map.identity_map_scope():
+            with self.assertNumQueries(1):
+                location = get_related_object(price_1, "location")
+                self.assertEqual(location, self.location)
+                self.assertIs(get_related_object(price_2, "location"), location)
+                self.assertIs(price_2.location, location)
+
+
+class IdResolutionCacheTest(TestCase):
+    def test_get_set(self):
+        cache = IdResolutionCache("test", max_size=10)
+        self.assertIsNone(cache.get("a"))
+        cache.set("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(
+            cache.stats(),
+            {
+                "name": "test",
+                "size": 1,
+                "max_size": 10,
+                "hits": 1,
+                "misses": 1,
+                "hit_rate": 0.5,
+            },
+        )
+
+    def test_lru_eviction(self):
+        cache = IdResolutionCache("test", max_size=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")  # "b" is now the least recently used
+        cache.set("c", 3)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(cache.stats()["size"], 2)
+
+    def test_delete(self):
+        cache = IdResolutionCache("test")
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.delete("a")
+        cache.delete_id(2)
+        self.assertIsNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+
+    def test_max_age(self):
+        cache = IdResolutionCache("test", max_age_seconds=60)
+        with freeze_time("2025-01-01 00:00:00"):
+            cache.set("a", 1)
+        with freeze_time("2025-01-01 00:00:30"):
+            self.assertEqual(cache.get("a"), 1)
+        with freeze_time("2025-01-01 00:02:00"):
+            self.assertIsNone(cache.get("a"))
+
+    def test_set_on_commit(self):
+        cache = IdResolutionCache("test")
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            cache.set_on_commit("a", 1)
+        self.assertIsNone(cache.get("a"))  # rolled back
+        with self.captureOnCommitCallbacks(execute=True):
+            cache.set_on_commit("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(len(callbacks), 1)
+
+
+@override_settings(Q_CLUSTER={**settings.Q_CLUSTER, "sync": False})
+class CounterDeltaTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user_session = SessionFactory()
+        cls.location = LocationFactory()
+        cls.proof = ProofFactory(
+            location_osm_id=cls.location.osm_id,
+            location_osm_type=cls.location.osm_type,
+            owner=cls.user_session.user.user_id,
+        )
+
+    def test_counter_delta_add_and_fold(self):
+        # proof: user & location proof_count deltas
+        self.assertEqual(CounterDelta.objects.count(), 2)
+        # price: user, proof & location price_count deltas
+        price = PriceFactory(
+            proof_id=self.proof.id,
+            location_osm_id=self.location.osm_id,
+            location_osm_type=self.location.osm_type,
+            owner=self.user_session.user.user_id,
+        )
+        self.assertEqual(CounterDelta.objects.count(), 2 + 4)  # + product
+        # not folded yet
+        self.assertEqual(Proof.objects.get(id=self.proof.id).price_count, 0)
+        # reads can be made exact
+        proof = Proof.objects.get(id=self.proof.id)
+        self.assertEqual(CounterDelta.objects.pending_for(proof), {"price_count": 1})
+        CounterDelta.objects.apply_pending(proof)
+        self.assertEqual(proof.price_count, 1)
+        # fold
+        self.assertEqual(CounterDelta.objects.fold(), 6)
+        self.assertEqual(CounterDelta.objects.count(), 0)
+        self.assertEqual(Proof.objects.get(id=self.proof.id).price_count, 1)
+        self.assertEqual(Location.objects.get(id=self.location.id).price_count, 1)
+        self.assertEqual(Location.objects.get(id=self.location.id).proof_count, 1)
+        user = User.objects.get(user_id=self.user_session.user.user_id)
+        self.assertEqual(user.price_count, 1)
+        self.assertEqual(user.proof_count, 1)
+        self.assertEqual(Product.objects.get(id=price.product_id).price_count, 1)
+        # delete: negative deltas
+        price.delete()
+        CounterDelta.objects.fold()
+        self.assertEqual(Proof.objects.get(id=self.proof.id).price_count, 0)
+        # counts cannot go below 0
+        CounterDelta.objects.add([(Proof, self.proof.id, "price_count", -1)])
+        CounterDelta.objects.fold()
+        self.assertEqual(Proof.objects.get(id=self.proof.id).price_count, 0)
+
+    def test_counter_delta_apply_pending_on_detail_reads(self):
+        CounterDelta.objects.fold()
+        url = reverse("api:locations-detail", args=[self.location.id])
+        response = self.client.get(url)
+        self.assertEqual(response.data["price_count"], 0)
+        price = PriceFactory(
+            proof_id=self.proof.id,
+            location_osm_id=self.location.osm_id,
+            location_osm_type=self.location.osm_type,
+            owner=self.user_session.user.user_id,
+        )
+        # not folded yet: the pending deltas are added
+        for url in [
+            reverse("api:users-detail", args=[self.user_session.user.user_id]),
+            reverse("api:proofs-detail", args=[self.proof.id]),
+            reverse("api:locations-detail", args=[self.location.id]),
+            reverse("api:products-detail", args=[price.product_id]),
+        ]:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).data["price_count"], 1)
+        # conditional GET: the pending deltas are part of the ETag
+        response_modified = self.client.get(
+            reverse("api:locations-detail", args=[self.location.id]),
+            headers={"If-None-Match": response["ETag"]},
+        )
+        self.assertEqual(response_modified.status_code, 200)
+
+    def test_counter_delta_fold_bumps_updated(self):
+        CounterDelta.objects.fold()
+        url = reverse("api:locations-detail", args=[self.location.id])
+        response = self.client.get(url)
+        CounterDelta.objects.add([(Location, self.location.id, "price_count", 1)])
+        CounterDelta.objects.fold()
+        # conditional GET: the new count is returned
+        response_modified = self.client.get(
+            url, headers={"If-None-Match": response["ETag"]}
+        )
+        self.assertEqual(response_modified.status_code, 200)
+        self.assertEqual(
+            response_modified.data["price_count"], response.data["price_count"] + 1
+        )
+
+    def test_counter_delta_merge(self):
+        CounterDelta.objects.all().delete()
+        CounterDelta.objects.add(
+            [
+                (Proof, self.proof.id, "price_count", 1),
+                (Proof, self.proof.id, "price_count", 1),
+                (Proof, None, "price_count", 1),  # skipped
+                (Location, self.location.id, "price_count", 1),
+                (Location, self.location.id, "price_count", -1),  # cancels out
+            ]
+        )
+        self.assertEqual(CounterDelta.objects.count(), 1)
+        self.assertEqual(CounterDelta.objects.get().delta, 2)
+
+    def test_counter_delta_discard_on_recalculation(self):
+        PriceFactory(
+            proof_id=self.proof.id,
+            location_osm_id=self.location.osm_id,
+            location_osm_type=self.location.osm_type,
+            owner=self.user_session.user.user_id,
+        )
+        self.assertTrue(CounterDelta.objects.for_instance(self.location).exists())
+        self.location.update_price_count()
+        self.location.update_proof_count()
+        self.assertFalse(CounterDelta.objects.for_instance(self.location).exists())
+        self.assertEqual(self.location.price_count, 1)
+        # folding does not count the price twice
+        CounterDelta.objects.fold()
+        self.assertEqual(Location.objects.get(id=self.location.id).price_count, 1)
+
+
+class QuantileSketchTest(TestCase):
+    def test_quantile_relative_error(self):
+        sketch = QuantileSketch()
+        value_list = [0.5 + index * 0.37 for index in range(1000)]
+        for value in value_list:
+            sketch.add(value)
+        self.assertEqual(sketch.count, 1000)
+        for q in [0, 0.1, 0.5, 0.9, 1]:
+            value = value_list[int(q * 999)]
+            self.assertLessEqual(
+                abs(sketch.quantile(q) - value) / value, sketch.relative_accuracy
+            )
+
+    def test_zero_and_empty(self):
+        sketch = QuantileSketch()
+        self.assertIsNone(sketch.quantile(0.5))
+        sketch.add(0)
+        sketch.add(0)
+        sketch.add(10)
+        self.assertEqual(sketch.quantile(0.5), 0)
+        self.assertAlmostEqual(sketch.quantile(1), 10, delta=0.1)
+
+    def test_merge_and_json(self):
+        sketch_1, sketch_2, sketch_all = (
+            QuantileSketch(),
+            QuantileSketch(),
+            QuantileSketch(),
+        )
+        for value in range(1, 101):
+            (sketch_1 if value % 2 else sketch_2).add(value)
+            sketch_all.add(value)
+        merged_sketch = QuantileSketch.from_json(sketch_1.to_json()).merge(
+            QuantileSketch.from_json(sketch_2.to_json())
+        )
+        self.assertEqual(merged_sketch.to_json(), sketch_all.to_json())
+        self.assertRaises(
+            ValueError, sketch_1.merge, QuantileSketch(relative_accuracy=0.05)
+        )
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=True)
+class ResponseCacheTest(ProcessCacheResetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.location = LocationFactory()
+        cls.price = PriceFactory(
+            location_osm_id=cls.location.osm_id,
+            location_osm_type=cls.location.osm_type,
+        )
+        cls.url = reverse("api:prices-list")
+        cls.user_session = SessionFactory()
+
+    def setUp(self):
+        cache.clear()
+        response_cache_stats.clear()
+
+    def test_anonymous_response_cached(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response["X-Cache"], "MISS")
+        with self.assertNumQueries(0):
+            response_cached = self.client.get(self.url)
+        self.assertEqual(response_cached["X-Cache"], "HIT")
+        self.assertEqual(response_cached.json(), response.json())
+        self.assertEqual(
+            response_cache_stats.stats()["api:prices-list"],
+            {"hits": 1, "misses": 1, "hit_rate": 0.5},
+        )
+
+    def test_cached_response_conditional_get(self):
+        url = reverse("api:prices-detail", args=[self.price.id])
+        response = self.client.get(url)
+        self.assertIn("ETag", response)
+        with self.assertNumQueries(0):
+            response_not_modified = self.client.get(
+                url, headers={"If-None-Match": response["ETag"]}
+            )
+        self.assertEqual(response_not_modified.status_code, 304)
+        self.assertEqual(response_not_modified["X-Cache"], "HIT")
+
+    def test_query_string_normalized(self):
+        response = self.client.get(self.url + "?size=5&order_by=-created")
+        self.assertEqual(response["X-Cache"], "MISS")
+        response = self.client.get(self.url + "?order_by=-created&size=5")
+        self.assertEqual(response["X-Cache"], "HIT")
+        response = self.client.get(self.url + "?order_by=-created&size=6")
+        self.assertEqual(response["X-Cache"], "MISS")
+
+    def test_authenticated_response_not_cached(self):
+        for _ in range(2):
+            response = self.client.get(
+                self.url,
+                headers={"Authorization": f"Bearer {self.user_session.token}"},
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn("X-Cache", response)
+
+    def test_endpoint_not_cached(self):
+        response = self.client.get(reverse("api:proofs-list"))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("X-Cache", response)
+
+    def test_write_invalidates_dependent_responses(self):
+        location_url = reverse("api:locations-detail", args=[self.location.id])
+        self.client.get(self.url)
+        self.client.get(location_url)
+        # a price write bumps the price & location generations
+        with self.captureOnCommitCallbacks(execute=True):
+            PriceFactory(
+                location_osm_id=self.location.osm_id,
+                location_osm_type=self.location.osm_type,
+            )
+        response = self.client.get(self.url)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.data["total"], 2)
+        response = self.client.get(location_url)
+        self.assertEqual(response["X-Cache"], "MISS")
+        # a location write does not bump the challenge generation
+        self.client.get(reverse("api:challenges-list"))
+        with self.captureOnCommitCallbacks(execute=True):
+            LocationFactory()
+        response = self.client.get(reverse("api:challenges-list"))
+        self.assertEqual(response["X-Cache"], "HIT")
+
+    def test_write_in_another_process_invalidates_responses(self):
+        # shared cache backend (like Redis in production)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with override_settings(
+                CACHES={
+                    "default": {
+                        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",  # noqa
+                        "LOCATION": tmp_dir,
+                    }
+                }
+            ):
+                self.client.get(self.url)
+                response = self.client.get(self.url)
+                self.assertEqual(response["X-Cache"], "HIT")
+                # a price write in a Q2 worker
+                process = multiprocessing.get_context("fork").Process(
+                    target=bump_generations, args=["prices.Price"]
+                )
+                process.start()
+                process.join()
+                self.assertEqual(process.exitcode, 0)
+                response = self.client.get(self.url)
+                self.assertEqual(response["X-Cache"], "MISS")
+
+    def test_kill_switch(self):
+        with override_settings(RESPONSE_CACHE_ENABLED=False):
+            for _ in range(2):
+                response = self.client.get(self.url)
+                self.assertNotIn("X-Cache", response)
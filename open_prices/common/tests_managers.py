@@ -1,6 +1,14 @@
-from django.test import TestCase
+from unittest.mock import patch
 
-from open_prices.common.managers import ApproximateCountQuerySet
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from open_prices.common.managers import (
+    ApproximateCountQuerySet,
+    EstimatedCountQuerySet,
+)
+from open_prices.locations.factories import LocationFactory
+from open_prices.locations.models import Location
 from open_prices.products.factories import ProductFactory
 from open_prices.products.models import Product
 
@@ -39,3 +47,51 @@ class ApproximateCountTest(TestCase):
 
         count = Product.objects.filter(price_count=20).count()
         self.assertEqual(count, 1)
+
+
+class EstimatedCountTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        LocationFactory.create_batch(3, osm_address_country_code="FR")
+        LocationFactory(osm_address_country_code="IT")
+
+    def setUp(self):
+        cache.clear()
+
+    def test_queryset_instance(self):
+        self.assertIsInstance(Location.objects.all(), EstimatedCountQuerySet)
+
+    def test_exact_count_below_threshold(self):
+        queryset = Location.objects.filter(osm_address_country_code="FR")
+        self.assertEqual(queryset.get_pagination_count(), (3, False))
+
+    def test_estimated_count_above_threshold(self):
+        queryset = Location.objects.filter(osm_address_country_code="FR")
+        with patch(
+            "open_prices.common.constants.PAGINATION_COUNT_ESTIMATE_THRESHOLD", 1
+        ):
+            with self.assertNumQueries(1):  # EXPLAIN only
+                count, count_is_estimate = queryset.get_pagination_count()
+        self.assertTrue(count_is_estimate)
+        self.assertGreaterEqual(count, 1)
+
+    @override_settings(TESTING=False)
+    def test_exact_count_memoized(self):
+        queryset = Location.objects.filter(osm_address_country_code="IT")
+        with self.assertNumQueries(2):  # EXPLAIN + COUNT(*)
+            self.assertEqual(queryset.get_pagination_count(), (1, False))
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                Location.objects.filter(
+                    osm_address_country_code="IT"
+                ).get_pagination_count(),
+                (1, False),
+            )
+        # other filter signature
+        with self.assertNumQueries(2):
+            self.assertEqual(
+                Location.objects.filter(
+                    osm_address_country_code="FR"
+                ).get_pagination_count(),
+                (3, False),
+            )
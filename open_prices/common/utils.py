@@ -4,8 +4,15 @@ import os
 from decimal import Decimal
 from urllib.parse import urlparse
 
+import psycopg2.errors
 import tqdm
+from django.core.exceptions import ValidationError
 from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models.constants import OnConflict
+from django.db.models.sql import InsertQuery
+
+from open_prices.common import identity_map
 
 
 def is_float(string):
@@ -69,6 +76,190 @@ def merge_validation_errors(dict1, *args):
     return dict1
 
 
+def insert_ignore_conflicts_returning(
+    model, obj_list: list, returning_field_name_list: list[str]
+) -> list[tuple]:
+    """
+    INSERT ... ON CONFLICT DO NOTHING RETURNING ...
+    (bulk_create(ignore_conflicts=True) does not return the inserted rows)
+    - no signals are sent
+    Return the returning fields values of the inserted rows only.
+    """
+    if not obj_list:
+        return []
+    using = router.db_for_write(model)
+    field_list = [
+        field
+        for field in model._meta.concrete_fields
+        if not field.generated and field not in model._meta.pk_fields
+    ]
+    query = InsertQuery(model, on_conflict=OnConflict.IGNORE)
+    query.insert_values(field_list, obj_list)
+    compiler = query.get_compiler(using=using)
+    compiler.returning_fields = [
+        model._meta.get_field(field_name) for field_name in returning_field_name_list
+    ]
+    with connections[using].cursor() as cursor:
+        for sql, params in compiler.as_sql():
+            cursor.execute(sql, params)
+        return [tuple(row) for row in cursor.fetchall()]
+
+
+def get_update_field_name_set(instance, update_fields) -> set | None:
+    """
+    Normalize the update_fields of a save() to a set of field names
+    (e.g. "location_id" -> "location"). None for full saves.
+    """
+    if update_fields is None:
+        return None
+    return {instance._meta.get_field(field_name).name for field_name in update_fields}
+
+
+def save_touches_fields(update_field_name_set: set | None, field_list) -> bool:
+    """
+    Return True if the save updates one of the given fields
+    (always True for full saves)
+    """
+    return update_field_name_set is None or not update_field_name_set.isdisjoint(
+        field_list
+    )
+
+
+def run_validators(instance, validator_list, update_field_name_set=None) -> dict:
+    """
+    Run the model validators & merge their errors
+    - validator_list: list of (validator, field_list) tuples, where
+    field_list contains the fields read by the validator
+    - partial saves only run the validators reading an updated field
+    """
+    return merge_validation_errors(
+        dict(),
+        *[
+            validator(instance)
+            for validator, field_list in validator_list
+            if save_touches_fields(update_field_name_set, field_list)
+        ],
+    )
+
+
+def full_clean_update_fields(instance, update_field_name_set: set, validator_list):
+    """
+    Lighter version of full_clean(), for partial saves (update_fields):
+    - fields validation (incl. the FK existence queries), unique checks &
+    constraints are restricted to the updated fields
+    - only the validators reading an updated field are run
+    """
+    exclude = {
+        field.name
+        for field in instance._meta.concrete_fields
+        if field.name not in update_field_name_set
+    }
+    errors = dict()
+    try:
+        instance.clean_fields(exclude=exclude)
+    except ValidationError as e:
+        errors = e.update_error_dict(errors)
+    errors = merge_validation_errors(
+        errors, run_validators(instance, validator_list, update_field_name_set)
+    )
+    try:
+        instance.validate_unique(exclude=exclude)
+    except ValidationError as e:
+        errors = e.update_error_dict(errors)
+    try:
+        instance.validate_constraints(exclude=exclude)
+    except ValidationError as e:
+        errors = e.update_error_dict(errors)
+    if errors:
+        raise ValidationError(errors)
+
+
+def save_retrying_stale_ids(instance, save, reset_ids, *args, **kwargs):
+    """
+    Save the instance, retrying once if its foreign key ids (resolved
+    through the per-process IdResolutionCache) point to rows deleted by
+    another process: their caches were not evicted.
+    - the foreign keys are checked on commit (deferred constraints): the
+    save runs in its own transaction. Inside an outer transaction, the
+    error is raised on its commit: no retry
+    - only foreign key violations are retried (not e.g. unique violations)
+    - reset_ids: evict the ids from the caches & resolve them again
+    """
+    if transaction.get_connection().in_atomic_block:
+        return save(*args, **kwargs)
+    adding = instance._state.adding
+    try:
+        with transaction.atomic():
+            return save(*args, **kwargs)
+    except IntegrityError as e:
+        if not isinstance(e.__cause__, psycopg2.errors.ForeignKeyViolation):
+            raise
+        if adding:
+            # the INSERT was rolled back
+            instance.pk = None
+            instance._state.adding = True
+        reset_ids()
+        return save(*args, **kwargs)
+
+
+def get_cached_related_object(instance, field_name):
+    """
+    Return the related object if it is already loaded on the instance
+    (e.g. by a serializer, or by a bulk method), or in the request/task
+    identity map, without querying the database.
+    Return None otherwise.
+    """
+    field = instance._meta.get_field(field_name)
+    if field.is_cached(instance):
+        related_object = field.get_cached_value(instance)
+        if related_object and related_object.pk == getattr(instance, field.attname):
+            return related_object
+    related_object = identity_map.get_object(
+        field.related_model, getattr(instance, field.attname)
+    )
+    if related_object is not None:
+        field.set_cached_value(instance, related_object)
+    return related_object
+
+
+def fetch_related_object(instance, field_name):
+    """
+    Fetch the related object from the database (None if not found),
+    and share it with the instance & the request/task identity map.
+    """
+    field = instance._meta.get_field(field_name)
+    related_object = field.related_model._default_manager.filter(
+        pk=getattr(instance, field.attname)
+    ).first()
+    if related_object is not None:
+        field.set_cached_value(instance, related_object)
+        identity_map.add_object(related_object)
+    return related_object
+
+
+def get_related_object(instance, field_name):
+    """
+    Return the related object, fetched at most once per request/task.
+    """
+    return get_cached_related_object(instance, field_name) or fetch_related_object(
+        instance, field_name
+    )
+
+
+def get_loaded_foreign_key_name_set(instance) -> set[str]:
+    """
+    FK fields whose related object is already loaded: clean_fields() can skip
+    them (ForeignKey.validate() would re-check the existence with a query).
+    """
+    return {
+        field.name
+        for field in instance._meta.concrete_fields
+        if field.many_to_one
+        and getattr(instance, field.attname) is not None
+        and get_cached_related_object(instance, field.name)
+    }
+
+
 def export_model_to_jsonl_gz(table_name, model_class, schema_class, output_dir):
     output_path = os.path.join(output_dir, f"{table_name}.jsonl.gz")
     with gzip.open(output_path, "wt") as f:
@@ -27,7 +27,7 @@ class Command(BaseCommand):
                 if response:
                     location.osm_brand = response.tag("brand")
                     location.osm_version = response.version()
-                    location.save(update_fields=["osm_brand", "osm_version"])
+                    location.save(update_fields=["osm_brand", "osm_version", "updated"])
                 else:
                     self.stdout.write(f"Could not find historical data for {location}")
                 if index % 100 == 0:
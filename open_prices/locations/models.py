@@ -1,4 +1,6 @@
+import functools
 import math
+import operator
 
 from django.conf import settings
 from django.core.validators import ValidationError
@@ -19,13 +21,19 @@ from django.utils import timezone
 from django_q.tasks import async_task
 
 from open_prices.common import utils
+from open_prices.common.id_cache import IdResolutionCache
+from open_prices.common.managers import EstimatedCountQuerySet
+from open_prices.common.models import CounterDelta
 from open_prices.common.utils import truncate_decimal
 from open_prices.locations import constants as location_constants
 from open_prices.locations import utils as location_utils
 from open_prices.locations import validators as location_validators
 
+# (osm_type, osm_id) -> location id (type OSM only)
+location_id_cache = IdResolutionCache("location")
 
-class LocationQuerySet(models.QuerySet):
+
+class LocationQuerySet(EstimatedCountQuerySet):
     def has_type_osm(self):
         return self.filter(type=location_constants.TYPE_OSM)
 
@@ -48,6 +56,104 @@ class LocationQuerySet(models.QuerySet):
             .count()
         )
 
+    def get_or_create_type_osm_in_bulk(self, osm_key_list: list[tuple]) -> dict:
+        """
+        Bulk version of get_or_create(type=OSM, osm_id=..., osm_type=...)
+        - 1 query to fetch the existing locations
+        - 1 INSERT (+ 1 query) to create the missing ones
+        Return a {(osm_id, osm_type): location} dict.
+
+        Usage: open_prices/prices/models.py:PriceQuerySet.bulk_create_validated
+        """
+
+        def filter_osm_key_list(queryset, osm_key_list):
+            return queryset.has_type_osm().filter(
+                functools.reduce(
+                    operator.or_,
+                    (
+                        Q(osm_id=osm_id, osm_type=osm_type)
+                        for (osm_id, osm_type) in osm_key_list
+                    ),
+                )
+            )
+
+        osm_key_set = set(osm_key_list)
+        if not osm_key_set:
+            return {}
+        location_dict = {
+            (location.osm_id, location.osm_type): location
+            for location in filter_osm_key_list(self, osm_key_set)
+        }
+        missing_osm_key_list = [
+            osm_key for osm_key in osm_key_set if osm_key not in location_dict
+        ]
+        if missing_osm_key_list:
+            location_list = [
+                self.model(
+                    type=location_constants.TYPE_OSM, osm_id=osm_id, osm_type=osm_type
+                )
+                for (osm_id, osm_type) in missing_osm_key_list
+            ]
+            # ON CONFLICT DO NOTHING: the location may have been created in the
+            # meantime (by a concurrent transaction, that sent the signal)
+            inserted_id_set = {
+                row[0]
+                for row in utils.insert_ignore_conflicts_returning(
+                    self.model, location_list, ["id"]
+                )
+            }
+            for location in filter_osm_key_list(self, missing_osm_key_list):
+                location_dict[(location.osm_id, location.osm_type)] = location
+                if location.id in inserted_id_set:
+                    # the INSERT does not send signals
+                    signals.post_save.send(
+                        sender=self.model, instance=location, created=True
+                    )
+        for (osm_id, osm_type), location in location_dict.items():
+            location_id_cache.set_on_commit((osm_type, int(osm_id)), location.id)
+        return location_dict
+
+    def get_or_create_type_osm_id(self, osm_id: int, osm_type: str) -> int:
+        """
+        Lighter version of get_or_create(type=OSM, osm_id=..., osm_type=...):
+        return the location id
+        - per-process cache (see location_id_cache): no query on hits
+        - misses: 1 SELECT, then (if not found) 1 INSERT ... ON CONFLICT
+        DO NOTHING RETURNING. On conflict (concurrent creation: the INSERT
+        waits for the other transaction), 1 more SELECT
+
+        Usage: Price.set_location, Proof.set_location
+        """
+        osm_key = (osm_type, int(osm_id))
+        location_id = location_id_cache.get(osm_key)
+        if location_id is not None:
+            return location_id
+        location_id_queryset = (
+            self.has_type_osm()
+            .filter(osm_id=osm_id, osm_type=osm_type)
+            .values_list("id", flat=True)
+        )
+        location = self.model(
+            type=location_constants.TYPE_OSM,
+            osm_id=osm_id,
+            osm_type=osm_type,
+            id=location_id_queryset.first(),
+        )
+        if location.id is None:
+            row_list = utils.insert_ignore_conflicts_returning(
+                self.model, [location], ["id"]
+            )
+            if row_list:
+                location.id = row_list[0][0]
+                # the INSERT does not send signals
+                signals.post_save.send(
+                    sender=self.model, instance=location, created=True
+                )
+            else:
+                location.id = location_id_queryset.get()
+        location_id_cache.set_on_commit(osm_key, location.id)
+        return location.id
+
     def nearby(self, center_lat: float, center_lon: float, radius_km: float):
         # Earth's mean radius in kilometers, used for haversine distance calculations
         earth_radius_km = 6371.0
@@ -125,6 +231,17 @@ class Location(models.Model):
         "osm_version",
     ]
     TYPE_ONLINE_MANDATORY_FIELDS = ["website_url"]
+    # (validator, fields read): partial saves only run the validators concerned
+    VALIDATOR_LIST = [
+        (
+            location_validators.validate_location_type_osm_rules,
+            ["type"] + TYPE_OSM_MANDATORY_FIELDS + TYPE_ONLINE_MANDATORY_FIELDS,
+        ),
+        (
+            location_validators.validate_location_type_online_rules,
+            ["type"] + TYPE_OSM_MANDATORY_FIELDS + TYPE_ONLINE_MANDATORY_FIELDS,
+        ),
+    ]
 
     type = models.CharField(max_length=20, choices=location_constants.TYPE_CHOICES)
 
@@ -207,10 +324,7 @@ class Location(models.Model):
 
     def clean(self, *args, **kwargs):
         # store all ValidationError in a dict
-        validation_errors = utils.merge_validation_errors(
-            location_validators.validate_location_type_osm_rules(self),
-            location_validators.validate_location_type_online_rules(self),
-        )
+        validation_errors = utils.run_validators(self, self.VALIDATOR_LIST)
         # return
         if bool(validation_errors):
             raise ValidationError(validation_errors)
@@ -221,12 +335,26 @@ class Location(models.Model):
         - OSM: cleanup lat/lon fields
         - ONLINE: cleanup URL fields
         - run validations
+        Partial saves (update_fields) only run the steps concerned
+        by the updated fields (e.g. none for a count update).
         """
+        update_field_name_set = utils.get_update_field_name_set(
+            self, kwargs.get("update_fields")
+        )
         if self.type == location_constants.TYPE_OSM:
-            self.truncate_lat_lon()
+            if utils.save_touches_fields(
+                update_field_name_set, self.LAT_LON_DECIMAL_FIELDS
+            ):
+                self.truncate_lat_lon()
         elif self.type == location_constants.TYPE_ONLINE:
-            self.cleanup_url()
-        self.full_clean()
+            if utils.save_touches_fields(update_field_name_set, self.URL_FIELDS):
+                self.cleanup_url()
+        if update_field_name_set is None:
+            self.full_clean()
+        else:
+            utils.full_clean_update_fields(
+                self, update_field_name_set, self.VALIDATOR_LIST
+            )
         super().save(*args, **kwargs)
 
     @classmethod
@@ -255,8 +383,9 @@ class Location(models.Model):
         return None
 
     def update_price_count(self):
+        CounterDelta.objects.discard(self, ["price_count"])
         self.price_count = self.prices.count()
-        self.save(update_fields=["price_count"])
+        self.save(update_fields=["price_count", "updated"])
 
     def update_user_count(self):
         from open_prices.proofs.models import Proof
@@ -264,7 +393,7 @@ class Location(models.Model):
         self.user_count = Proof.objects.filter(
             location=self
         ).calculate_field_distinct_count("owner")
-        self.save(update_fields=["user_count"])
+        self.save(update_fields=["user_count", "updated"])
 
     def update_product_count(self):
         from open_prices.prices.models import Price
@@ -272,11 +401,17 @@ class Location(models.Model):
         self.product_count = Price.objects.filter(
             location=self
         ).calculate_field_distinct_count("product_id")
-        self.save(update_fields=["product_count"])
+        self.save(update_fields=["product_count", "updated"])
 
     def update_proof_count(self):
+        CounterDelta.objects.discard(self, ["proof_count"])
         self.proof_count = self.proofs.count()
-        self.save(update_fields=["proof_count"])
+        self.save(update_fields=["proof_count", "updated"])
+
+
+@receiver(signals.post_delete, sender=Location)
+def location_post_delete_update_location_id_cache(sender, instance, **kwargs):
+    location_id_cache.delete_id(instance.id)
 
 
 @receiver(signals.post_save, sender=Location)
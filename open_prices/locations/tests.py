@@ -1,8 +1,11 @@
 from decimal import Decimal
+from unittest.mock import MagicMock, patch
 
 from django.core.exceptions import ValidationError
+from django.db.models import signals
 from django.test import TestCase
 
+from open_prices.common.utils import insert_ignore_conflicts_returning
 from open_prices.locations import constants as location_constants
 from open_prices.locations.factories import LocationFactory
 from open_prices.locations.models import Location
@@ -158,6 +161,47 @@ class LocationQuerySetTest(TestCase):
         self.assertEqual(location.price_count_annotated, 1)
         self.assertEqual(location.price_count, 1)
 
+    def test_get_or_create_type_osm_in_bulk(self):
+        post_save_receiver = MagicMock()
+        signals.post_save.connect(post_save_receiver, sender=Location, weak=False)
+
+        def insert_after_concurrent_creation(model, obj_list, *args):
+            # created by another transaction between the SELECT and the INSERT
+            Location.objects.bulk_create(
+                [
+                    Location(
+                        type=location_constants.TYPE_OSM,
+                        osm_id=1,
+                        osm_type=location_constants.OSM_TYPE_NODE,
+                    )
+                ]
+            )
+            return insert_ignore_conflicts_returning(model, obj_list, *args)
+
+        osm_key_list = [
+            (
+                self.location_osm_with_price.osm_id,
+                self.location_osm_with_price.osm_type,
+            ),
+            (1, location_constants.OSM_TYPE_NODE),
+            (2, location_constants.OSM_TYPE_NODE),
+        ]
+        try:
+            with patch(
+                "open_prices.locations.models.utils.insert_ignore_conflicts_returning",
+                side_effect=insert_after_concurrent_creation,
+            ):
+                location_dict = Location.objects.get_or_create_type_osm_in_bulk(
+                    osm_key_list
+                )
+        finally:
+            signals.post_save.disconnect(post_save_receiver, sender=Location)
+        self.assertEqual(len(location_dict), 3)
+        # created=True only for the location inserted by this call
+        self.assertEqual(post_save_receiver.call_count, 1)
+        self.assertEqual(post_save_receiver.call_args.kwargs["instance"].osm_id, 2)
+        self.assertTrue(post_save_receiver.call_args.kwargs["created"])
+
 
 class LocationQuerySetNearbyTest(TestCase):
     @classmethod
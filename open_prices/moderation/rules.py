@@ -13,6 +13,7 @@ from django.utils import timezone
 from open_prices.common import openfoodfacts as common_openfoodfacts
 from open_prices.moderation.models import Flag, FlagReason
 from open_prices.prices import constants as price_constants
+from open_prices.prices.models import Price
 from open_prices.prices.outlier_detection import find_outliers
 from open_prices.products.models import Product
 
@@ -45,9 +46,10 @@ def cleanup_products_with_long_barcodes():
     for product in product_queryset:
         product_prices_from_source_queryset = product.prices.filter(source_query)
         if product_prices_from_source_queryset.exists():
-            for price in product_prices_from_source_queryset.all():
-                price.delete()  # delete 1 by 1 to trigger signals
-                price_deleted_count += 1
+            # signals are still triggered for each price, but the
+            # duplicates are re-resolved once (see PriceQuerySet.delete)
+            _, deleted_count_dict = product_prices_from_source_queryset.delete()
+            price_deleted_count += deleted_count_dict.get(Price._meta.label, 0)
             if product.prices.count() == 0:
                 product.delete()
                 product_deleted_count += 1
@@ -88,9 +90,10 @@ def cleanup_products_with_invalid_barcodes():
     for product in product_queryset:
         product_prices_from_source_queryset = product.prices.filter(source_query)
         if product_prices_from_source_queryset.exists():
-            for price in product_prices_from_source_queryset.all():
-                price.delete()  # delete 1 by 1 to trigger signals
-                price_deleted_count += 1
+            # signals are still triggered for each price, but the
+            # duplicates are re-resolved once (see PriceQuerySet.delete)
+            _, deleted_count_dict = product_prices_from_source_queryset.delete()
+            price_deleted_count += deleted_count_dict.get(Price._meta.label, 0)
             if product.prices.count() == 0:
                 product.delete()
                 product_deleted_count += 1
@@ -34,6 +34,8 @@ PRICE_PER_KILOGRAM = "KILOGRAM"
 PRICE_PER_LIST = [PRICE_PER_UNIT, PRICE_PER_KILOGRAM]
 PRICE_PER_CHOICES = [(key, key) for key in PRICE_PER_LIST]
 
+PRICE_BULK_CREATE_MAX_SIZE = 1000  # max number of prices per bulk request
+
 PRICE_CREATED_FROM_PRICE_TAG_VALIDATION_SOURCE_LIST = [
     # price validation
     "/prices/add/validate",
@@ -42,3 +44,32 @@ PRICE_CREATED_FROM_PRICE_TAG_VALIDATION_SOURCE_LIST = [
     "/experiments/proof-price-tag-assistant",
     "/experiments/contribution-assistant",  # old name
 ]
+
+# price rollups (see prices.models.PriceRollup)
+PRICE_ROLLUP_BATCH_SIZE = 1000
+# product (or location) ids per rebuild transaction
+PRICE_ROLLUP_REBUILD_CHUNK_SIZE = 1000
+# stats endpoint filter (see api.prices.filters.PriceFilter) -> rollup lookup
+# other filters are not rollup dimensions: the stats are calculated live
+PRICE_ROLLUP_FILTER_LOOKUP_DICT = {
+    "type": "type",
+    "product_id": "product_id",
+    "product_id__in": "product_id__in",
+    "product_id__isnull": "product_id__isnull",
+    "product_code": "product__code",
+    "product_code__in": "product__code__in",
+    "category_tag": "category_tag",
+    "location_id": "location_id",
+    "location_id__in": "location_id__in",
+    "location_id__isnull": "location_id__isnull",
+    "currency": "currency",
+    "price_is_discounted": "price_is_discounted",
+    "date__year": "month__year",
+    "date__month": "month__month",
+}
+
+# price history buckets (see prices.models.PriceHistoryBucket)
+PRICE_HISTORY_BUCKET_WEEK = "WEEK"
+PRICE_HISTORY_BUCKET_MONTH = "MONTH"
+PRICE_HISTORY_BUCKET_LIST = [PRICE_HISTORY_BUCKET_WEEK, PRICE_HISTORY_BUCKET_MONTH]
+PRICE_HISTORY_BUCKET_CHOICES = [(key, key) for key in PRICE_HISTORY_BUCKET_LIST]
@@ -47,7 +47,9 @@ class Command(BaseCommand):
                         # we also update `product_id` as we changed the
                         # barcode, and the product ID is updated automatically
                         # in `save()`
-                        price.save(update_fields=["product_code", "product_id"])
+                        price.save(
+                            update_fields=["product_code", "product_id", "updated"]
+                        )
 
         for product in Product.objects.all():
             if product.code and product.code.isdigit():
@@ -66,4 +68,4 @@ class Command(BaseCommand):
                         )
                         if apply:
                             product.code = normalized_code
-                            product.save(update_fields=["code"])
+                            product.save(update_fields=["code", "updated"])
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from open_prices.prices.models import PriceHistoryBucket, PriceRollup
+
+
+class Command(BaseCommand):
+    """Recalculate all the price rollups (used by the stats endpoint) and
+    price history buckets (used by the product price-history endpoint) from
+    the prices. Also run daily (see rebuild_price_rollups_task)."""
+
+    help = "Rebuild the price rollups & price history buckets."
+
+    def handle(self, *args, **options) -> None:
+        self.stdout.write("Rebuilding the price rollups...")
+        rollup_count = PriceRollup.objects.rebuild()
+        self.stdout.write(f"Done: {rollup_count} rollups")
+        self.stdout.write("Rebuilding the price history buckets...")
+        bucket_count = PriceHistoryBucket.objects.rebuild()
+        self.stdout.write(f"Done: {bucket_count} buckets")
@@ -4,45 +4,46 @@ from django.db.models import Count
 
 from open_prices.prices.models import Price
 
+BATCH_SIZE = 1000
+
 
 class Command(BaseCommand):
-    """Refresh the `duplicate_of_id` field for all prices, by saving them
-    trigger any updates."""
+    """Refresh the `dedup_fingerprint` & `duplicate_of_id` fields for all
+    prices. Duplicates are grouped by `dedup_fingerprint` (indexed)."""
 
     help = "Refresh the `duplicate_of_id` field for all prices."
 
     def handle(self, *args, **options) -> None:
-        self.stdout.write("Updating duplicate_of field for all prices...")
-
-        filter_fields = [
-            "type",
-            "location_id",
-            "date",
-            "currency",
-            "price",
-            "price_per",
-            "price_is_discounted",
-            "price_without_discount",
-            "discount_type",
-            "product_code",
-            "category_tag",
-            "labels_tags",
-            "origins_tags",
-        ]
+        self.stdout.write("Updating dedup_fingerprint field for all prices...")
+        price_to_update_list = list()
+        for price in tqdm.tqdm(
+            Price.objects.filter(
+                dedup_fingerprint=None, location_id__isnull=False, date__isnull=False
+            ).iterator(chunk_size=BATCH_SIZE),
+            desc="Processing prices",
+        ):
+            price.set_dedup_fingerprint()
+            price_to_update_list.append(price)
+            if len(price_to_update_list) == BATCH_SIZE:
+                Price.objects.bulk_update(price_to_update_list, ["dedup_fingerprint"])
+                price_to_update_list = list()
+        Price.objects.bulk_update(price_to_update_list, ["dedup_fingerprint"])
 
-        # Group by relevant fields to find duplicates
-        duplicates = (
-            Price.objects.values(*filter_fields)
+        self.stdout.write("Updating duplicate_of field for all prices...")
+        # Group by fingerprint to find duplicates
+        dedup_fingerprint_list = (
+            Price.objects.exclude(dedup_fingerprint=None)
+            .values("dedup_fingerprint")
             .annotate(duplicate_count=Count("id"))
             .filter(duplicate_count__gt=1)
+            .values_list("dedup_fingerprint", flat=True)
         )
-
-        for item in tqdm.tqdm(
-            duplicates.values_list(*filter_fields),
-            desc="Processing duplicate groups",
+        dedup_fingerprint_batch = list()
+        for dedup_fingerprint in tqdm.tqdm(
+            dedup_fingerprint_list.iterator(), desc="Processing duplicate groups"
         ):
-            filters = dict(zip(filter_fields, item, strict=False))
-            for price in Price.objects.filter(**filters).order_by("-id"):
-                # Only save if duplicate_of_id is not already set
-                if price.duplicate_of_id is None:
-                    price.save()
+            dedup_fingerprint_batch.append(dedup_fingerprint)
+            if len(dedup_fingerprint_batch) == BATCH_SIZE:
+                Price.objects.resolve_duplicates(dedup_fingerprint_batch)
+                dedup_fingerprint_batch = list()
+        Price.objects.resolve_duplicates(dedup_fingerprint_batch)
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.14 on 2026-10-17 07:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("prices", "0017_add_price_statistics_materialized_view"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="price",
+            name="dedup_fingerprint",
+            field=models.CharField(blank=True, db_index=True, max_length=32, null=True),
+        ),
+    ]
@@ -0,0 +1,114 @@
+# Generated by Django 5.2.14 on 2026-10-17 09:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("locations", "0009_alter_location_unique_together"),
+        ("prices", "0018_price_dedup_fingerprint"),
+        ("products", "0010_product_creator"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PriceRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "type",
+                    models.CharField(
+                        choices=[("PRODUCT", "PRODUCT"), ("CATEGORY", "CATEGORY")],
+                        max_length=20,
+                    ),
+                ),
+                ("category_tag", models.CharField(blank=True, null=True)),
+                ("currency", models.CharField(blank=True, max_length=3, null=True)),
+                ("price_per", models.CharField(blank=True, max_length=10, null=True)),
+                ("month", models.DateField(blank=True, null=True)),
+                ("price_is_discounted", models.BooleanField()),
+                ("price_count", models.PositiveIntegerField(default=0)),
+                ("price_not_null_count", models.PositiveIntegerField(default=0)),
+                (
+                    "price_sum",
+                    models.DecimalField(
+                        blank=True, decimal_places=3, max_digits=20, null=True
+                    ),
+                ),
+                (
+                    "price_min",
+                    models.DecimalField(
+                        blank=True, decimal_places=3, max_digits=10, null=True
+                    ),
+                ),
+                (
+                    "price_max",
+                    models.DecimalField(
+                        blank=True, decimal_places=3, max_digits=10, null=True
+                    ),
+                ),
+                ("price_sketch", models.JSONField(default=dict)),
+                ("updated", models.DateTimeField(auto_now=True)),
+                (
+                    "location",
+                    models.ForeignKey(
+                        db_constraint=False,
+                        null=True,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to="locations.location",
+                    ),
+                ),
+                (
+                    "product",
+                    models.ForeignKey(
+                        db_constraint=False,
+                        null=True,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to="products.product",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Price rollup",
+                "verbose_name_plural": "Price rollups",
+                "db_table": "price_rollups",
+                "indexes": [
+                    models.Index(
+                        fields=["location", "month"],
+                        name="price_rollu_locatio_0ad34d_idx",
+                    ),
+                    models.Index(
+                        fields=["category_tag", "month"],
+                        name="price_rollu_categor_801247_idx",
+                    ),
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=(
+                            "product_id",
+                            "category_tag",
+                            "location_id",
+                            "currency",
+                            "price_per",
+                            "month",
+                            "price_is_discounted",
+                            "type",
+                        ),
+                        name="unique_price_rollup_key",
+                        nulls_distinct=False,
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.14 on 2026-10-17 09:30
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY: no table lock (cannot run in a transaction)
+    atomic = False
+
+    dependencies = [
+        ("prices", "0019_price_rollups"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="price",
+            index=models.Index(
+                fields=["product_code", "-date"], name="prices_product_code_date_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="price",
+            index=models.Index(
+                fields=["location", "-date"], name="prices_location_date_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="price",
+            index=models.Index(
+                condition=models.Q(("category_tag__isnull", False)),
+                fields=["category_tag", "-date"],
+                name="prices_category_tag_date_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="price",
+            index=models.Index(fields=["date"], name="prices_date_idx"),
+        ),
+        AddIndexConcurrently(
+            model_name="price",
+            index=models.Index(fields=["created"], name="prices_created_idx"),
+        ),
+        AddIndexConcurrently(
+            model_name="price",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["tags"], name="prices_tags_gin_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="price",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["labels_tags"], name="prices_labels_tags_gin_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="price",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["origins_tags"], name="prices_origins_tags_gin_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 5.2.14 on 2026-10-17 09:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("prices", "0020_filter_indexes"),
+        ("products", "0011_filter_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PriceHistoryBucket",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "bucket",
+                    models.CharField(
+                        choices=[("WEEK", "WEEK"), ("MONTH", "MONTH")], max_length=10
+                    ),
+                ),
+                ("bucket_start", models.DateField()),
+                ("currency", models.CharField(blank=True, max_length=3, null=True)),
+                ("country_code", models.CharField(blank=True, null=True)),
+                ("price_count", models.PositiveIntegerField(default=0)),
+                (
+                    "price_min",
+                    models.DecimalField(
+                        blank=True, decimal_places=3, max_digits=10, null=True
+                    ),
+                ),
+                (
+                    "price_max",
+                    models.DecimalField(
+                        blank=True, decimal_places=3, max_digits=10, null=True
+                    ),
+                ),
+                ("price_sketch", models.JSONField(default=dict)),
+                ("updated", models.DateTimeField(auto_now=True)),
+                (
+                    "product",
+                    models.ForeignKey(
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to="products.product",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Price history bucket",
+                "verbose_name_plural": "Price history buckets",
+                "db_table": "price_history_buckets",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=(
+                            "product_id",
+                            "bucket",
+                            "bucket_start",
+                            "currency",
+                            "country_code",
+                        ),
+                        name="unique_price_history_bucket_key",
+                        nulls_distinct=False,
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.14 on 2026-10-17 10:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("prices", "0021_price_history_buckets"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PriceStatistics5y",
+            fields=[
+                ("id", models.TextField(primary_key=True, serialize=False)),
+                ("osm_address_country_code", models.CharField(max_length=2)),
+                ("code", models.TextField()),
+                ("price_per", models.CharField(max_length=255)),
+                ("currency", models.CharField(max_length=3)),
+                ("type", models.CharField(max_length=10)),
+                ("mean", models.FloatField()),
+                ("count", models.IntegerField()),
+                ("stddev", models.FloatField()),
+                ("min", models.FloatField()),
+                ("max", models.FloatField()),
+                ("median", models.FloatField()),
+            ],
+            options={
+                "db_table": "price_statistics_5y",
+                "managed": False,
+            },
+        ),
+    ]
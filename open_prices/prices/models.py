@@ -1,23 +1,55 @@
+import contextvars
+import datetime
 import decimal
+import hashlib
+import json
+import math
 
+from django.conf import settings
 from django.contrib.contenttypes.fields import GenericRelation
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
 from django.core.validators import MinValueValidator, ValidationError
-from django.db import connection, models
-from django.db.models import Avg, Case, Count, F, Max, Min, Q, Value, When, signals
-from django.db.models.functions import Cast, ExtractYear
+from django.db import connection, models, transaction
+from django.db.models import (
+    Avg,
+    Case,
+    Count,
+    F,
+    Max,
+    Min,
+    Q,
+    Sum,
+    Value,
+    When,
+    signals,
+)
+from django.db.models.functions import (
+    Cast,
+    Ceil,
+    ExtractYear,
+    Ln,
+    TruncMonth,
+    TruncWeek,
+)
 from django.dispatch import receiver
 from django.utils import timezone
 from django_q.tasks import async_task
 from openfoodfacts.barcode import normalize_barcode
 from simple_history.models import HistoricalRecords
+from simple_history.utils import bulk_create_with_history, bulk_update_with_history
 
+from open_prices.challenges.matcher import CompiledChallenge, get_challenge_matcher
 from open_prices.challenges.models import Challenge
 from open_prices.common import (
     constants,
     history,
     utils,
 )
+from open_prices.common.db_func import PercentileCont
+from open_prices.common.managers import EstimatedCountQuerySet
+from open_prices.common.models import CounterDelta
+from open_prices.common.quantile_sketch import QuantileSketch, get_gamma
 from open_prices.locations import constants as location_constants
 from open_prices.locations.models import Location
 from open_prices.prices import constants as price_constants
@@ -27,8 +59,31 @@ from open_prices.proofs import constants as proof_constants
 from open_prices.proofs.models import Proof
 from open_prices.users.models import User
 
+# set during PriceQuerySet.delete(): the duplicates are re-resolved once
+# for all the deleted prices, instead of in each post_delete signal
+_skip_delete_resolve_duplicates = contextvars.ContextVar(
+    "skip_delete_resolve_duplicates", default=False
+)
+
+
+def get_percentile_key(percentile: float) -> str:
+    # 50.0 -> "50", 99.9 -> "99.9"
+    return f"{percentile:g}"
+
+
+def round_price(value) -> decimal.Decimal | None:
+    """
+    Same rounding as the Cast(..., DecimalField(decimal_places=2)) of the
+    stats (half away from zero)
+    """
+    if value is None:
+        return None
+    return decimal.Decimal(value).quantize(
+        decimal.Decimal("0.01"), rounding=decimal.ROUND_HALF_UP
+    )
+
 
-class PriceQuerySet(models.QuerySet):
+class PriceQuerySet(EstimatedCountQuerySet):
     def has_discount(self):
         return self.filter(price_is_discounted=True)
 
@@ -71,6 +126,17 @@ class PriceQuerySet(models.QuerySet):
             ),
         )
 
+    def latest_per_product(self, product_id_list: list[int]):
+        """
+        Latest price of each product (1 query, DISTINCT ON product_id)
+        Undated prices last (Postgres sorts NULLs first in DESC)
+        """
+        return (
+            self.filter(product_id__in=product_id_list)
+            .order_by("product_id", F("date").desc(nulls_last=True), "-created")
+            .distinct("product_id")
+        )
+
     def calculate_min(self):
         return self.aggregate(Min("price"))["price__min"]
 
@@ -85,8 +151,12 @@ class PriceQuerySet(models.QuerySet):
             )
         )["price__avg"]
 
-    def calculate_stats(self):
-        return self.aggregate(
+    def calculate_stats(self, percentile_list: list[float] | None = None):
+        """
+        - percentile_list: optional percentiles (0-100) of the prices,
+        returned in price__percentiles (see PriceRollupQuerySet.calculate_stats)
+        """
+        stats = self.aggregate(
             price__count=Count("pk"),
             price__min=Min("price"),
             price__max=Max("price"),
@@ -94,7 +164,19 @@ class PriceQuerySet(models.QuerySet):
                 Avg("price"),
                 output_field=models.DecimalField(max_digits=10, decimal_places=2),
             ),
+            **{
+                f"price__percentile_{index}": PercentileCont("price", percentile / 100)
+                for index, percentile in enumerate(percentile_list or [])
+            },
         )
+        if percentile_list:
+            stats["price__percentiles"] = {
+                get_percentile_key(percentile): round_price(
+                    stats.pop(f"price__percentile_{index}")
+                )
+                for index, percentile in enumerate(percentile_list)
+            }
+        return stats
 
     def calculate_field_distinct_count(self, field_name: str):
         return (
@@ -133,6 +215,240 @@ class PriceQuerySet(models.QuerySet):
             queryset = queryset.filter(location_id__in=challenge.location_id_list())
         return queryset
 
+    def resolve_duplicates(self, dedup_fingerprint_list: list[str]) -> int:
+        """
+        Set the duplicate_of field (& bump updated) of the prices sharing a
+        dedup_fingerprint:
+        the oldest price is the reference, the other ones are its duplicates
+        (if they were created later).
+        - 1 UPDATE for all the given fingerprints (window function over each
+        dedup_fingerprint group), only touching the prices that change
+        - 1 history INSERT for the updated prices
+        Return the number of updated prices.
+        """
+        dedup_fingerprint_list = sorted(set(dedup_fingerprint_list) - {None})
+        if not dedup_fingerprint_list:
+            return 0
+        price_table = Price._meta.db_table
+        updated_price_list = list(
+            Price.objects.raw(
+                f"""
+                UPDATE {price_table} AS price
+                SET duplicate_of_id = price_group.new_duplicate_of_id,
+                updated = %s
+                FROM (
+                    SELECT
+                        id,
+                        CASE
+                            WHEN created > FIRST_VALUE(created) OVER price_window
+                            THEN FIRST_VALUE(id) OVER price_window
+                        END AS new_duplicate_of_id
+                    FROM {price_table}
+                    WHERE dedup_fingerprint = ANY(%s)
+                    WINDOW price_window AS (
+                        PARTITION BY dedup_fingerprint ORDER BY id
+                    )
+                ) AS price_group
+                WHERE price.id = price_group.id
+                AND price.duplicate_of_id IS DISTINCT FROM price_group.new_duplicate_of_id
+                RETURNING price.*
+                """,
+                [timezone.now(), dedup_fingerprint_list],
+            )
+        )
+        if updated_price_list:
+            Price.history.bulk_history_create(
+                updated_price_list,
+                update=True,
+                default_change_reason="Price.resolve_duplicates() method",
+            )
+        return len(updated_price_list)
+
+    def delete(self):
+        """
+        Delete the prices, then re-resolve all their duplicate groups at once
+        (instead of once per deleted price in the post_delete signal).
+        """
+        with transaction.atomic():
+            dedup_fingerprint_list = list(
+                self.exclude(dedup_fingerprint=None)
+                .order_by()
+                .values_list("dedup_fingerprint", flat=True)
+                .distinct()
+            )
+            token = _skip_delete_resolve_duplicates.set(True)
+            try:
+                result = super().delete()
+            finally:
+                _skip_delete_resolve_duplicates.reset(token)
+            Price.objects.resolve_duplicates(dedup_fingerprint_list)
+        return result
+
+    def update_from_proof(self, proof: Proof) -> int:
+        """
+        Copy the proof fields (DUPLICATE_PROOF_FIELDS & location) to the
+        prices, with set-based queries instead of one Price.save() per price:
+        - 1 SELECT, 1 UPDATE & 1 history INSERT (per batch)
+        - dedup_fingerprint recalculated, duplicates re-resolved
+        Return the number of updated prices.
+
+        Usage: open_prices/proofs/models.py:proof_post_save_update_prices
+        """
+        price_list = list(self)
+        dedup_fingerprint_set = {price.dedup_fingerprint for price in price_list}
+        rollup_key_list = [PriceRollup.get_price_key(price) for price in price_list]
+        updated = timezone.now()  # auto_now is not applied by bulk_update
+        for price in price_list:
+            for field_name in Price.DUPLICATE_PROOF_FIELDS:
+                setattr(price, field_name, getattr(proof, field_name))
+            price.updated = updated
+            # mirror of Price.set_location (already done by Proof.set_location)
+            if price.location_osm_id and price.location_osm_type:
+                price.location_id = proof.location_id
+            price.set_dedup_fingerprint()
+            dedup_fingerprint_set.add(price.dedup_fingerprint)
+        if price_list:
+            bulk_update_with_history(
+                price_list,
+                Price,
+                Price.DUPLICATE_PROOF_FIELDS
+                + ["location", "dedup_fingerprint", "updated"],
+                default_change_reason="Proof.update_location() method",
+            )
+        # old & new duplicate groups
+        Price.objects.resolve_duplicates(dedup_fingerprint_set)
+        # old & new rollups
+        refresh_price_rollups_soon(
+            rollup_key_list + [PriceRollup.get_price_key(price) for price in price_list]
+        )
+        return len(price_list)
+
+    def bulk_create_validated(self, price_list: list["Price"]):
+        """
+        Validate & create a batch of (unsaved) prices, with set-based queries
+        instead of one Price.save() (and its signals) per price:
+        - proofs & locations (passed by id) are fetched in 1 query each
+        - products & OSM locations are fetched (created if needed) in bulk
+        - duplicates are looked for in 1 query
+        - prices (& their history) are inserted in bulk
+        - counts are updated with a single batch of counter deltas
+        - rollups are refreshed once for the whole batch
+        - a single update_tags task is enqueued for the whole batch
+
+        The batch is atomic: nothing is created if any price is invalid.
+        Return a (price_list, error_list) tuple. error_list has the same
+        length & order as the input (an empty dict for a valid price).
+        """
+        # fetch the related proofs & locations (used by the validators)
+        proof_dict = Proof.objects.in_bulk(
+            {price.proof_id for price in price_list if price.proof_id}
+        )
+        location_dict = Location.objects.in_bulk(
+            {price.location_id for price in price_list if price.location_id}
+        )
+        for price in price_list:
+            if price.proof_id in proof_dict:
+                price.proof = proof_dict[price.proof_id]
+            if price.location_id in location_dict:
+                price.location = location_dict[price.location_id]
+
+        # normalize & run validations
+        error_list = list()
+        for price in price_list:
+            price.normalize_product_code()
+            try:
+                # related fields are checked by the validators (see above)
+                price.full_clean(exclude=Price.RELATED_FIELDS)
+                error_list.append(dict())
+            except ValidationError as e:
+                error_list.append(e.message_dict)
+        if any(error_list):
+            return [], error_list
+
+        with transaction.atomic():
+            # set product & location (create if needed)
+            product_dict = Product.objects.get_or_create_in_bulk(
+                [price.product_code for price in price_list if price.product_code]
+            )
+            location_osm_dict = Location.objects.get_or_create_type_osm_in_bulk(
+                [
+                    (price.location_osm_id, price.location_osm_type)
+                    for price in price_list
+                    if price.location_osm_id and price.location_osm_type
+                ]
+            )
+            for price in price_list:
+                if price.product_code:
+                    price.product = product_dict[price.product_code]
+                if price.location_osm_id and price.location_osm_type:
+                    price.location = location_osm_dict[
+                        (price.location_osm_id, price.location_osm_type)
+                    ]
+
+            # set duplicate_of (see Price.set_is_duplicate_of)
+            for price in price_list:
+                price.set_dedup_fingerprint()
+            price_first_dict = dict()
+            for possible_duplicate in Price.objects.filter(
+                dedup_fingerprint__in={price.dedup_fingerprint for price in price_list}
+            ).order_by("id"):
+                price_first_dict.setdefault(
+                    possible_duplicate.dedup_fingerprint, possible_duplicate
+                )
+            price_batch_dict = dict()
+            price_to_create_first_list, price_to_create_last_list = list(), list()
+            for price in price_list:
+                duplicate = None
+                if price.dedup_fingerprint:
+                    duplicate = price_first_dict.get(
+                        price.dedup_fingerprint
+                    ) or price_batch_dict.setdefault(price.dedup_fingerprint, price)
+                if duplicate is not None and duplicate.created < price.created:
+                    price.duplicate_of = duplicate
+                if (
+                    duplicate is not None
+                    and duplicate is not price
+                    and not duplicate.id
+                ):
+                    # duplicate of another price of the batch: create it last,
+                    # once the other price has an id
+                    price_to_create_last_list.append(price)
+                else:
+                    price_to_create_first_list.append(price)
+
+            # create prices (& history)
+            for price_to_create_list in [
+                price_to_create_first_list,
+                price_to_create_last_list,
+            ]:
+                if price_to_create_list:
+                    bulk_create_with_history(price_to_create_list, Price)
+
+            # update counts (see price_post_create_increment_counts)
+            CounterDelta.objects.add(
+                [
+                    (model, getattr(price, field_name), "price_count", 1)
+                    for price in price_list
+                    for model, field_name in [
+                        (User, "owner"),
+                        (Proof, "proof_id"),
+                        (Product, "product_id"),
+                        (Location, "location_id"),
+                    ]
+                ]
+            )
+            # update rollups (see price_post_save_refresh_rollups)
+            refresh_price_rollups_soon(
+                [PriceRollup.get_price_key(price) for price in price_list]
+            )
+
+        # update tags (see price_post_create_update_tags)
+        async_task(
+            "open_prices.prices.tasks.update_tags_in_bulk",
+            [price.id for price in price_list],
+        )
+        return price_list, error_list
+
 
 class Price(models.Model):
     TYPE_PRODUCT_FIELDS = ["product_code"]
@@ -176,6 +492,50 @@ class Price(models.Model):
         "date",
         "currency",
     ]  # "owner"
+    DUPLICATE_FIELDS = [
+        "type",
+        "location_id",
+        "date",
+        "currency",
+        "price",
+        "price_per",
+        "price_is_discounted",
+        "price_without_discount",
+        "discount_type",
+        "product_code",
+        "category_tag",
+        "labels_tags",
+        "origins_tags",
+    ]
+    RELATED_FIELDS = ["product", "location", "proof", "duplicate_of"]
+    # (validator, fields read): partial saves only run the validators concerned
+    VALIDATOR_LIST = [
+        (
+            price_validators.validate_price_product_code_or_category_tag_rules,
+            ["type", "product_code", "category_tag", "labels_tags", "origins_tags"],
+        ),
+        (
+            price_validators.validate_price_price_rules,
+            [
+                "price",
+                "price_is_discounted",
+                "price_without_discount",
+                "discount_type",
+                "price_per",
+                "product_code",
+                "category_tag",
+            ],
+        ),
+        (price_validators.validate_price_date_rules, ["date"]),
+        (
+            price_validators.validate_price_location_rules,
+            ["location", "location_osm_id", "location_osm_type"],
+        ),
+        (
+            price_validators.validate_price_proof_rules,
+            ["proof", "owner", "receipt_quantity"],
+        ),
+    ]
 
     type = models.CharField(max_length=20, choices=price_constants.TYPE_CHOICES)
 
@@ -274,11 +634,16 @@ class Price(models.Model):
         null=True,
         related_name="duplicates",
     )
+    # hash of the DUPLICATE_FIELDS (see set_dedup_fingerprint)
+    dedup_fingerprint = models.CharField(
+        max_length=32, blank=True, null=True, db_index=True
+    )
 
     created = models.DateTimeField(default=timezone.now)
     updated = models.DateTimeField(auto_now=True)
 
     history = HistoricalRecords(
+        excluded_fields=["dedup_fingerprint"],
         get_user=history.get_history_user_from_request,
         history_user_id_field=models.CharField(null=True),
         history_user_getter=history.history_user_getter,
@@ -290,9 +655,34 @@ class Price(models.Model):
 
     class Meta:
         db_table = "prices"
+        # see the audit_filter_indexes command (PriceFilter)
+        indexes = [
+            models.Index(
+                fields=["product_code", "-date"], name="prices_product_code_date_idx"
+            ),
+            models.Index(fields=["location", "-date"], name="prices_location_date_idx"),
+            models.Index(
+                fields=["category_tag", "-date"],
+                name="prices_category_tag_date_idx",
+                condition=Q(category_tag__isnull=False),
+            ),
+            models.Index(fields=["date"], name="prices_date_idx"),
+            models.Index(fields=["created"], name="prices_created_idx"),
+            GinIndex(fields=["tags"], name="prices_tags_gin_idx"),
+            GinIndex(fields=["labels_tags"], name="prices_labels_tags_gin_idx"),
+            GinIndex(fields=["origins_tags"], name="prices_origins_tags_gin_idx"),
+        ]
         verbose_name = "Price"
         verbose_name_plural = "Prices"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # rollup key before any change (see price_post_save_refresh_rollups)
+        if not instance.get_deferred_fields():
+            instance._loaded_rollup_key = PriceRollup.get_price_key(instance)
+        return instance
+
     def normalize_product_code(self):
         """
         Normalize the product_code (remove leading zeros, pad to 8 or 13 digits).  # noqa
@@ -304,15 +694,14 @@ class Price(models.Model):
         ):
             self.product_code = normalize_barcode(self.product_code)
 
+    def clean_fields(self, exclude=None):
+        # skip the FK existence queries for the already loaded related objects
+        exclude = set(exclude or []) | utils.get_loaded_foreign_key_name_set(self)
+        super().clean_fields(exclude=exclude)
+
     def clean(self, *args, **kwargs):
         # dict to store all ValidationErrors
-        validation_errors = utils.merge_validation_errors(
-            price_validators.validate_price_product_code_or_category_tag_rules(self),
-            price_validators.validate_price_price_rules(self),
-            price_validators.validate_price_date_rules(self),
-            price_validators.validate_price_location_rules(self),
-            price_validators.validate_price_proof_rules(self),
-        )
+        validation_errors = utils.run_validators(self, self.VALIDATOR_LIST)
         # return
         if bool(validation_errors):
             raise ValidationError(validation_errors)
@@ -322,20 +711,19 @@ class Price(models.Model):
         if self.product_code:
             from open_prices.products.models import Product
 
-            product, created = Product.objects.get_or_create(code=self.product_code)
-            self.product = product
+            self.product_id = Product.objects.get_or_create_id(self.product_code)
+            # reuse the product if it was already loaded during the request
+            utils.get_cached_related_object(self, "product")
 
     def set_location(self):
         if self.location_osm_id and self.location_osm_type:
-            from open_prices.locations import constants as location_constants
             from open_prices.locations.models import Location
 
-            location, created = Location.objects.get_or_create(
-                type=location_constants.TYPE_OSM,
-                osm_id=self.location_osm_id,
-                osm_type=self.location_osm_type,
+            self.location_id = Location.objects.get_or_create_type_osm_id(
+                self.location_osm_id, self.location_osm_type
             )
-            self.location = location
+            # reuse the location if it was already loaded during the request
+            utils.get_cached_related_object(self, "location")
 
     def save(self, *args, **kwargs):
         """
@@ -343,42 +731,86 @@ class Price(models.Model):
         - run validations
         - set product (create if needed)
         - set location (create if needed)
+        - set dedup_fingerprint & duplicate_of
+        Partial saves (update_fields) only run the steps concerned
+        by the updated fields (e.g. none for a tags update).
         """
-        self.normalize_product_code()
-        self.full_clean()
+        update_field_name_set = utils.get_update_field_name_set(
+            self, kwargs.get("update_fields")
+        )
+        if utils.save_touches_fields(update_field_name_set, ["product_code"]):
+            self.normalize_product_code()
+        if update_field_name_set is None:
+            self.full_clean()
+        else:
+            utils.full_clean_update_fields(
+                self, update_field_name_set, self.VALIDATOR_LIST
+            )
         # self.set_proof()  # should already exist
-        self.set_product()
-        self.set_location()
-        self.set_is_duplicate_of()
-        super().save(*args, **kwargs)
+        if utils.save_touches_fields(update_field_name_set, ["product_code"]):
+            self.set_product()
+        if utils.save_touches_fields(
+            update_field_name_set, ["location_osm_id", "location_osm_type"]
+        ):
+            self.set_location()
+        if utils.save_touches_fields(
+            update_field_name_set, self.DUPLICATE_FIELDS + ["location"]
+        ):
+            self.set_dedup_fingerprint()
+            self.set_is_duplicate_of()
+            if update_field_name_set is not None:
+                kwargs["update_fields"] = list(kwargs["update_fields"]) + [
+                    "dedup_fingerprint"
+                ]
+        utils.save_retrying_stale_ids(
+            self, super().save, self.reset_cached_ids, *args, **kwargs
+        )
+
+    def reset_cached_ids(self):
+        """
+        Evict the product & location ids from the per-process caches,
+        and resolve them again (see utils.save_retrying_stale_ids)
+        """
+        from open_prices.locations.models import location_id_cache
+        from open_prices.products.models import product_id_cache
+
+        if self.product_code:
+            product_id_cache.delete(self.product_code)
+            self.set_product()
+        if self.location_osm_id and self.location_osm_type:
+            location_id_cache.delete(
+                (self.location_osm_type, int(self.location_osm_id))
+            )
+            self.set_location()
 
     def set_tag(self, tag: str, save: bool = True):
         if tag not in self.tags:
             self.tags.append(tag)
             if save:
                 self._change_reason = "Price.set_tag() method"
-                self.save(update_fields=["tags"])
+                self.save(update_fields=["tags", "updated"])
             return True
         return False
 
     def update_tags(self):
+        """
+        Tag the price (and its proof) with the ongoing challenges it is in.
+        No query to match the challenges (see ChallengeMatcher)
+        """
         changes = False
         # challenge tags (only if ongoing)
-        challenge_qs = Challenge.objects.is_ongoing()
-        if challenge_qs.exists():
-            for challenge in challenge_qs:
-                if self.in_challenge(challenge):
-                    # update the price
-                    success = self.set_tag(challenge.tag, save=False)
-                    if success:
-                        changes = True
-                    # update the price's proof
-                    if self.proof:
-                        self.proof.set_tag(challenge.tag, save=True)  # important
+        for challenge in get_challenge_matcher().match(self):
+            # update the price
+            success = self.set_tag(challenge.tag, save=False)
+            if success:
+                changes = True
+            # update the price's proof
+            if self.proof:
+                self.proof.set_tag(challenge.tag, save=True)  # important
         # save
         if changes:
             self._change_reason = "Price.update_tags() method"
-            self.save(update_fields=["tags"])
+            self.save(update_fields=["tags", "updated"])
 
     def has_location(self, location_id_list: list) -> bool:
         if self.location_id and self.location_id in location_id_list:
@@ -387,29 +819,33 @@ class Price(models.Model):
 
     def in_challenge(self, challenge: Challenge) -> bool:
         """
-        Mirror of the in_challenge queryset
+        Mirror of the in_challenge queryset (see CompiledChallenge.matches)
         """
-        dates_match = (
-            self.created >= challenge.start_date_with_time
-            and self.created <= challenge.end_date_with_time
-        )
-        categories_match = (
-            not challenge.categories
-            or (
-                self.type == price_constants.TYPE_CATEGORY
-                and self.category_tag in challenge.categories_full
-            )
-            or (
-                self.type == price_constants.TYPE_PRODUCT
-                and self.product
-                and bool(self.product.categories_tags)
-                and bool(set(self.product.categories_tags) & set(challenge.categories))
-            )
-        )
-        locations_match = not challenge.locations.exists() or (
-            self.location_id and self.location_id in challenge.location_id_list()
-        )
-        return dates_match and categories_match and locations_match
+        return CompiledChallenge.from_challenge(challenge).matches(self)
+
+    def get_dedup_fingerprint(self) -> str | None:
+        """
+        Stable hash of the DUPLICATE_FIELDS
+        - array fields are sorted (and None is the same as [])
+        - decimal fields are formatted with a fixed precision
+        - None if the price has no location or no date (cannot be a duplicate)
+        """
+        if not (self.location_id and self.date):
+            return None
+        value_list = list()
+        for field_name in self.DUPLICATE_FIELDS:
+            value = getattr(self, field_name)
+            if field_name in self.TYPE_CATEGORY_FIELDS[1:]:  # array fields
+                value = sorted(value or [])
+            elif isinstance(value, decimal.Decimal):
+                value = f"{value:.3f}"
+            value_list.append(value)
+        return hashlib.md5(
+            json.dumps(value_list, default=str).encode("utf-8")
+        ).hexdigest()
+
+    def set_dedup_fingerprint(self):
+        self.dedup_fingerprint = self.get_dedup_fingerprint()
 
     def set_is_duplicate_of(self):
         """Look for duplicate prices and set the duplicate_of field
@@ -419,36 +855,20 @@ class Price(models.Model):
         - it has the same location (osm_id and osm_type), date, currency and
           price information (price, discount type, is discounted, price
           without discount), product code/category tag, labels tags, and
-          origins tags
+          origins tags (i.e. the same dedup_fingerprint)
         - it was created later than the other price (we keep the first one)
         """
-        # Look for possible duplicates
-        possible_duplicates = (
-            Price.objects.filter(
-                type=self.type,
-                location_id=self.location_id,
-                date=self.date,
-                currency=self.currency,
-                price=self.price,
-                price_per=self.price_per,
-                price_is_discounted=self.price_is_discounted,
-                price_without_discount=self.price_without_discount,
-                discount_type=self.discount_type,
-                product_code=self.product_code,
-                category_tag=self.category_tag,
-                labels_tags=self.labels_tags,
-                origins_tags=self.origins_tags,
-                # Check that at least location and date are set,
-                # otherwise it doesn't make much sense to consider these
-                # prices as duplicates
-                location_id__isnull=False,
-                date__isnull=False,
-            )
+        # Check that at least location and date are set, otherwise it
+        # doesn't make much sense to consider these prices as duplicates
+        if not self.dedup_fingerprint:
+            return
+        # Look for possible duplicates (oldest first)
+        duplicate = (
+            Price.objects.filter(dedup_fingerprint=self.dedup_fingerprint)
             .exclude(id=self.id)
-            # oldest first
             .order_by("id")
+            .first()
         )
-        duplicate = possible_duplicates.first()
         if duplicate is not None and duplicate.created < self.created:
             # Set the duplicate_of field to the first found duplicate
             self.duplicate_of = duplicate
@@ -460,28 +880,34 @@ class Price(models.Model):
 @receiver(signals.post_save, sender=Price)
 def price_post_create_increment_counts(sender, instance, created, **kwargs):
     if created:
-        if instance.owner:
-            User.objects.filter(user_id=instance.owner).update(
-                price_count=F("price_count") + 1
-            )
-        if instance.proof_id:
-            Proof.objects.filter(id=instance.proof_id).update(
-                price_count=F("price_count") + 1
-            )
-        if instance.product_id:
-            Product.objects.filter(id=instance.product_id).update(
-                price_count=F("price_count") + 1
-            )
-        if instance.location_id:
-            Location.objects.filter(id=instance.location_id).update(
-                price_count=F("price_count") + 1
-            )
+        CounterDelta.objects.add(
+            [
+                (User, instance.owner, "price_count", 1),
+                (Proof, instance.proof_id, "price_count", 1),
+                (Product, instance.product_id, "price_count", 1),
+                (Location, instance.location_id, "price_count", 1),
+            ]
+        )
     else:
         # what about if we update the proof, product or location? (owner cannot be updated)
         # the update_fields is often not set, so we cannot rely on it
         pass
 
 
+@receiver(signals.post_save, sender=Price)
+def price_post_save_refresh_rollups(sender, instance, created, update_fields, **kwargs):
+    update_field_name_set = utils.get_update_field_name_set(instance, update_fields)
+    if not utils.save_touches_fields(update_field_name_set, PriceRollup.PRICE_FIELDS):
+        return
+    price_key = PriceRollup.get_price_key(instance)
+    # old & new keys (the old key is unknown if the price was loaded with
+    # deferred fields: left to the daily rebuild)
+    refresh_price_rollups_soon(
+        [getattr(instance, "_loaded_rollup_key", None), price_key]
+    )
+    instance._loaded_rollup_key = price_key
+
+
 @receiver(signals.post_save, sender=Price)
 def price_post_create_update_tags(sender, instance, created, **kwargs):
     if created:
@@ -501,35 +927,30 @@ def price_pre_delete_update_price_tag(sender, instance, **kwargs):
 
 @receiver(signals.post_delete, sender=Price)
 def price_post_delete_decrement_counts(sender, instance, **kwargs):
-    if instance.owner:
-        User.objects.filter(user_id=instance.owner, price_count__gt=0).update(
-            price_count=F("price_count") - 1
-        )
-    if instance.proof_id:
-        Proof.objects.filter(id=instance.proof_id, price_count__gt=0).update(
-            price_count=F("price_count") - 1
-        )
-    if instance.product_id:
-        Product.objects.filter(id=instance.product_id, price_count__gt=0).update(
-            price_count=F("price_count") - 1
-        )
-    if instance.location_id:
-        Location.objects.filter(id=instance.location_id, price_count__gt=0).update(
-            price_count=F("price_count") - 1
-        )
+    CounterDelta.objects.add(
+        [
+            (User, instance.owner, "price_count", -1),
+            (Proof, instance.proof_id, "price_count", -1),
+            (Product, instance.product_id, "price_count", -1),
+            (Location, instance.location_id, "price_count", -1),
+        ]
+    )
+
+
+@receiver(signals.post_delete, sender=Price)
+def price_post_delete_refresh_rollups(sender, instance, **kwargs):
+    refresh_price_rollups_soon([PriceRollup.get_price_key(instance)])
 
 
 @receiver(signals.post_delete, sender=Price)
 def price_post_delete_update_duplicate_of(sender, instance, **kwargs):
     """When a price is deleted, we need to update the duplicate_of field
     of any prices that were marked as duplicates of this price.
-    We set their duplicate_of field to None and save the price, so that
-    the search for possible duplicates is run again."""
-    # Sort by created descending, so that the most recent price is
-    # re-evaluated first
-    for price in Price.objects.filter(duplicate_of_id=instance.id).order_by("-created"):
-        price.duplicate_of = None
-        price.save(update_fields=["duplicate_of"])
+    Their duplicate_of field is already set to None (on_delete=SET_NULL),
+    so we look for them with the dedup_fingerprint.
+    Skipped for queryset deletes (see PriceQuerySet.delete)."""
+    if instance.dedup_fingerprint and not _skip_delete_resolve_duplicates.get():
+        Price.objects.resolve_duplicates([instance.dedup_fingerprint])
 
 
 class PriceStatistics5y(models.Model):
@@ -554,3 +975,588 @@ class PriceStatistics5y(models.Model):
     def refresh_materialized_view(cls):
         with connection.cursor() as cursor:
             cursor.execute("REFRESH MATERIALIZED VIEW price_statistics_5y;")
+
+
+def aggregate_prices(price_queryset, group_by_list: list[str]) -> dict[tuple, dict]:
+    """
+    Aggregate the prices per group, with 2 queries:
+    - count, sum, min & max
+    - quantile sketch buckets (see common.quantile_sketch)
+    Return a {group key: row} dict, the price_sketch of each row is
+    a QuantileSketch
+    """
+    price_queryset = price_queryset.order_by()
+    row_dict = {
+        tuple(row[field_name] for field_name in group_by_list): row
+        for row in price_queryset.values(*group_by_list).annotate(
+            price_count=Count("pk"),
+            price_not_null_count=Count("price"),
+            price_sum=Sum("price"),
+            price_min=Min("price"),
+            price_max=Max("price"),
+            price_zero_count=Count("pk", filter=Q(price__lte=0)),
+        )
+    }
+    for row in row_dict.values():
+        row["price_sketch"] = QuantileSketch(zero_count=row.pop("price_zero_count"))
+    sketch_index_queryset = (
+        price_queryset.filter(price__gt=0)
+        .annotate(
+            sketch_index=Ceil(
+                Ln(Cast("price", output_field=models.FloatField()))
+                / Value(
+                    math.log(get_gamma(constants.QUANTILE_SKETCH_RELATIVE_ACCURACY))
+                )
+            )
+        )
+        .values(*group_by_list, "sketch_index")
+        .annotate(sketch_index_count=Count("pk"))
+    )
+    for row in sketch_index_queryset:
+        key = tuple(row[field_name] for field_name in group_by_list)
+        row_dict[key]["price_sketch"].bucket_dict[int(row["sketch_index"])] = row[
+            "sketch_index_count"
+        ]
+    return row_dict
+
+
+def get_id_chunk_query_list(
+    field_name: str, queryset_list: list, chunk_size: int, **extra_filters
+) -> list[Q]:
+    """
+    Filters on consecutive ranges of ids, up to the max id of the querysets
+    """
+    max_id = max(
+        filter(
+            None,
+            [
+                queryset.aggregate(max_id=Max(field_name))["max_id"]
+                for queryset in queryset_list
+            ],
+        ),
+        default=0,
+    )
+    return [
+        Q(
+            **{f"{field_name}__gte": start, f"{field_name}__lt": start + chunk_size},
+            **extra_filters,
+        )
+        for start in range(0, max_id + 1, chunk_size)
+    ]
+
+
+def rebuild_chunk(queryset, chunk_query: Q, build_row_list, batch_size: int) -> int:
+    """
+    Rebuild the rollups (or history buckets) of a chunk of keys from their
+    prices, in a short transaction:
+    - the existing rows of the chunk are locked first: a concurrent refresh
+    waits, instead of being overwritten with older data
+    - same upsert as refresh, only the keys without prices anymore
+    are deleted
+    Return the number of rows.
+    """
+    key_fields = queryset.model.KEY_FIELDS
+    with transaction.atomic():
+        stale_id_dict = {
+            tuple(row[1:]): row[0]
+            for row in queryset.filter(chunk_query)
+            .select_for_update()
+            .values_list("id", *key_fields)
+        }
+        row_list = build_row_list(Price.objects.filter(chunk_query))
+        for row in row_list:
+            stale_id_dict.pop(
+                tuple(getattr(row, field_name) for field_name in key_fields), None
+            )
+        queryset.filter(id__in=stale_id_dict.values()).delete()
+        queryset.bulk_create(
+            row_list,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=key_fields,
+            update_fields=queryset.model.VALUE_FIELDS,
+        )
+    return len(row_list)
+
+
+class PriceRollupQuerySet(models.QuerySet):
+    def for_key_list(self, key_list: list[tuple]):
+        if not key_list:
+            return self.none()
+        return self.filter(PriceRollup.get_key_query(key_list))
+
+    def build_rollup_list(
+        self, price_queryset, key_list: list[tuple] | None = None
+    ) -> list["PriceRollup"]:
+        """
+        Aggregate the prices (of the given keys) per rollup key
+        """
+        price_queryset = price_queryset.annotate(month=TruncMonth("date"))
+        if key_list is not None:
+            price_queryset = price_queryset.filter(PriceRollup.get_key_query(key_list))
+        return [
+            PriceRollup(**{**row, "price_sketch": row["price_sketch"].to_json()})
+            for row in aggregate_prices(price_queryset, PriceRollup.KEY_FIELDS).values()
+        ]
+
+    def refresh(self, key_list: list[tuple]) -> None:
+        """
+        Recalculate the rollups of the given keys (see PriceRollup.get_price_key)
+        from their prices. Keys without prices anymore are deleted.
+        """
+        key_list = list({key for key in key_list if key is not None})
+        if not key_list:
+            return
+        rollup_list = self.build_rollup_list(Price.objects.all(), key_list=key_list)
+        with transaction.atomic():
+            self.for_key_list(key_list).delete()
+            # upsert: concurrent refreshes of the same key
+            self.bulk_create(
+                rollup_list,
+                update_conflicts=True,
+                unique_fields=PriceRollup.KEY_FIELDS,
+                update_fields=PriceRollup.VALUE_FIELDS,
+            )
+
+    def rebuild(
+        self,
+        batch_size: int = price_constants.PRICE_ROLLUP_BATCH_SIZE,
+        chunk_size: int = price_constants.PRICE_ROLLUP_REBUILD_CHUNK_SIZE,
+    ):
+        """
+        Recalculate all the rollups (catches up on the writes that bypass
+        the signals), by chunks of product ids (then of location ids for
+        the prices without product): see rebuild_chunk.
+        Return the number of rollups.
+        """
+        queryset_list = [Price.objects.all(), self.all()]
+        chunk_query_list = [
+            *get_id_chunk_query_list("product_id", queryset_list, chunk_size),
+            *get_id_chunk_query_list(
+                "location_id",
+                [
+                    queryset.filter(product_id__isnull=True)
+                    for queryset in queryset_list
+                ],
+                chunk_size,
+                product_id__isnull=True,
+            ),
+            Q(product_id__isnull=True, location_id__isnull=True),
+        ]
+        return sum(
+            rebuild_chunk(self, chunk_query, self.build_rollup_list, batch_size)
+            for chunk_query in chunk_query_list
+        )
+
+    def calculate_stats(self, percentile_list: list[float] | None = None):
+        """
+        Same output as PriceQuerySet.calculate_stats, merged from the rollups.
+        The percentiles are estimated from the quantile sketches
+        (QUANTILE_SKETCH_RELATIVE_ACCURACY relative error).
+        """
+        aggregate_dict = self.aggregate(
+            price_count=Sum("price_count"),
+            price_not_null_count=Sum("price_not_null_count"),
+            price_sum=Sum("price_sum"),
+            price_min=Min("price_min"),
+            price_max=Max("price_max"),
+        )
+        price_not_null_count = aggregate_dict["price_not_null_count"]
+        stats = {
+            "price__count": aggregate_dict["price_count"] or 0,
+            "price__min": aggregate_dict["price_min"],
+            "price__max": aggregate_dict["price_max"],
+            "price__avg": round_price(
+                aggregate_dict["price_sum"] / price_not_null_count
+                if price_not_null_count
+                else None
+            ),
+        }
+        if percentile_list:
+            sketch = QuantileSketch()
+            for price_sketch in self.values_list("price_sketch", flat=True):
+                sketch.merge(QuantileSketch.from_json(price_sketch))
+            stats["price__percentiles"] = {
+                get_percentile_key(percentile): round_price(
+                    sketch.quantile(percentile / 100)
+                )
+                for percentile in percentile_list
+            }
+        return stats
+
+
+# product_id first: the unique index also serves the product stats
+PRICE_ROLLUP_KEY_FIELDS = [
+    "product_id",
+    "category_tag",
+    "location_id",
+    "currency",
+    "price_per",
+    "month",
+    "price_is_discounted",
+    "type",
+]
+
+
+class PriceRollup(models.Model):
+    """
+    Price stats per (type, product or category, location, currency, price_per,
+    month, discounted flag), mergeable across rows: used by the stats
+    endpoint when its filters are rollup dimensions.
+    Refreshed on price writes (see refresh_price_rollups_soon),
+    and fully rebuilt daily (see rebuild_price_rollups_task).
+    """
+
+    KEY_FIELDS = PRICE_ROLLUP_KEY_FIELDS
+    VALUE_FIELDS = [
+        "price_count",
+        "price_not_null_count",
+        "price_sum",
+        "price_min",
+        "price_max",
+        "price_sketch",
+        "updated",
+    ]
+    # price fields read by get_price_key (+ price)
+    PRICE_FIELDS = [
+        "type",
+        "product",
+        "category_tag",
+        "location",
+        "currency",
+        "price_per",
+        "date",
+        "price_is_discounted",
+        "price",
+    ]
+
+    type = models.CharField(max_length=20, choices=price_constants.TYPE_CHOICES)
+    # no db constraint: the rollups are derived data (see refresh)
+    product = models.ForeignKey(
+        "products.Product",
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        related_name="+",
+    )
+    category_tag = models.CharField(blank=True, null=True)
+    location = models.ForeignKey(
+        "locations.Location",
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        related_name="+",
+    )
+    currency = models.CharField(max_length=3, blank=True, null=True)
+    price_per = models.CharField(max_length=10, blank=True, null=True)
+    month = models.DateField(blank=True, null=True)  # first day of the month
+    price_is_discounted = models.BooleanField()
+
+    price_count = models.PositiveIntegerField(default=0)
+    price_not_null_count = models.PositiveIntegerField(default=0)  # for the avg
+    price_sum = models.DecimalField(
+        max_digits=20, decimal_places=3, blank=True, null=True
+    )
+    price_min = models.DecimalField(
+        max_digits=10, decimal_places=3, blank=True, null=True
+    )
+    price_max = models.DecimalField(
+        max_digits=10, decimal_places=3, blank=True, null=True
+    )
+    price_sketch = models.JSONField(default=dict)  # see common.quantile_sketch
+
+    updated = models.DateTimeField(auto_now=True)
+
+    objects = models.Manager.from_queryset(PriceRollupQuerySet)()
+
+    class Meta:
+        db_table = "price_rollups"
+        constraints = [
+            models.UniqueConstraint(
+                fields=PRICE_ROLLUP_KEY_FIELDS,
+                name="unique_price_rollup_key",
+                nulls_distinct=False,
+            )
+        ]
+        indexes = [
+            models.Index(fields=["location", "month"]),
+            models.Index(fields=["category_tag", "month"]),
+        ]
+        verbose_name = "Price rollup"
+        verbose_name_plural = "Price rollups"
+
+    @staticmethod
+    def get_price_key(price: Price) -> tuple:
+        date = price.date
+        if isinstance(date, str):
+            date = datetime.date.fromisoformat(date)
+        return (
+            price.product_id,
+            price.category_tag,
+            price.location_id,
+            price.currency,
+            price.price_per,
+            date.replace(day=1) if date else None,
+            price.price_is_discounted,
+            price.type,
+        )
+
+    @staticmethod
+    def get_key_query(key_list: list[tuple]) -> Q:
+        """
+        Filter on the keys, for the rollups or the prices (annotated with month)
+        """
+        query = Q()
+        for key in key_list:
+            query |= Q(
+                **{
+                    (f"{field_name}__isnull" if value is None else field_name): (
+                        True if value is None else value
+                    )
+                    for field_name, value in zip(
+                        PriceRollup.KEY_FIELDS, key, strict=True
+                    )
+                }
+            )
+        return query
+
+
+class PriceHistoryBucketQuerySet(models.QuerySet):
+    def build_bucket_list(self, price_queryset) -> list["PriceHistoryBucket"]:
+        """
+        Aggregate the product prices per week & month, currency and country
+        """
+        price_queryset = price_queryset.filter(
+            product__isnull=False, date__isnull=False
+        ).annotate(country_code=F("location__osm_address_country_code"))
+        bucket_list = list()
+        for bucket, trunc_class in [
+            (price_constants.PRICE_HISTORY_BUCKET_WEEK, TruncWeek),
+            (price_constants.PRICE_HISTORY_BUCKET_MONTH, TruncMonth),
+        ]:
+            row_dict = aggregate_prices(
+                price_queryset.annotate(bucket_start=trunc_class("date")),
+                PriceHistoryBucket.GROUP_BY_FIELDS,
+            )
+            bucket_list.extend(
+                PriceHistoryBucket(
+                    bucket=bucket,
+                    **{
+                        field_name: row[field_name]
+                        for field_name in PriceHistoryBucket.GROUP_BY_FIELDS
+                        + ["price_count", "price_min", "price_max"]
+                    },
+                    price_sketch=row["price_sketch"].to_json(),
+                )
+                for row in row_dict.values()
+            )
+        return bucket_list
+
+    def refresh(self, product_month_list: list[tuple]) -> None:
+        """
+        Recalculate the buckets of the given (product_id, month) list:
+        the month bucket & the week buckets overlapping the month
+        (their prices can be in the previous or next month)
+        """
+        product_month_set = {
+            (product_id, month)
+            for product_id, month in product_month_list
+            if product_id and month
+        }
+        if not product_month_set:
+            return
+        price_query, bucket_query = Q(), Q()
+        for product_id, month in product_month_set:
+            next_month = (month + datetime.timedelta(days=31)).replace(day=1)
+            # monday of the first week & of the week after the last one
+            week_start = month - datetime.timedelta(days=month.weekday())
+            week_end = next_month + datetime.timedelta(days=-next_month.weekday() % 7)
+            price_query |= Q(
+                product_id=product_id, date__gte=week_start, date__lt=week_end
+            )
+            bucket_query |= Q(
+                product_id=product_id,
+                bucket=price_constants.PRICE_HISTORY_BUCKET_WEEK,
+                bucket_start__gte=week_start,
+                bucket_start__lt=week_end,
+            ) | Q(
+                product_id=product_id,
+                bucket=price_constants.PRICE_HISTORY_BUCKET_MONTH,
+                bucket_start=month,
+            )
+        bucket_list = [
+            price_history_bucket
+            for price_history_bucket in self.build_bucket_list(
+                Price.objects.filter(price_query)
+            )
+            # the other months are incomplete
+            if price_history_bucket.bucket == price_constants.PRICE_HISTORY_BUCKET_WEEK
+            or (price_history_bucket.product_id, price_history_bucket.bucket_start)
+            in product_month_set
+        ]
+        with transaction.atomic():
+            self.filter(bucket_query).delete()
+            self.bulk_create(
+                bucket_list,
+                update_conflicts=True,
+                unique_fields=PriceHistoryBucket.KEY_FIELDS,
+                update_fields=PriceHistoryBucket.VALUE_FIELDS,
+            )
+
+    def rebuild(
+        self,
+        batch_size: int = price_constants.PRICE_ROLLUP_BATCH_SIZE,
+        chunk_size: int = price_constants.PRICE_ROLLUP_REBUILD_CHUNK_SIZE,
+    ):
+        """
+        Recalculate all the buckets, by chunks of product ids
+        (see rebuild_chunk). Return the number of buckets.
+        """
+        return sum(
+            rebuild_chunk(self, chunk_query, self.build_bucket_list, batch_size)
+            for chunk_query in get_id_chunk_query_list(
+                "product_id", [Price.objects.all(), self.all()], chunk_size
+            )
+        )
+
+    def get_history(
+        self, product_id: int, bucket: str, currency=None, country_code=None
+    ) -> list[dict]:
+        """
+        count, min, median & max per bucket & currency
+        (merged across the countries if country_code is not set)
+        - 1 index range scan
+        """
+        queryset = self.filter(product_id=product_id, bucket=bucket)
+        if currency:
+            queryset = queryset.filter(currency=currency)
+        if country_code:
+            queryset = queryset.filter(country_code=country_code)
+        history_dict = dict()
+        for price_history_bucket in queryset.order_by("bucket_start", "currency"):
+            history = history_dict.setdefault(
+                (price_history_bucket.bucket_start, price_history_bucket.currency),
+                {
+                    "count": 0,
+                    "min_list": [],
+                    "max_list": [],
+                    "sketch": QuantileSketch(),
+                },
+            )
+            history["count"] += price_history_bucket.price_count
+            if price_history_bucket.price_min is not None:
+                history["min_list"].append(price_history_bucket.price_min)
+                history["max_list"].append(price_history_bucket.price_max)
+            history["sketch"].merge(
+                QuantileSketch.from_json(price_history_bucket.price_sketch)
+            )
+        return [
+            {
+                "bucket_start": bucket_start,
+                "currency": currency,
+                "price__count": history["count"],
+                "price__min": min(history["min_list"], default=None),
+                "price__median": round_price(history["sketch"].quantile(0.5)),
+                "price__max": max(history["max_list"], default=None),
+            }
+            for (bucket_start, currency), history in history_dict.items()
+        ]
+
+
+# product_id first: the unique index serves the history range scans
+PRICE_HISTORY_BUCKET_KEY_FIELDS = [
+    "product_id",
+    "bucket",
+    "bucket_start",
+    "currency",
+    "country_code",
+]
+
+
+class PriceHistoryBucket(models.Model):
+    """
+    Product price stats per week or month, currency & country
+    (used by the products/{id}/price-history endpoint).
+    Refreshed with the rollups (see refresh_price_rollups),
+    and fully rebuilt daily (see rebuild_price_rollups_task).
+    """
+
+    KEY_FIELDS = PRICE_HISTORY_BUCKET_KEY_FIELDS
+    GROUP_BY_FIELDS = ["product_id", "bucket_start", "currency", "country_code"]
+    VALUE_FIELDS = ["price_count", "price_min", "price_max", "price_sketch", "updated"]
+
+    bucket = models.CharField(
+        max_length=10, choices=price_constants.PRICE_HISTORY_BUCKET_CHOICES
+    )
+    # no db constraint: the buckets are derived data (see refresh)
+    product = models.ForeignKey(
+        "products.Product",
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name="+",
+    )
+    bucket_start = models.DateField()  # monday of the week, or 1st of the month
+    currency = models.CharField(max_length=3, blank=True, null=True)
+    country_code = models.CharField(blank=True, null=True)  # of the location
+
+    price_count = models.PositiveIntegerField(default=0)
+    price_min = models.DecimalField(
+        max_digits=10, decimal_places=3, blank=True, null=True
+    )
+    price_max = models.DecimalField(
+        max_digits=10, decimal_places=3, blank=True, null=True
+    )
+    price_sketch = models.JSONField(default=dict)  # see common.quantile_sketch
+
+    updated = models.DateTimeField(auto_now=True)
+
+    objects = models.Manager.from_queryset(PriceHistoryBucketQuerySet)()
+
+    class Meta:
+        db_table = "price_history_buckets"
+        constraints = [
+            models.UniqueConstraint(
+                fields=PRICE_HISTORY_BUCKET_KEY_FIELDS,
+                name="unique_price_history_bucket_key",
+                nulls_distinct=False,
+            )
+        ]
+        verbose_name = "Price history bucket"
+        verbose_name_plural = "Price history buckets"
+
+
+def refresh_price_rollups(key_list: list[tuple]) -> None:
+    """
+    Refresh the rollups of the keys, and the price history buckets
+    of their (product, month)
+    """
+    PriceRollup.objects.refresh(key_list)
+    PriceHistoryBucket.objects.refresh(
+        [
+            (key_dict["product_id"], key_dict["month"])
+            for key_dict in (
+                dict(zip(PriceRollup.KEY_FIELDS, key, strict=True))
+                for key in key_list
+                if key is not None
+            )
+        ]
+    )
+
+
+def refresh_price_rollups_soon(key_list: list[tuple]) -> None:
+    """
+    - sync mode (dev, tests): refresh right away, so that the stats stay exact
+    - else: enqueue a refresh task once the transaction is committed.
+    The daily rebuild catches up on the rest.
+    """
+    key_list = list({key for key in key_list if key is not None})
+    if not key_list:
+        return
+    if settings.Q_CLUSTER["sync"]:
+        refresh_price_rollups(key_list)
+    else:
+        transaction.on_commit(
+            lambda: async_task(
+                "open_prices.prices.tasks.refresh_price_rollups", key_list
+            )
+        )
@@ -1,5 +1,21 @@
+from open_prices.challenges.matcher import get_challenge_matcher
+from open_prices.prices import models as price_models
 from open_prices.prices.models import Price
 
 
 def update_tags(price: Price):
     price.update_tags()
+
+
+def update_tags_in_bulk(price_id_list: list[int]):
+    # tags are only set for ongoing challenges (see Price.update_tags)
+    if get_challenge_matcher().ongoing_challenges():
+        for price in Price.objects.select_related("product", "proof").filter(
+            id__in=price_id_list
+        ):
+            price.update_tags()
+
+
+def refresh_price_rollups(key_list: list[tuple]):
+    # see refresh_price_rollups_soon
+    price_models.refresh_price_rollups(key_list)
@@ -1,21 +1,31 @@
 import datetime
 import json
 from decimal import Decimal
+from unittest.mock import patch
 
 from django.core.exceptions import ValidationError
 from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 from freezegun import freeze_time
 from simple_history.utils import bulk_update_with_history
 
 from open_prices.challenges.factories import ChallengeFactory
 from open_prices.common import constants
+from open_prices.common.testing import ProcessCacheResetMixin
 from open_prices.locations import constants as location_constants
 from open_prices.locations.factories import LocationFactory
 from open_prices.locations.models import Location
 from open_prices.prices import constants as price_constants
 from open_prices.prices.factories import PriceFactory
-from open_prices.prices.models import Price, PriceStatistics5y
+from open_prices.prices.models import (
+    Price,
+    PriceHistoryBucket,
+    PriceQuerySet,
+    PriceRollup,
+    PriceStatistics5y,
+)
 from open_prices.prices.outlier_detection import find_outliers
 from open_prices.products.factories import ProductFactory
 from open_prices.products.models import Product
@@ -150,7 +160,7 @@ class PriceQuerySetTest(TestCase):
         self.assertEqual(Price.objects.has_tag("unknown").count(), 0)
 
 
-class PriceChallengeQuerySetAndPropertyAndSignalTest(TestCase):
+class PriceChallengeQuerySetAndPropertyAndSignalTest(ProcessCacheResetMixin, TestCase):
     @classmethod
     def setUpTestData(cls):
         cls.location = LocationFactory()
@@ -298,7 +308,7 @@ class PriceChallengeQuerySetAndPropertyAndSignalTest(TestCase):
                 )
 
 
-class PriceModelSaveTest(TransactionTestCase):
+class PriceModelSaveTest(ProcessCacheResetMixin, TransactionTestCase):
     @classmethod
     def setUpTestData(cls):
         pass
@@ -1034,6 +1044,261 @@ class PriceModelSaveTest(TransactionTestCase):
             # Delete the price so that we only compare to ref
             new_price.delete()
 
+    def test_price_dedup_fingerprint(self):
+        location = LocationFactory()
+        price_kwargs = {
+            "type": price_constants.TYPE_CATEGORY,
+            "category_tag": "en:tomatoes",
+            "labels_tags": ["en:organic", "fr:ab-agriculture-biologique"],
+            "price_per": price_constants.PRICE_PER_KILOGRAM,
+            "price": Decimal("1.5"),
+            "currency": "EUR",
+            "date": "2025-01-01",
+            "location_osm_id": location.osm_id,
+            "location_osm_type": location.osm_type,
+        }
+        price = PriceFactory(**price_kwargs)
+        self.assertIsNotNone(price.dedup_fingerprint)
+        self.assertEqual(len(price.dedup_fingerprint), 32)
+        # array order & decimal precision do not matter
+        price_same = PriceFactory(
+            **price_kwargs
+            | {
+                "labels_tags": ["fr:ab-agriculture-biologique", "en:organic"],
+                "price": Decimal("1.500"),
+            }
+        )
+        self.assertEqual(price_same.dedup_fingerprint, price.dedup_fingerprint)
+        self.assertEqual(price_same.duplicate_of, price)
+        # no location: no fingerprint
+        price_without_location = PriceFactory(
+            **price_kwargs | {"location_osm_id": None, "location_osm_type": None}
+        )
+        self.assertIsNone(price_without_location.dedup_fingerprint)
+        # updated on save
+        price_same.price = Decimal("2")
+        price_same.save(update_fields=["price"])
+        price_same.refresh_from_db()
+        self.assertNotEqual(price_same.dedup_fingerprint, price.dedup_fingerprint)
+
+    def test_price_delete_update_duplicate_of(self):
+        location = LocationFactory()
+        price_kwargs = {
+            "product_code": "8001505005707",
+            "price": Decimal("1.99"),
+            "currency": "EUR",
+            "date": "2025-01-01",
+            "location_osm_id": location.osm_id,
+            "location_osm_type": location.osm_type,
+        }
+        ref_price = PriceFactory(**price_kwargs)
+        price_duplicate_1 = PriceFactory(**price_kwargs)
+        price_duplicate_2 = PriceFactory(**price_kwargs)
+        self.assertEqual(price_duplicate_1.duplicate_of, ref_price)
+        self.assertEqual(price_duplicate_2.duplicate_of, ref_price)
+        price_duplicate_2_updated = Price.objects.get(id=price_duplicate_2.id).updated
+        # delete the reference: the oldest duplicate becomes the reference
+        ref_price.delete()
+        price_duplicate_1.refresh_from_db()
+        price_duplicate_2.refresh_from_db()
+        self.assertIsNone(price_duplicate_1.duplicate_of)
+        self.assertEqual(price_duplicate_2.duplicate_of, price_duplicate_1)
+        self.assertGreater(price_duplicate_2.updated, price_duplicate_2_updated)
+        self.assertEqual(
+            price_duplicate_2.history.first().history_change_reason,
+            "Price.resolve_duplicates() method",
+        )
+
+    def test_price_queryset_delete_update_duplicate_of(self):
+        location = LocationFactory()
+        price_kwargs = {
+            "product_code": "8001505005707",
+            "price": Decimal("1.99"),
+            "currency": "EUR",
+            "date": "2025-01-01",
+            "location_osm_id": location.osm_id,
+            "location_osm_type": location.osm_type,
+        }
+        ref_price, price_duplicate_1, price_duplicate_2 = PriceFactory.create_batch(
+            3, **price_kwargs
+        )
+        ref_price_2, price_2_duplicate_1 = PriceFactory.create_batch(
+            2, **{**price_kwargs, "price": Decimal("2.99")}
+        )
+        self.assertEqual(price_duplicate_2.duplicate_of, ref_price)
+        self.assertEqual(price_2_duplicate_1.duplicate_of, ref_price_2)
+        # delete both references: duplicates re-resolved once for both groups
+        with patch.object(
+            PriceQuerySet,
+            "resolve_duplicates",
+            autospec=True,
+            side_effect=PriceQuerySet.resolve_duplicates,
+        ) as resolve_duplicates_mock:
+            _, deleted_count_dict = Price.objects.filter(
+                id__in=[ref_price.id, ref_price_2.id]
+            ).delete()
+        self.assertEqual(deleted_count_dict[Price._meta.label], 2)
+        self.assertEqual(resolve_duplicates_mock.call_count, 1)
+        for price in [price_duplicate_1, price_duplicate_2, price_2_duplicate_1]:
+            price.refresh_from_db()
+        self.assertIsNone(price_duplicate_1.duplicate_of)
+        self.assertEqual(price_duplicate_2.duplicate_of, price_duplicate_1)
+        self.assertIsNone(price_2_duplicate_1.duplicate_of)
+
+
+class PriceModelPartialSaveTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user_session = SessionFactory()
+        cls.location = LocationFactory()
+        cls.proof = ProofFactory(
+            location_osm_id=cls.location.osm_id,
+            location_osm_type=cls.location.osm_type,
+            owner=cls.user_session.user.user_id,
+        )
+        cls.price = PriceFactory(
+            product_code="8001505005707",
+            location_osm_id=cls.location.osm_id,
+            location_osm_type=cls.location.osm_type,
+            proof_id=cls.proof.id,
+            date=cls.proof.date,
+            currency=cls.proof.currency,
+            owner=cls.user_session.user.user_id,
+        )
+
+    def test_price_tags_save_num_queries(self):
+        price = Price.objects.get(id=self.price.id)
+        with CaptureQueriesContext(connection) as full_save_queries:
+            price.save()
+        # tags only: UPDATE + history INSERT
+        # (no validation, product/location get_or_create or duplicate lookup)
+        with self.assertNumQueries(2):
+            price.set_tag("test", save=True)
+        self.assertGreater(len(full_save_queries), 2 * 3)
+        price.refresh_from_db()
+        self.assertEqual(price.tags, ["test"])
+
+    def test_price_partial_save_runs_concerned_steps(self):
+        price = Price.objects.get(id=self.price.id)
+        # validators of the updated fields are run
+        price.date = datetime.date.today() + datetime.timedelta(days=10)  # future
+        self.assertRaises(ValidationError, price.save, update_fields=["date"])
+        # the other ones are not
+        price.refresh_from_db()
+        price.price_per = price_constants.PRICE_PER_UNIT  # invalid with product_code
+        price.tags = ["test"]
+        price.save(update_fields=["tags"])
+        # resolution steps of the updated fields are run
+        price.refresh_from_db()
+        price.product_code = "123"
+        price.save(update_fields=["product_code", "product"])
+        price.refresh_from_db()
+        self.assertEqual(price.product_code, "00000123")
+        self.assertEqual(price.product.code, "00000123")
+
+    def test_proof_and_location_and_product_partial_save(self):
+        proof = Proof.objects.get(
+            id=ProofFactory(type=proof_constants.TYPE_PRICE_TAG).id
+        )
+        with self.assertNumQueries(2):  # UPDATE + history INSERT
+            proof.set_tag("test", save=True)
+        location = Location.objects.get(id=self.location.id)
+        with self.assertNumQueries(1):
+            location.save(update_fields=["price_count"])
+        product = Product.objects.get(id=self.price.product_id)
+        with self.assertNumQueries(1):
+            product.save(update_fields=["price_count"])
+
+
+class PriceModelBulkCreateTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user_session = SessionFactory()
+        cls.user_proof = ProofFactory(owner=cls.user_session.user.user_id)
+        cls.location = LocationFactory()
+        cls.price_kwargs = {
+            "type": price_constants.TYPE_PRODUCT,
+            "product_code": "8001505005707",
+            "price": Decimal("1.99"),
+            "currency": "EUR",
+            "date": "2025-01-01",
+            "location_osm_id": cls.location.osm_id,
+            "location_osm_type": cls.location.osm_type,
+            "proof_id": cls.user_proof.id,
+            "owner": cls.user_session.user.user_id,
+        }
+
+    def test_price_bulk_create_validated_errors(self):
+        price_list, error_list = Price.objects.bulk_create_validated(
+            [
+                Price(**self.price_kwargs),
+                Price(**{**self.price_kwargs, "proof_id": 999}),
+                Price(**{**self.price_kwargs, "date": "3000-01-01"}),
+            ]
+        )
+        self.assertEqual(price_list, [])
+        self.assertEqual(len(error_list), 3)
+        self.assertEqual(error_list[0], {})
+        self.assertIn("proof", error_list[1])
+        self.assertIn("date", error_list[2])
+        self.assertEqual(Price.objects.count(), 0)
+        self.assertFalse(Product.objects.filter(code="8001505005707").exists())
+
+    def test_price_bulk_create_validated(self):
+        price_list, error_list = Price.objects.bulk_create_validated(
+            [
+                Price(**self.price_kwargs),
+                Price(**{**self.price_kwargs, "product_code": "0008850187002197"}),
+                Price(
+                    **{
+                        **self.price_kwargs,
+                        "location_osm_id": self.location.osm_id + 1,
+                    }
+                ),
+            ]
+        )
+        self.assertEqual(error_list, [{}, {}, {}])
+        self.assertEqual(len(price_list), 3)
+        self.assertEqual(Price.objects.count(), 3)
+        # product_code normalized, products created
+        self.assertEqual(price_list[1].product_code, "8850187002197")
+        self.assertEqual(Product.objects.count(), 2)
+        self.assertEqual(price_list[0].product.code, "8001505005707")
+        # location created
+        self.assertEqual(Location.objects.count(), 2)
+        self.assertEqual(price_list[0].location, self.location)
+        self.assertEqual(price_list[2].location.osm_id, self.location.osm_id + 1)
+        # counts
+        self.assertEqual(
+            User.objects.get(user_id=self.user_session.user.user_id).price_count, 3
+        )
+        self.assertEqual(Proof.objects.get(id=self.user_proof.id).price_count, 3)
+        self.assertEqual(Location.objects.get(id=self.location.id).price_count, 2)
+        self.assertEqual(
+            Product.objects.get(code="8001505005707").price_count, 2
+        )  # + 1 with the new location
+        # history
+        self.assertEqual(Price.history.count(), 3)
+
+    def test_price_bulk_create_validated_duplicates(self):
+        ref_price = PriceFactory(**self.price_kwargs)
+        price_list, error_list = Price.objects.bulk_create_validated(
+            [
+                # duplicate of a price in the database
+                Price(**self.price_kwargs),
+                # not a duplicate
+                Price(**{**self.price_kwargs, "price": Decimal("2.99")}),
+                # duplicate of a price in the same batch
+                Price(**{**self.price_kwargs, "price": Decimal("2.99")}),
+            ]
+        )
+        self.assertEqual(price_list[0].duplicate_of, ref_price)
+        self.assertIsNone(price_list[1].duplicate_of)
+        self.assertEqual(price_list[2].duplicate_of, price_list[1])
+        self.assertEqual(
+            Price.objects.get(id=price_list[2].id).duplicate_of_id, price_list[1].id
+        )
+
 
 class PriceModelUpdateTest(TestCase):
     @classmethod
@@ -1116,6 +1381,368 @@ class PriceModelDeleteTest(TestCase):
         self.assertEqual(self.product.price_count, 0)
 
 
+class PriceRollupTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.location = LocationFactory()
+        cls.location_2 = LocationFactory()
+        cls.product = ProductFactory()
+        location_data = {
+            "location_osm_id": cls.location.osm_id,
+            "location_osm_type": cls.location.osm_type,
+        }
+        cls.price_jan_1 = PriceFactory(
+            product_code=cls.product.code,
+            **location_data,
+            currency="EUR",
+            date="2024-01-05",
+            price=Decimal("1.5"),
+        )
+        cls.price_jan_2 = PriceFactory(
+            product_code=cls.product.code,
+            **location_data,
+            currency="EUR",
+            date="2024-01-20",
+            price=Decimal("2.25"),
+        )
+        PriceFactory(
+            product_code=cls.product.code,
+            **location_data,
+            currency="EUR",
+            date="2024-02-03",
+            price=3,
+            price_is_discounted=True,
+            price_without_discount=4,
+        )
+        PriceFactory(
+            product_code=cls.product.code,
+            location_osm_id=cls.location_2.osm_id,
+            location_osm_type=cls.location_2.osm_type,
+            currency="USD",
+            date="2024-02-10",
+            price=10,
+        )
+        PriceFactory(
+            type=price_constants.TYPE_CATEGORY,
+            category_tag="en:apples",
+            price_per=price_constants.PRICE_PER_KILOGRAM,
+            **location_data,
+            currency="EUR",
+            date="2024-01-05",
+            price=2,
+        )
+
+    def test_rollups(self):
+        self.assertEqual(PriceRollup.objects.count(), 4)
+        price_rollup = PriceRollup.objects.get(
+            product_id=self.product.id, month=datetime.date(2024, 1, 1)
+        )
+        self.assertEqual(price_rollup.location_id, self.location.id)
+        self.assertEqual(price_rollup.price_count, 2)
+        self.assertEqual(price_rollup.price_sum, Decimal("3.75"))
+        self.assertEqual(price_rollup.price_min, Decimal("1.5"))
+        self.assertEqual(price_rollup.price_max, Decimal("2.25"))
+
+    def test_calculate_stats(self):
+        for rollup_filter_dict, price_filter_dict in [
+            ({}, {}),
+            ({"product_id": self.product.id}, {"product_id": self.product.id}),
+            ({"location_id": self.location.id}, {"location_id": self.location.id}),
+            ({"category_tag": "en:apples"}, {"category_tag": "en:apples"}),
+            ({"price_is_discounted": False}, {"price_is_discounted": False}),
+            ({"currency": "USD"}, {"currency": "USD"}),
+            (
+                {"month__year": 2024, "month__month": 1},
+                {"date__year": 2024, "date__month": 1},
+            ),
+            ({"currency": "JPY"}, {"currency": "JPY"}),  # no prices
+        ]:
+            with self.subTest(rollup_filter_dict=rollup_filter_dict):
+                self.assertEqual(
+                    PriceRollup.objects.filter(**rollup_filter_dict).calculate_stats(),
+                    Price.objects.filter(**price_filter_dict).calculate_stats(),
+                )
+        # avg rounding: (1.5 + 2.25) / 2
+        self.assertEqual(
+            PriceRollup.objects.filter(
+                product_id=self.product.id, month__month=1
+            ).calculate_stats()["price__avg"],
+            Decimal("1.88"),
+        )
+
+    def test_calculate_stats_percentiles(self):
+        percentile_list = [0, 50, 100]
+        rollup_stats = PriceRollup.objects.calculate_stats(percentile_list)
+        price_stats = Price.objects.calculate_stats(percentile_list)
+        self.assertEqual(list(rollup_stats["price__percentiles"]), ["0", "50", "100"])
+        self.assertEqual(price_stats["price__percentiles"]["50"], Decimal("2.25"))
+        for key, value in price_stats["price__percentiles"].items():
+            # sketch relative error (+ rounding to 2 decimals)
+            self.assertAlmostEqual(
+                rollup_stats["price__percentiles"][key],
+                value,
+                delta=value * Decimal("0.01") + Decimal("0.01"),
+            )
+
+    def test_refresh_on_update_and_delete(self):
+        # move a price to another month
+        self.price_jan_2.date = "2024-02-15"
+        self.price_jan_2.save()
+        self.assertEqual(
+            PriceRollup.objects.get(
+                product_id=self.product.id, month=datetime.date(2024, 1, 1)
+            ).price_count,
+            1,
+        )
+        self.assertEqual(
+            PriceRollup.objects.get(
+                product_id=self.product.id,
+                location_id=self.location.id,
+                month=datetime.date(2024, 2, 1),
+                price_is_discounted=False,
+            ).price_max,
+            Decimal("2.25"),
+        )
+        # loaded price
+        price = Price.objects.get(id=self.price_jan_1.id)
+        price.currency = "CHF"
+        price.save()
+        self.assertFalse(
+            PriceRollup.objects.filter(
+                product_id=self.product.id,
+                currency="EUR",
+                month=datetime.date(2024, 1, 1),
+            ).exists()
+        )
+        # delete
+        price.delete()
+        self.assertFalse(PriceRollup.objects.filter(currency="CHF").exists())
+        self.assertEqual(
+            PriceRollup.objects.calculate_stats(), Price.objects.calculate_stats()
+        )
+
+    def test_update_from_proof(self):
+        proof = ProofFactory(
+            location_osm_id=self.location_2.osm_id,
+            location_osm_type=self.location_2.osm_type,
+            currency="EUR",
+            date="2024-03-01",
+        )
+        Price.objects.filter(id=self.price_jan_1.id).update(proof=proof)
+        Price.objects.filter(proof=proof).update_from_proof(proof)
+        self.assertEqual(
+            PriceRollup.objects.get(
+                location_id=self.location_2.id, month=datetime.date(2024, 3, 1)
+            ).price_count,
+            1,
+        )
+        self.assertEqual(
+            PriceRollup.objects.calculate_stats(), Price.objects.calculate_stats()
+        )
+
+    def test_rebuild_price_rollups_command(self):
+        PriceRollup.objects.all().delete()
+        call_command("rebuild_price_rollups")
+        self.assertEqual(PriceRollup.objects.count(), 4)
+        self.assertEqual(
+            PriceRollup.objects.calculate_stats(), Price.objects.calculate_stats()
+        )
+
+    def test_rebuild_in_chunks(self):
+        rollup_id_list = sorted(PriceRollup.objects.values_list("id", flat=True))
+        # drift: a stale value, a key without prices, a missing key
+        PriceRollup.objects.filter(product_id=self.product.id).update(price_count=99)
+        PriceRollup.objects.create(
+            product_id=self.product.id,
+            currency="JPY",
+            month=datetime.date(2023, 1, 1),
+            price_is_discounted=False,
+            type=price_constants.TYPE_PRODUCT,
+        )
+        PriceRollup.objects.filter(id=rollup_id_list[0]).delete()
+        self.assertEqual(PriceRollup.objects.rebuild(chunk_size=1), 4)
+        self.assertEqual(PriceRollup.objects.count(), 4)
+        self.assertFalse(PriceRollup.objects.filter(currency="JPY").exists())
+        self.assertEqual(
+            PriceRollup.objects.calculate_stats(), Price.objects.calculate_stats()
+        )
+        # upserted: the other rows are kept
+        self.assertTrue(
+            set(rollup_id_list[1:])
+            <= set(PriceRollup.objects.values_list("id", flat=True))
+        )
+
+
+class PriceHistoryBucketTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.location_fr = LocationFactory(osm_address_country_code="FR")
+        cls.location_it = LocationFactory(osm_address_country_code="IT")
+        cls.product = ProductFactory()
+        cls.location_fr_data = {
+            "location_osm_id": cls.location_fr.osm_id,
+            "location_osm_type": cls.location_fr.osm_type,
+        }
+        cls.location_it_data = {
+            "location_osm_id": cls.location_it.osm_id,
+            "location_osm_type": cls.location_it.osm_type,
+        }
+        cls.price_1 = PriceFactory(
+            product_code=cls.product.code,
+            **cls.location_fr_data,
+            currency="EUR",
+            date="2024-01-05",  # week of 2024-01-01
+            price=Decimal("1.5"),
+        )
+        PriceFactory(
+            product_code=cls.product.code,
+            **cls.location_it_data,
+            currency="EUR",
+            date="2024-01-20",  # week of 2024-01-15
+            price=Decimal("2.5"),
+        )
+        cls.price_3 = PriceFactory(
+            product_code=cls.product.code,
+            **cls.location_fr_data,
+            currency="EUR",
+            date="2024-01-30",  # week of 2024-01-29
+            price=Decimal("3"),
+        )
+
+    def test_buckets(self):
+        self.assertEqual(
+            PriceHistoryBucket.objects.filter(
+                bucket=price_constants.PRICE_HISTORY_BUCKET_WEEK
+            ).count(),
+            3,
+        )
+        month_bucket_list = PriceHistoryBucket.objects.filter(
+            bucket=price_constants.PRICE_HISTORY_BUCKET_MONTH
+        ).order_by("country_code")
+        self.assertEqual(len(month_bucket_list), 2)
+        self.assertEqual(month_bucket_list[0].country_code, "FR")
+        self.assertEqual(month_bucket_list[0].bucket_start, datetime.date(2024, 1, 1))
+        self.assertEqual(month_bucket_list[0].price_count, 2)
+        self.assertEqual(month_bucket_list[0].price_min, Decimal("1.5"))
+        self.assertEqual(month_bucket_list[0].price_max, Decimal("3"))
+
+    def test_get_history(self):
+        history_list = PriceHistoryBucket.objects.get_history(
+            self.product.id, price_constants.PRICE_HISTORY_BUCKET_MONTH
+        )
+        self.assertEqual(len(history_list), 1)
+        self.assertEqual(history_list[0]["bucket_start"], datetime.date(2024, 1, 1))
+        self.assertEqual(history_list[0]["price__count"], 3)
+        self.assertEqual(history_list[0]["price__min"], Decimal("1.5"))
+        self.assertEqual(history_list[0]["price__max"], Decimal("3"))
+        # sketch relative error (+ rounding to 2 decimals)
+        self.assertAlmostEqual(
+            history_list[0]["price__median"], Decimal("2.5"), delta=Decimal("0.04")
+        )
+        history_list = PriceHistoryBucket.objects.get_history(
+            self.product.id,
+            price_constants.PRICE_HISTORY_BUCKET_WEEK,
+            country_code="FR",
+        )
+        self.assertEqual(
+            [history["bucket_start"] for history in history_list],
+            [datetime.date(2024, 1, 1), datetime.date(2024, 1, 29)],
+        )
+
+    def test_refresh_on_update_and_delete(self):
+        # the week of 2024-01-29 overlaps January & February
+        price = PriceFactory(
+            product_code=self.product.code,
+            **self.location_fr_data,
+            currency="EUR",
+            date="2024-02-02",
+            price=Decimal("4"),
+        )
+        week_bucket = PriceHistoryBucket.objects.get(
+            bucket=price_constants.PRICE_HISTORY_BUCKET_WEEK,
+            bucket_start=datetime.date(2024, 1, 29),
+        )
+        self.assertEqual(week_bucket.price_count, 2)
+        self.assertEqual(
+            PriceHistoryBucket.objects.get(
+                bucket=price_constants.PRICE_HISTORY_BUCKET_MONTH,
+                bucket_start=datetime.date(2024, 2, 1),
+            ).price_count,
+            1,
+        )
+        # the January bucket is untouched
+        self.assertEqual(
+            PriceHistoryBucket.objects.get(
+                bucket=price_constants.PRICE_HISTORY_BUCKET_MONTH,
+                bucket_start=datetime.date(2024, 1, 1),
+                country_code="FR",
+            ).price_count,
+            2,
+        )
+        price.delete()
+        self.assertFalse(
+            PriceHistoryBucket.objects.filter(
+                bucket_start=datetime.date(2024, 2, 1)
+            ).exists()
+        )
+        self.assertEqual(
+            PriceHistoryBucket.objects.get(
+                bucket=price_constants.PRICE_HISTORY_BUCKET_WEEK,
+                bucket_start=datetime.date(2024, 1, 29),
+            ).price_count,
+            1,
+        )
+        # move a price to another month
+        self.price_1.date = "2024-03-04"
+        self.price_1.save()
+        self.assertEqual(
+            PriceHistoryBucket.objects.get(
+                bucket=price_constants.PRICE_HISTORY_BUCKET_MONTH,
+                bucket_start=datetime.date(2024, 1, 1),
+                country_code="FR",
+            ).price_count,
+            1,
+        )
+        self.assertTrue(
+            PriceHistoryBucket.objects.filter(
+                bucket=price_constants.PRICE_HISTORY_BUCKET_WEEK,
+                bucket_start=datetime.date(2024, 3, 4),
+            ).exists()
+        )
+        self.assertFalse(
+            PriceHistoryBucket.objects.filter(
+                bucket=price_constants.PRICE_HISTORY_BUCKET_WEEK,
+                bucket_start=datetime.date(2024, 1, 1),
+            ).exists()
+        )
+
+    def test_rebuild_price_rollups_command(self):
+        bucket_count = PriceHistoryBucket.objects.count()
+        PriceHistoryBucket.objects.all().delete()
+        call_command("rebuild_price_rollups")
+        self.assertEqual(PriceHistoryBucket.objects.count(), bucket_count)
+
+    def test_rebuild_in_chunks(self):
+        bucket_list = list(PriceHistoryBucket.objects.order_by("id").values())
+        PriceHistoryBucket.objects.update(price_count=99)
+        PriceHistoryBucket.objects.create(
+            product_id=self.product.id,
+            bucket=price_constants.PRICE_HISTORY_BUCKET_MONTH,
+            bucket_start=datetime.date(2023, 1, 1),
+            currency="EUR",
+        )
+        self.assertEqual(
+            PriceHistoryBucket.objects.rebuild(chunk_size=1), len(bucket_list)
+        )
+        self.assertEqual(
+            [
+                (bucket["id"], bucket["price_count"])
+                for bucket in PriceHistoryBucket.objects.order_by("id").values()
+            ],
+            [(bucket["id"], bucket["price_count"]) for bucket in bucket_list],
+        )
+
+
 class PriceModelHistoryTest(TestCase):
     @classmethod
     def setUpTestData(cls):
@@ -1234,6 +1861,32 @@ class PriceCommandTest(TestCase):
             self.assertEqual(price.product_code, "0123456789100")
             self.assertEqual(price.product_id, Product.objects.first().id)
 
+    def test_update_duplicate_of_field_command(self):
+        location = LocationFactory()
+        price_kwargs = {
+            "product_code": "8001505005707",
+            "price": Decimal("1.99"),
+            "currency": "EUR",
+            "date": "2025-01-01",
+            "location_osm_id": location.osm_id,
+            "location_osm_type": location.osm_type,
+            "location_id": location.id,
+        }
+        # bulk_create to skip save(): no dedup_fingerprint, no duplicate_of
+        Price.objects.bulk_create(
+            [PriceFactory.build(**price_kwargs) for _ in range(3)]
+        )
+        self.assertEqual(Price.objects.filter(dedup_fingerprint=None).count(), 3)
+        call_command("update_duplicate_of_field")
+        ref_price, *price_duplicate_list = Price.objects.order_by("created", "id")
+        self.assertIsNotNone(ref_price.dedup_fingerprint)
+        self.assertIsNone(ref_price.duplicate_of)
+        for price_duplicate in price_duplicate_list:
+            self.assertEqual(
+                price_duplicate.dedup_fingerprint, ref_price.dedup_fingerprint
+            )
+            self.assertEqual(price_duplicate.duplicate_of, ref_price)
+
 
 class TestOutlierDetection(TestCase):
     @classmethod
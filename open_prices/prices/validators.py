@@ -203,12 +203,8 @@ def validate_price_location_rules(instance):
     """
     errors = dict()
     if instance.location_id:
-        location = None
-        from open_prices.locations.models import Location
-
-        try:
-            location = Location.objects.get(id=instance.location_id)
-        except Location.DoesNotExist:
+        location = utils.get_related_object(instance, "location")
+        if location is None:
             utils.add_validation_error(
                 errors,
                 "location",
@@ -275,12 +271,10 @@ def validate_price_proof_rules(instance):
     """
     errors = dict()
     if instance.proof_id:
-        proof = None
-        from open_prices.proofs.models import Proof
-
-        try:
-            proof = Proof.objects.get(id=instance.proof_id)
-        except Proof.DoesNotExist:
+        proof = utils.get_cached_related_object(instance, "proof")
+        if proof is None or proof.draft:
+            proof = utils.fetch_related_object(instance, "proof")
+        if proof is None:
             utils.add_validation_error(
                 errors,
                 "proof",
@@ -3,3 +3,6 @@ from openfoodfacts import Flavor
 SOURCE_OFF = Flavor.off
 SOURCE_LIST = [Flavor.off, Flavor.obf, Flavor.opff, Flavor.opf]  # Flavor.off_pro
 SOURCE_CHOICES = [(key, key) for key in SOURCE_LIST]
+
+PRODUCT_LOOKUP_MAX_SIZE = 500  # max number of codes per lookup request
+PRODUCT_LOOKUP_RADIUS_KM_DEFAULT = 5
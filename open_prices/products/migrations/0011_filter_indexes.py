@@ -0,0 +1,23 @@
+# Generated by Django 5.2.14 on 2026-10-17 09:30
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY: no table lock (cannot run in a transaction)
+    atomic = False
+
+    dependencies = [
+        ("products", "0010_product_creator"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="product",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["categories_tags"], name="products_categories_gin_idx"
+            ),
+        ),
+    ]
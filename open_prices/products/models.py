@@ -2,6 +2,7 @@ import datetime
 
 from django.conf import settings
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
 from django.db import models
 from django.db.models import Count, Q, signals
 from django.dispatch import receiver
@@ -9,10 +10,16 @@ from django.utils import timezone
 from django_q.tasks import async_task
 from openfoodfacts.barcode import normalize_barcode
 
+from open_prices.common import utils
 from open_prices.common.db_func import LevenshteinLessEqual
+from open_prices.common.id_cache import IdResolutionCache
 from open_prices.common.managers import ApproximateCountQuerySet
+from open_prices.common.models import CounterDelta
 from open_prices.products import constants as product_constants
 
+# normalized barcode -> product id
+product_id_cache = IdResolutionCache("product")
+
 
 class ProductQuerySet(ApproximateCountQuerySet):
     def has_prices(self):
@@ -56,6 +63,77 @@ class ProductQuerySet(ApproximateCountQuerySet):
         """
         return self.with_stats().filter(price_count_annotated__gte=1)
 
+    def get_or_create_in_bulk(self, code_list: list[str]) -> dict:
+        """
+        Bulk version of get_or_create(code=...)
+        - 1 query to fetch the existing products
+        - 1 INSERT (+ 1 query) to create the missing ones
+        Return a {code: product} dict.
+
+        Usage: open_prices/prices/models.py:PriceQuerySet.bulk_create_validated
+        """
+        code_set = set(code_list)
+        if not code_set:
+            return {}
+        product_dict = {
+            product.code: product for product in self.filter(code__in=code_set)
+        }
+        missing_code_list = [code for code in code_set if code not in product_dict]
+        if missing_code_list:
+            product_list = [self.model(code=code) for code in missing_code_list]
+            for product in product_list:
+                product.set_default_values()
+            # ON CONFLICT DO NOTHING: the product may have been created in the
+            # meantime (by a concurrent transaction, that sent the signal)
+            inserted_id_set = {
+                row[0]
+                for row in utils.insert_ignore_conflicts_returning(
+                    self.model, product_list, ["id"]
+                )
+            }
+            for product in self.filter(code__in=missing_code_list):
+                product_dict[product.code] = product
+                if product.id in inserted_id_set:
+                    # the INSERT does not send signals
+                    signals.post_save.send(
+                        sender=self.model, instance=product, created=True
+                    )
+        for code, product in product_dict.items():
+            product_id_cache.set_on_commit(code, product.id)
+        return product_dict
+
+    def get_or_create_id(self, code: str) -> int:
+        """
+        Lighter version of get_or_create(code=...): return the product id
+        - per-process cache (see product_id_cache): no query on hits
+        - misses: 1 SELECT, then (if not found) 1 INSERT ... ON CONFLICT
+        DO NOTHING RETURNING. On conflict (concurrent creation: the INSERT
+        waits for the other transaction), 1 more SELECT
+        The code should already be normalized.
+
+        Usage: open_prices/prices/models.py:Price.set_product
+        """
+        product_id = product_id_cache.get(code)
+        if product_id is not None:
+            return product_id
+        product_id_queryset = self.filter(code=code).values_list("id", flat=True)
+        product = self.model(code=code, id=product_id_queryset.first())
+        if product.id is None:
+            product.set_default_values()
+            row_list = utils.insert_ignore_conflicts_returning(
+                self.model, [product], ["id"]
+            )
+            if row_list:
+                product.id = row_list[0][0]
+                # the INSERT does not send signals
+                signals.post_save.send(
+                    sender=self.model, instance=product, created=True
+                )
+            else:
+                product.id = product_id_queryset.get()
+        product_id_cache.set_on_commit(code, product.id)
+        return product.id
+
     def fuzzy_barcode_search(
         self,
         code: str,
@@ -157,6 +235,10 @@ class Product(models.Model):
 
     class Meta:
         db_table = "products"
+        indexes = [
+            # PriceFilter: product__categories_tags__contains & __overlap
+            GinIndex(fields=["categories_tags"], name="products_categories_gin_idx"),
+        ]
         verbose_name = "Product"
         verbose_name_plural = "Products"
 
@@ -177,10 +259,19 @@ class Product(models.Model):
         - set default values
         - normalize code
         - run validations
+        Partial saves (update_fields) only run the steps concerned
+        by the updated fields (e.g. none for a count update).
         """
+        update_field_name_set = utils.get_update_field_name_set(
+            self, kwargs.get("update_fields")
+        )
         self.set_default_values()
-        self.normalize_code()
-        self.full_clean()
+        if utils.save_touches_fields(update_field_name_set, ["code"]):
+            self.normalize_code()
+        if update_field_name_set is None:
+            self.full_clean()
+        else:
+            utils.full_clean_update_fields(self, update_field_name_set, [])
         super().save(*args, **kwargs)
 
     @classmethod
@@ -216,11 +307,12 @@ class Product(models.Model):
         return self.prices.calculate_stats()
 
     def update_price_count(self):
+        CounterDelta.objects.discard(self, ["price_count"])
         self.price_count = self.prices.count()
         self.price_currency_count = self.prices.calculate_field_distinct_count(
             "currency"
         )
-        self.save(update_fields=["price_count", "price_currency_count"])
+        self.save(update_fields=["price_count", "price_currency_count", "updated"])
 
     def update_location_count(self):
         from open_prices.locations import constants as location_constants
@@ -234,7 +326,13 @@ class Product(models.Model):
             location_id__isnull=False,
             location__type=location_constants.TYPE_OSM,
         ).calculate_field_distinct_count("location__osm_address_country")
-        self.save(update_fields=["location_count", "location_type_osm_country_count"])
+        self.save(
+            update_fields=[
+                "location_count",
+                "location_type_osm_country_count",
+                "updated",
+            ]
+        )
 
     def update_user_count(self):
         from open_prices.prices.models import Price
@@ -242,7 +340,7 @@ class Product(models.Model):
         self.user_count = Price.objects.filter(
             product=self
         ).calculate_field_distinct_count("owner")
-        self.save(update_fields=["user_count"])
+        self.save(update_fields=["user_count", "updated"])
 
     def update_proof_count(self):
         from open_prices.prices.models import Price
@@ -250,7 +348,21 @@ class Product(models.Model):
         self.proof_count = Price.objects.filter(
             product=self
         ).calculate_field_distinct_count("proof_id")
-        self.save(update_fields=["proof_count"])
+        self.save(update_fields=["proof_count", "updated"])
+
+
+@receiver(signals.post_save, sender=Product)
+def product_post_save_update_product_id_cache(sender, instance, created, **kwargs):
+    update_fields = kwargs.get("update_fields")
+    if not created and (update_fields is None or "code" in update_fields):
+        # the code may have changed (e.g. normalize_barcodes)
+        product_id_cache.delete_id(instance.id)
+
+
+@receiver(signals.post_delete, sender=Product)
+def product_post_delete_update_product_id_cache(sender, instance, **kwargs):
+    product_id_cache.delete(instance.code)
+    product_id_cache.delete_id(instance.id)
 
 
 @receiver(signals.post_save, sender=Product)
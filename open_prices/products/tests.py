@@ -1,17 +1,25 @@
+import threading
 from decimal import Decimal
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
 from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connection, transaction
+from django.db.models import signals
 from django.test import TestCase, TransactionTestCase
 from django.utils import timezone
 from openfoodfacts import Flavor
 
+from open_prices.common.testing import ProcessCacheResetMixin
+from open_prices.common.utils import (
+    insert_ignore_conflicts_returning,
+    save_retrying_stale_ids,
+)
 from open_prices.locations import constants as location_constants
 from open_prices.locations.factories import LocationFactory
 from open_prices.prices.factories import PriceFactory
 from open_prices.products import constants as product_constants
 from open_prices.products.factories import ProductFactory
-from open_prices.products.models import Product
+from open_prices.products.models import Product, product_id_cache
 from open_prices.products.tasks import process_update
 from open_prices.proofs.factories import ProofFactory
 from open_prices.users.factories import UserFactory
@@ -70,7 +78,7 @@ LOCATION_ONLINE_DECATHLON = {
 }
 
 
-class ProductModelSaveTest(TransactionTestCase):
+class ProductModelSaveTest(ProcessCacheResetMixin, TransactionTestCase):
     @classmethod
     def setUpTestData(cls):
         pass
@@ -114,6 +122,113 @@ class ProductModelSaveTest(TransactionTestCase):
         self.assertEqual(product.code, "8658585456785867")
 
 
+class ProductGetOrCreateIdTest(ProcessCacheResetMixin, TransactionTestCase):
+    def test_get_or_create_id(self):
+        # created: SELECT + INSERT
+        with self.assertNumQueries(2):
+            product_id = Product.objects.get_or_create_id("8001505005707")
+        self.assertEqual(Product.objects.get(code="8001505005707").id, product_id)
+        # cached
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                Product.objects.get_or_create_id("8001505005707"), product_id
+            )
+        # existing (not cached): SELECT
+        product = ProductFactory(code="0123456789100")
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                Product.objects.get_or_create_id("0123456789100"), product.id
+            )
+        self.assertEqual(product_id_cache.stats()["hits"], 1)
+        self.assertEqual(product_id_cache.stats()["misses"], 2)
+
+    def test_cache_eviction_on_delete(self):
+        product_id = Product.objects.get_or_create_id("8001505005707")
+        Product.objects.get(id=product_id).delete()
+        new_product_id = Product.objects.get_or_create_id("8001505005707")
+        self.assertNotEqual(new_product_id, product_id)
+        self.assertTrue(Product.objects.filter(id=new_product_id).exists())
+
+    def test_stale_id_deleted_by_another_process(self):
+        product_id = Product.objects.get_or_create_id("8001505005707")
+        # deleted by another process: no signal, the id stays cached here
+        Product.objects.filter(id=product_id)._raw_delete(using="default")
+        self.assertEqual(product_id_cache.get("8001505005707"), product_id)
+        # the price save is retried with the product created again
+        price = PriceFactory(product_code="8001505005707")
+        self.assertNotEqual(price.product_id, product_id)
+        self.assertEqual(Product.objects.get(code="8001505005707").id, price.product_id)
+        self.assertEqual(product_id_cache.get("8001505005707"), price.product_id)
+
+    def test_other_integrity_error_not_retried(self):
+        product = ProductFactory(code="8001505005707")
+        reset_ids = MagicMock()
+        # unique violation: not a stale id, raised as is
+        with self.assertRaises(IntegrityError):
+            save_retrying_stale_ids(
+                Product(code=product.code),
+                lambda: Product.objects.bulk_create([Product(code=product.code)]),
+                reset_ids,
+            )
+        reset_ids.assert_not_called()
+
+    def test_cache_eviction_on_code_update(self):
+        product_id = Product.objects.get_or_create_id("123456789100")
+        product = Product.objects.get(id=product_id)
+        product.save(update_fields=["code"])  # normalized to 0123456789100
+        self.assertNotEqual(
+            Product.objects.get_or_create_id("123456789100"), product_id
+        )
+
+    def test_no_cache_on_rollback(self):
+        with transaction.atomic():
+            product_id = Product.objects.get_or_create_id("8001505005707")
+            transaction.set_rollback(True)
+        self.assertFalse(Product.objects.filter(id=product_id).exists())
+        self.assertNotEqual(
+            Product.objects.get_or_create_id("8001505005707"), product_id
+        )
+
+    def test_concurrent_creation(self):
+        """
+        A creates the product in a transaction, B tries to create it
+        before A commits: B's INSERT waits for A, then gets the same id
+        """
+        product_id_dict = dict()
+        a_inserted = threading.Event()
+        a_commit = threading.Event()
+
+        def create_a():
+            try:
+                with transaction.atomic():
+                    product_id_dict["a"] = Product.objects.get_or_create_id(
+                        "8001505005707"
+                    )
+                    a_inserted.set()
+                    a_commit.wait(timeout=10)
+            finally:
+                connection.close()
+
+        def create_b():
+            try:
+                product_id_dict["b"] = Product.objects.get_or_create_id("8001505005707")
+            finally:
+                connection.close()
+
+        thread_a = threading.Thread(target=create_a)
+        thread_b = threading.Thread(target=create_b)
+        thread_a.start()
+        a_inserted.wait(timeout=10)
+        thread_b.start()
+        thread_b.join(timeout=0.5)
+        self.assertTrue(thread_b.is_alive())  # waiting for A
+        a_commit.set()
+        thread_a.join(timeout=10)
+        thread_b.join(timeout=10)
+        self.assertEqual(product_id_dict["a"], product_id_dict["b"])
+        self.assertEqual(Product.objects.filter(code="8001505005707").count(), 1)
+
+
 class ProductQuerySetTest(TestCase):
     @classmethod
     def setUpTestData(cls):
@@ -139,6 +254,36 @@ class ProductQuerySetTest(TestCase):
         self.assertEqual(product.price_count_annotated, 1)
         self.assertEqual(product.price_count, 1)
 
+    def test_get_or_create_in_bulk(self):
+        post_save_receiver = MagicMock()
+        signals.post_save.connect(post_save_receiver, sender=Product, weak=False)
+
+        def insert_after_concurrent_creation(model, obj_list, *args):
+            # created by another transaction between the SELECT and the INSERT
+            Product.objects.bulk_create([Product(code="8001505005707")])
+            return insert_ignore_conflicts_returning(model, obj_list, *args)
+
+        try:
+            with patch(
+                "open_prices.products.models.utils.insert_ignore_conflicts_returning",
+                side_effect=insert_after_concurrent_creation,
+            ):
+                product_dict = Product.objects.get_or_create_in_bulk(
+                    [self.product_with_price.code, "8001505005707", "8001505005708"]
+                )
+        finally:
+            signals.post_save.disconnect(post_save_receiver, sender=Product)
+        self.assertEqual(len(product_dict), 3)
+        self.assertEqual(
+            product_dict[self.product_with_price.code], self.product_with_price
+        )
+        # created=True only for the product inserted by this call
+        self.assertEqual(post_save_receiver.call_count, 1)
+        self.assertEqual(
+            post_save_receiver.call_args.kwargs["instance"].code, "8001505005708"
+        )
+        self.assertTrue(post_save_receiver.call_args.kwargs["created"])
+
 
 class ProductPropertyTest(TestCase):
     @classmethod
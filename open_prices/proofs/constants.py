@@ -76,3 +76,24 @@ class ReceiptItemStatus(enum.IntEnum):
 
 
 RECEIPT_ITEM_STATUS_CHOICES = [(item.value, item.name) for item in ReceiptItemStatus]
+
+# proof images: stored in numbered directories (0001/, 0002/...)
+PROOF_IMAGE_MAX_IMAGES_PER_DIR = 1_000
+# "<dir_id> <image_count>" of the current directory, in the images root
+PROOF_IMAGE_DIR_COUNTER_FILENAME = ".image_dir_counter"
+
+# proof image derivatives (thumbnail, price tag crops): generated by a task
+# (see proofs.tasks.generate_proof_image_derivatives). Null: legacy (ready)
+IMAGE_DERIVATIVES_STATUS_PENDING = "PENDING"
+IMAGE_DERIVATIVES_STATUS_READY = "READY"
+IMAGE_DERIVATIVES_STATUS_FAILED = "FAILED"
+IMAGE_DERIVATIVES_STATUS_LIST = [
+    IMAGE_DERIVATIVES_STATUS_PENDING,
+    IMAGE_DERIVATIVES_STATUS_READY,
+    IMAGE_DERIVATIVES_STATUS_FAILED,
+]
+IMAGE_DERIVATIVES_STATUS_CHOICES = [(key, key) for key in IMAGE_DERIVATIVES_STATUS_LIST]
+
+# decoded (full resolution) proof images kept in memory, per worker process
+# (see utils.DecodedImageCache)
+DECODED_IMAGE_CACHE_MAX_SIZE = 2
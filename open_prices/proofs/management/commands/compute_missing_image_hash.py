@@ -25,6 +25,6 @@ class Command(BaseCommand):
                 f"Updated proof {proof.id} with MD5 {proof.image_md5_hash}"
             )
             proof._change_reason = "compute_missing_image_hash command"
-            proof.save(update_fields=["image_md5_hash"])
+            proof.save(update_fields=["image_md5_hash", "updated"])
 
         self.stdout.write(f"Updated {updated} proofs.")
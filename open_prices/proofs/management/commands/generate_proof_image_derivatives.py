@@ -0,0 +1,68 @@
+import argparse
+import datetime
+
+import tqdm
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from open_prices.proofs import constants as proof_constants
+from open_prices.proofs.models import Proof
+from open_prices.proofs.utils import generate_proof_image_derivatives
+
+
+class Command(BaseCommand):
+    """
+    Usage:
+    - python manage.py generate_proof_image_derivatives (pending only, e.g. lost tasks)
+    - python manage.py generate_proof_image_derivatives --all --limit 1000 (backfill)
+    - python manage.py generate_proof_image_derivatives --proof-id 1 2 3
+    """
+
+    help = "Generate the image derivatives (thumbnail & price tag crops) of the proofs."
+
+    def add_arguments(self, parser: argparse.ArgumentParser) -> None:
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            default=False,
+            help="Regenerate all the derivatives, not only the pending ones.",
+        )
+        parser.add_argument("--proof-id", type=int, nargs="+", help="Proof IDs.")
+        parser.add_argument(
+            "--limit", type=int, help="Limit the number of proofs to process."
+        )
+        parser.add_argument(
+            "--delay",
+            type=int,
+            default=120,
+            help="Only process proofs that were created before this delay (in seconds) from now (their task may still be running).",
+        )
+
+    def handle(self, *args, **options) -> None:  # type: ignore
+        regenerate = options["all"]
+        queryset = Proof.all_objects.filter(
+            file_path__isnull=False,
+            mimetype__startswith="image",
+            created__lte=timezone.now() - datetime.timedelta(seconds=options["delay"]),
+        )
+        if options["proof_id"]:
+            queryset = queryset.filter(id__in=options["proof_id"])
+        if not regenerate:
+            pending = proof_constants.IMAGE_DERIVATIVES_STATUS_PENDING
+            queryset = queryset.filter(
+                id__in=Proof.all_objects.filter(
+                    Q(image_derivatives_status=pending)
+                    | Q(price_tags__image_status=pending)
+                ).values("id")
+            )
+        queryset = queryset.order_by("id")
+        if options["limit"]:
+            queryset = queryset[: options["limit"]]
+
+        proof_count = 0
+        for proof in tqdm.tqdm(queryset.iterator()):
+            generate_proof_image_derivatives(proof, regenerate=regenerate)
+            proof_count += 1
+
+        self.stdout.write(f"Generated the image derivatives of {proof_count} proofs.")
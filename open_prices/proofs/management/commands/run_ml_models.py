@@ -19,6 +19,7 @@ from open_prices.proofs.ml.price_tags import (
     run_and_save_price_tag_extraction,
 )
 from open_prices.proofs.models import PriceTag, Proof
+from open_prices.proofs.utils import decoded_image_cache
 
 # Initializing root logger
 get_logger()
@@ -195,3 +196,5 @@ class Command(BaseCommand):
                         f"Extracting price tag {price_tag.id} (proof {price_tag.proof_id})..."
                     )
                     run_and_save_price_tag_extraction([price_tag], price_tag.proof)
+        # the decoded images are scoped to the run (as in a task)
+        decoded_image_cache.clear()
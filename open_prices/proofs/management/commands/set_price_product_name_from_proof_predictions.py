@@ -45,7 +45,7 @@ class Command(BaseCommand):
                 price_tag.price._change_reason = (
                     "set_price_product_name_from_proof_predictions command"
                 )
-                price_tag.price.save(update_fields=["product_name"])
+                price_tag.price.save(update_fields=["product_name", "updated"])
 
         # Step 2: ReceiptItem
         self.stdout.write("=== Running script on ReceiptItems...")
@@ -57,7 +57,7 @@ class Command(BaseCommand):
                 receipt_item.price._change_reason = (
                     "set_price_product_name_from_proof_predictions command"
                 )
-                receipt_item.price.save(update_fields=["product_name"])
+                receipt_item.price.save(update_fields=["product_name", "updated"])
 
         self.stdout.write("=== Stats after ===")
         stats()
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.14 on 2026-10-17 09:30
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY: no table lock (cannot run in a transaction)
+    atomic = False
+
+    dependencies = [
+        ("proofs", "0030_alter_pricetagprediction_type_and_more"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="proof",
+            index=models.Index(
+                fields=["location", "-date"], name="proofs_location_date_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="proof",
+            index=models.Index(
+                fields=["owner", "-created"], name="proofs_owner_created_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="proof",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["tags"], name="proofs_tags_gin_idx"
+            ),
+        ),
+    ]
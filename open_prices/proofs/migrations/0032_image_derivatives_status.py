@@ -0,0 +1,42 @@
+# Generated by Django 5.2.14 on 2026-10-17 10:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("proofs", "0031_filter_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="pricetag",
+            name="image_status",
+            field=models.CharField(
+                blank=True,
+                choices=[
+                    ("PENDING", "PENDING"),
+                    ("READY", "READY"),
+                    ("FAILED", "FAILED"),
+                ],
+                help_text="The crop (image_path) generation status",
+                max_length=10,
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="proof",
+            name="image_derivatives_status",
+            field=models.CharField(
+                blank=True,
+                choices=[
+                    ("PENDING", "PENDING"),
+                    ("READY", "READY"),
+                    ("FAILED", "FAILED"),
+                ],
+                help_text="The thumbnail & price tag crops generation status",
+                max_length=10,
+                null=True,
+            ),
+        ),
+    ]
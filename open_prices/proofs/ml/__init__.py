@@ -18,7 +18,7 @@ from open_prices.proofs.ml.receipt_anonymization import (
 )
 from open_prices.proofs.ml.receipts import run_and_save_receipt_extraction_prediction
 from open_prices.proofs.models import Proof
-from open_prices.proofs.utils import open_image_cv2
+from open_prices.proofs.utils import decoded_image_cache, open_image_cv2
 
 logger = logging.getLogger(__name__)
 
@@ -93,26 +93,38 @@ def run_and_save_proof_prediction(
                 )
 
     else:
-        # image is an uint8 numpy array in BGR format. BGR is the default format used by OpenCV,
-        # while our object detection and classification models expect RGB format.
-        # The conversion from BGR to RGB is done on-the-fly in the predict_proof_type and
-        # run_and_save_price_tag_detection functions.
-        image = open_image_cv2(file_path_full)
+        try:
+            # the proof type classifier only needs a small image: it is decoded
+            # at a reduced scale (see open_image_cv2's min_size)
+            run_and_save_proof_type_prediction(None, proof)
 
-        run_and_save_proof_type_prediction(image, proof)
+            # image is an uint8 numpy array in BGR format. BGR is the default format used by OpenCV,
+            # while our object detection and classification models expect RGB format.
+            # The conversion from BGR to RGB is done on-the-fly in the
+            # run_and_save_price_tag_detection function.
+            # It is decoded at full resolution only if needed (detection & crops, receipts)
+            image = None
+            if proof.type in (
+                proof_constants.TYPE_PRICE_TAG,
+                proof_constants.TYPE_RECEIPT,
+            ):
+                image = open_image_cv2(file_path_full, cached=True)
 
-        if proof.type == proof_constants.TYPE_PRICE_TAG:
-            run_and_save_price_tag_detection(
-                image,
-                proof,
-                run_classification=run_price_tag_classification,
-                run_extraction=run_price_tag_extraction,
-            )
-        if proof.type == proof_constants.TYPE_RECEIPT:
-            if proof.draft:
-                run_and_save_receipt_anonymization_prediction(
+            if proof.type == proof_constants.TYPE_PRICE_TAG:
+                run_and_save_price_tag_detection(
                     image,
                     proof,
+                    run_classification=run_price_tag_classification,
+                    run_extraction=run_price_tag_extraction,
                 )
-            if run_receipt_extraction:
-                run_and_save_receipt_extraction_prediction(image, proof)
+            if proof.type == proof_constants.TYPE_RECEIPT:
+                if proof.draft:
+                    run_and_save_receipt_anonymization_prediction(
+                        image,
+                        proof,
+                    )
+                if run_receipt_extraction:
+                    run_and_save_receipt_extraction_prediction(image, proof)
+        finally:
+            # the decoded images are scoped to the run (as in a task)
+            decoded_image_cache.clear()
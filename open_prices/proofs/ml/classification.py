@@ -159,7 +159,11 @@ def run_and_save_proof_type_prediction(
             return None
 
     if image is None:
-        image = open_image_cv2(proof.file_path_full)
+        image = open_image_cv2(
+            proof.file_path_full,
+            cached=True,
+            min_size=proof_classification_model_config.image_size,
+        )
 
     prediction = predict_proof_type(image)
 
@@ -856,7 +856,7 @@ def run_and_save_price_tag_detection(
             return None
 
     if image is None:
-        image = open_image_cv2(proof.file_path_full)
+        image = open_image_cv2(proof.file_path_full, cached=True)
     result = detect_price_tags(image)
     detections = result.to_list()
     if detections:
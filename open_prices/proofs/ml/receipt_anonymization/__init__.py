@@ -197,7 +197,7 @@ def run_and_save_receipt_anonymization_prediction(
             return None
 
     if image is None:
-        image = open_image_cv2(proof.file_path_full)
+        image = open_image_cv2(proof.file_path_full, cached=True)
     # prediction may be None if the model failed to extract
     try:
         anonymization_result = anonymize_receipt(image, model=model)
@@ -1,3 +1,4 @@
+import copy
 import decimal
 import os
 from datetime import timedelta
@@ -5,9 +6,10 @@ from datetime import timedelta
 from django.conf import settings
 from django.contrib.contenttypes.fields import GenericRelation
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import models, transaction
 from django.db.models import Case, Count, F, Q, Value, When, signals
 from django.dispatch import receiver
 from django.utils import timezone
@@ -20,6 +22,8 @@ from open_prices.common import (
     history,
     utils,
 )
+from open_prices.common.managers import EstimatedCountQuerySet
+from open_prices.common.models import CounterDelta
 from open_prices.locations import constants as location_constants
 from open_prices.locations.models import Location
 from open_prices.proofs import constants as proof_constants
@@ -27,7 +31,7 @@ from open_prices.proofs import validators as proof_validators
 from open_prices.users.models import User
 
 
-class ProofQuerySet(models.QuerySet):
+class ProofQuerySet(EstimatedCountQuerySet):
     def has_type_price_tag(self):
         return self.filter(type=proof_constants.TYPE_PRICE_TAG)
 
@@ -179,6 +183,31 @@ class Proof(models.Model):
         "location_osm_type",
     ]
     COUNT_FIELDS = ["price_count", "prediction_count"]
+    # (validator, fields read): partial saves only run the validators concerned
+    VALIDATOR_LIST = [
+        (proof_validators.validate_proof_date_rules, ["date"]),
+        (
+            proof_validators.validate_proof_location_rules,
+            ["location", "location_osm_id", "location_osm_type"],
+        ),
+        (
+            proof_validators.validate_proof_type_price_tag_rules,
+            ["type", "ready_for_price_tag_validation"],
+        ),
+        (
+            proof_validators.validate_proof_type_receipt_rules,
+            [
+                "type",
+                "receipt_price_count",
+                "receipt_price_total",
+                "receipt_online_delivery_costs",
+            ],
+        ),
+        (
+            proof_validators.validate_proof_type_consumption_rules,
+            ["type", "owner_consumption"],
+        ),
+    ]
 
     file_path = models.CharField(blank=True, null=True)
     mimetype = models.CharField(blank=True, null=True)
@@ -188,6 +217,13 @@ class Proof(models.Model):
         max_length=32, blank=True, null=True, db_index=True
     )
     image_thumb_path = models.CharField(blank=True, null=True)
+    image_derivatives_status = models.CharField(
+        max_length=10,
+        choices=proof_constants.IMAGE_DERIVATIVES_STATUS_CHOICES,
+        blank=True,
+        null=True,
+        help_text="The thumbnail & price tag crops generation status",
+    )
 
     location_osm_id = models.PositiveBigIntegerField(blank=True, null=True)
     location_osm_type = models.CharField(
@@ -249,7 +285,7 @@ class Proof(models.Model):
     updated = models.DateTimeField(auto_now=True)
 
     history = HistoricalRecords(
-        excluded_fields=COUNT_FIELDS,
+        excluded_fields=COUNT_FIELDS + ["image_derivatives_status"],
         get_user=history.get_history_user_from_request,
         history_user_id_field=models.CharField(null=True),
         history_user_getter=history.history_user_getter,
@@ -262,18 +298,23 @@ class Proof(models.Model):
 
     class Meta:
         db_table = "proofs"
+        # see the audit_filter_indexes command (ProofFilter)
+        indexes = [
+            models.Index(fields=["location", "-date"], name="proofs_location_date_idx"),
+            models.Index(fields=["owner", "-created"], name="proofs_owner_created_idx"),
+            GinIndex(fields=["tags"], name="proofs_tags_gin_idx"),
+        ]
         verbose_name = "Proof"
         verbose_name_plural = "Proofs"
 
+    def clean_fields(self, exclude=None):
+        # skip the FK existence queries for the already loaded related objects
+        exclude = set(exclude or []) | utils.get_loaded_foreign_key_name_set(self)
+        super().clean_fields(exclude=exclude)
+
     def clean(self, *args, **kwargs):
         # store all ValidationError in a dict
-        validation_errors = utils.merge_validation_errors(
-            proof_validators.validate_proof_date_rules(self),
-            proof_validators.validate_proof_location_rules(self),
-            proof_validators.validate_proof_type_price_tag_rules(self),
-            proof_validators.validate_proof_type_receipt_rules(self),
-            proof_validators.validate_proof_type_consumption_rules(self),
-        )
+        validation_errors = utils.run_validators(self, self.VALIDATOR_LIST)
         # return
         if bool(validation_errors):
             raise ValidationError(validation_errors)
@@ -281,24 +322,111 @@ class Proof(models.Model):
 
     def set_location(self):
         if self.location_osm_id and self.location_osm_type:
-            from open_prices.locations import constants as location_constants
             from open_prices.locations.models import Location
 
-            location, created = Location.objects.get_or_create(
-                type=location_constants.TYPE_OSM,
-                osm_id=self.location_osm_id,
-                osm_type=self.location_osm_type,
+            self.location_id = Location.objects.get_or_create_type_osm_id(
+                self.location_osm_id, self.location_osm_type
+            )
+            # reuse the location if it was already loaded during the request
+            utils.get_cached_related_object(self, "location")
+
+    def reset_cached_ids(self):
+        """
+        Evict the location id from the per-process cache, and resolve it
+        again (see utils.save_retrying_stale_ids)
+        """
+        from open_prices.locations.models import location_id_cache
+
+        if self.location_osm_id and self.location_osm_type:
+            location_id_cache.delete(
+                (self.location_osm_type, int(self.location_osm_id))
+            )
+            self.set_location()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.set_loaded_values()
+        return instance
+
+    def set_loaded_values(self, attname_list: list[str] | None = None):
+        """
+        Snapshot of the field values, as loaded from (or saved to) the DB.
+        Used to know which fields changed (see get_dirty_fields)
+        """
+        if not hasattr(self, "_loaded_values"):
+            self._loaded_values = dict()
+        for field in self._meta.concrete_fields:
+            if field.attname in self.__dict__:  # skip deferred fields
+                if attname_list is None or field.attname in attname_list:
+                    self._loaded_values[field.attname] = copy.copy(
+                        self.__dict__[field.attname]
+                    )
+
+    def get_loaded_values(self) -> dict:
+        return getattr(self, "_loaded_values", dict())
+
+    def get_dirty_fields(self) -> set[str]:
+        """
+        Return the names of the fields changed since the snapshot
+        (all the fields for a new instance)
+        """
+        loaded_values = self.get_loaded_values()
+        return {
+            field.name
+            for field in self._meta.concrete_fields
+            if field.attname in self.__dict__
+            and (
+                field.attname not in loaded_values
+                or loaded_values[field.attname] != self.__dict__[field.attname]
             )
-            self.location = location
+        }
+
+    def has_changed(self, field_list: list[str]) -> bool:
+        """
+        Did the last save() change one of the given fields?
+        Usage: in the post_save signals (always True if unknown)
+        """
+        if not hasattr(self, "_saved_dirty_fields"):
+            return True
+        return not self._saved_dirty_fields.isdisjoint(field_list)
 
     def save(self, *args, **kwargs):
         """
         - run validations
         - set location (create if needed)
+        - keep track of the changed fields (for the post_save signals)
+        Partial saves (update_fields) only run the steps concerned
+        by the updated fields.
         """
-        self.full_clean()
-        self.set_location()
-        super().save(*args, **kwargs)
+        update_field_name_set = utils.get_update_field_name_set(
+            self, kwargs.get("update_fields")
+        )
+        if update_field_name_set is None:
+            self.full_clean()
+        else:
+            utils.full_clean_update_fields(
+                self, update_field_name_set, self.VALIDATOR_LIST
+            )
+        if utils.save_touches_fields(
+            update_field_name_set, ["location_osm_id", "location_osm_type"]
+        ):
+            self.set_location()
+        self._saved_dirty_fields = self.get_dirty_fields()
+        if update_field_name_set is not None:
+            self._saved_dirty_fields &= update_field_name_set
+        utils.save_retrying_stale_ids(
+            self, super().save, self.reset_cached_ids, *args, **kwargs
+        )
+        # the saved fields (incl. the auto_now updated) now match the DB
+        self.set_loaded_values(
+            attname_list=[
+                self._meta.get_field(field_name).attname
+                for field_name in update_field_name_set
+            ]
+            if update_field_name_set is not None
+            else None
+        )
 
     @property
     def file_path_display(self):
@@ -335,8 +463,9 @@ class Proof(models.Model):
         return constants.KIND_COMMUNITY
 
     def update_price_count(self):
+        CounterDelta.objects.discard(self, ["price_count"])
         self.price_count = self.prices.count()
-        self.save(update_fields=["price_count"])
+        self.save(update_fields=["price_count", "updated"])
 
     def update_location(self, location_osm_id, location_osm_type):
         old_location = self.location
@@ -391,7 +520,7 @@ class Proof(models.Model):
             self.tags.append(tag)
             if save:
                 self._change_reason = "Proof.set_tag() method"
-                self.save(update_fields=["tags"])
+                self.save(update_fields=["tags", "updated"])
             return True
         return False
 
@@ -405,18 +534,54 @@ class Proof(models.Model):
 @receiver(signals.post_save, sender=Proof)
 def proof_post_create_increment_counts(sender, instance, created, **kwargs):
     if created:
-        if instance.owner:
-            User.objects.filter(user_id=instance.owner).update(
-                proof_count=F("proof_count") + 1
-            )
-        if instance.location_id:
-            Location.objects.filter(id=instance.location_id).update(
-                proof_count=F("proof_count") + 1
+        CounterDelta.objects.add(
+            [
+                (User, instance.owner, "proof_count", 1),
+                (Location, instance.location_id, "proof_count", 1),
+            ]
+        )
+    else:
+        # location update: move the count (owner cannot be updated)
+        # (the previous location is known if the proof was loaded from the DB)
+        loaded_values = instance.get_loaded_values()
+        if instance.has_changed(["location"]) and "location_id" in loaded_values:
+            CounterDelta.objects.add(
+                [
+                    (Location, loaded_values["location_id"], "proof_count", -1),
+                    (Location, instance.location_id, "proof_count", 1),
+                ]
             )
+
+
+def generate_proof_image_derivatives_soon(proof_id: int) -> None:
+    """
+    Generate the pending image derivatives of the proof (thumbnail & price
+    tag crops), off the request path
+    - sync mode (dev, tests): right away
+    - else: enqueue a task once the transaction is committed. The task of a
+    proof without pending derivatives does not decode the image.
+    """
+    if settings.Q_CLUSTER["sync"]:
+        from open_prices.proofs.tasks import generate_proof_image_derivatives
+
+        generate_proof_image_derivatives(proof_id)
     else:
-        # what about if we update location? (owner cannot be updated)
-        # the update_fields is often not set, so we cannot rely on it
-        pass
+        transaction.on_commit(
+            lambda: async_task(
+                "open_prices.proofs.tasks.generate_proof_image_derivatives",
+                proof_id,
+            )
+        )
+
+
+@receiver(signals.post_save, sender=Proof)
+def proof_post_save_generate_image_derivatives(sender, instance, created, **kwargs):
+    if (
+        created
+        and instance.image_derivatives_status
+        == proof_constants.IMAGE_DERIVATIVES_STATUS_PENDING
+    ):
+        generate_proof_image_derivatives_soon(instance.id)
 
 
 @receiver(signals.post_save, sender=Proof)
@@ -446,27 +611,27 @@ def proof_post_save_run_ml_models(sender, instance, created, **kwargs):
 
 @receiver(signals.post_save, sender=Proof)
 def proof_post_save_update_prices(sender, instance, created, **kwargs):
-    if not created:
-        if instance.is_type_single_shop and instance.prices.exists():
-            from open_prices.prices.models import Price
+    """
+    Only if the proof fields copied to its prices changed
+    (not on tags, counts or draft updates), with a set-based update
+    """
+    from open_prices.prices.models import Price
 
-            for price in instance.prices.all():
-                for field in Price.DUPLICATE_PROOF_FIELDS:
-                    setattr(price, field, getattr(instance, field))
-                    price._change_reason = "Proof.update_location() method"
-                    price.save()
+    if not created:
+        if instance.is_type_single_shop and instance.has_changed(
+            Price.DUPLICATE_PROOF_FIELDS + ["location"]
+        ):
+            Price.objects.filter(proof=instance).update_from_proof(instance)
 
 
 @receiver(signals.post_delete, sender=Proof)
 def proof_post_delete_decrement_counts(sender, instance, **kwargs):
-    if instance.owner:
-        User.objects.filter(user_id=instance.owner, proof_count__gt=0).update(
-            proof_count=F("proof_count") - 1
-        )
-    if instance.location_id:
-        Location.objects.filter(id=instance.location.id, proof_count__gt=0).update(
-            proof_count=F("proof_count") - 1
-        )
+    CounterDelta.objects.add(
+        [
+            (User, instance.owner, "proof_count", -1),
+            (Location, instance.location_id, "proof_count", -1),
+        ]
+    )
 
 
 @receiver(signals.post_delete, sender=Proof)
@@ -546,6 +711,7 @@ def proof_post_save_delete_receipt_anonymization_prediction_non_draft_proof(
         not created
         and instance.draft is False
         and instance.type == proof_constants.TYPE_RECEIPT
+        and instance.has_changed(["draft", "type"])
     ):
         ProofPrediction.objects.filter(
             proof=instance,
@@ -556,13 +722,10 @@ def proof_post_save_delete_receipt_anonymization_prediction_non_draft_proof(
 @receiver(signals.post_save, sender=ProofPrediction)
 def proof_prediction_post_create_increment_counts(sender, instance, created, **kwargs):
     if created:
-        if instance.proof_id:
-            Proof.all_objects.filter(id=instance.proof_id).update(
-                prediction_count=F("prediction_count") + 1
-            )
+        CounterDelta.objects.add([(Proof, instance.proof_id, "prediction_count", 1)])
 
 
-class PriceTagQuerySet(models.QuerySet):
+class PriceTagQuerySet(EstimatedCountQuerySet):
     def status_unknown(self):
         return self.filter(status=None)
 
@@ -584,6 +747,14 @@ class PriceTag(models.Model):
     UPDATE_FIELDS = ["bounding_box", "status", "price_id"]
     CREATE_FIELDS = UPDATE_FIELDS + ["proof_id"]
     COUNT_FIELDS = ["prediction_count"]
+    # (validator, fields read): partial saves only run the validators concerned
+    VALIDATOR_LIST = [
+        (proof_validators.validate_price_tag_bounding_box_rules, ["bounding_box"]),
+        (
+            proof_validators.validate_price_tag_relationship_rules,
+            ["proof", "proof_prediction", "price", "status"],
+        ),
+    ]
 
     proof = models.ForeignKey(
         Proof,
@@ -618,6 +789,14 @@ class PriceTag(models.Model):
         help_text="The annotation status",
     )
 
+    image_status = models.CharField(
+        max_length=10,
+        choices=proof_constants.IMAGE_DERIVATIVES_STATUS_CHOICES,
+        blank=True,
+        null=True,
+        help_text="The crop (image_path) generation status",
+    )
+
     prediction_count = models.PositiveIntegerField(default=0)
 
     created_by = models.CharField(
@@ -656,10 +835,7 @@ class PriceTag(models.Model):
 
     def clean(self, *args, **kwargs):
         # store all ValidationError in a dict
-        validation_errors = utils.merge_validation_errors(
-            proof_validators.validate_price_tag_bounding_box_rules(self),
-            proof_validators.validate_price_tag_relationship_rules(self),
-        )
+        validation_errors = utils.run_validators(self, self.VALIDATOR_LIST)
         # return
         if bool(validation_errors):
             raise ValidationError(validation_errors)
@@ -668,8 +844,23 @@ class PriceTag(models.Model):
     def save(self, *args, **kwargs):
         """
         - run validations
+        Partial saves (update_fields) only run the validators concerned
+        by the updated fields.
         """
-        self.full_clean()
+        update_field_name_set = utils.get_update_field_name_set(
+            self, kwargs.get("update_fields")
+        )
+        if update_field_name_set is None:
+            self.full_clean()
+        else:
+            utils.full_clean_update_fields(
+                self, update_field_name_set, self.VALIDATOR_LIST
+            )
+        # the crop will be (re)generated (see price_tag_post_save_generate_image)
+        if utils.save_touches_fields(update_field_name_set, ["bounding_box"]):
+            self.image_status = proof_constants.IMAGE_DERIVATIVES_STATUS_PENDING
+            if update_field_name_set is not None:
+                kwargs["update_fields"] = [*kwargs["update_fields"], "image_status"]
         super().save(*args, **kwargs)
 
     @property
@@ -768,16 +959,8 @@ class PriceTag(models.Model):
 
 @receiver(signals.post_save, sender=PriceTag)
 def price_tag_post_save_generate_image(sender, instance, created, **kwargs):
-    from open_prices.proofs.utils import generate_price_tag_image
-
-    update_fields = kwargs.get("update_fields")
-    if (
-        created
-        or (update_fields and "bounding_box" in update_fields)
-        or update_fields is None
-    ):
-        # Cropping is fast, run synchronously
-        generate_price_tag_image(instance)
+    if instance.image_status == proof_constants.IMAGE_DERIVATIVES_STATUS_PENDING:
+        generate_proof_image_derivatives_soon(instance.proof_id)
 
 
 @receiver(signals.post_save, sender=PriceTag)
@@ -0,0 +1,9 @@
+from open_prices.proofs import utils as proof_utils
+from open_prices.proofs.models import Proof
+
+
+def generate_proof_image_derivatives(proof_id: int):
+    # see generate_proof_image_derivatives_soon
+    proof = Proof.all_objects.filter(id=proof_id).first()
+    if proof:  # may have been deleted since
+        proof_utils.generate_proof_image_derivatives(proof)
@@ -6,6 +6,8 @@ import os
 import shutil
 import tempfile
 import unittest
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
 from decimal import Decimal
 from pathlib import Path
@@ -16,16 +18,20 @@ from django.conf import settings
 from django.core import management
 from django.core.exceptions import ValidationError
 from django.core.files.uploadedfile import InMemoryUploadedFile
+from django.db import connection
 from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
+from django_q.signals import post_execute_in_worker
 from freezegun import freeze_time
 from google.genai import types
 from openfoodfacts.ml.object_detection import ObjectDetectionRawResult
-from PIL import Image
+from PIL import Image, ImageOps
 from simple_history.utils import bulk_update_with_history
 
 from open_prices.challenges.factories import ChallengeFactory
 from open_prices.common import constants
+from open_prices.common.testing import ProcessCacheResetMixin
 from open_prices.locations import constants as location_constants
 from open_prices.locations.factories import LocationFactory
 from open_prices.prices import constants as price_constants
@@ -61,15 +67,23 @@ from open_prices.proofs.models import (
     ReceiptItem,
 )
 from open_prices.proofs.utils import (
+    DecodedImageCache,
+    allocate_proof_image_slot,
     compute_file_md5,
     crop_image,
+    decoded_image_cache,
     generate_image_thumbnail_cv2,
+    generate_proof_image_derivatives,
+    get_image_reduction_factor,
     match_category_price_tag_with_category_price,
     match_price_tag_with_price,
     match_product_price_tag_with_product_price,
     match_receipt_item_with_price,
+    open_image_cv2,
     save_anonymized_receipt,
     select_proof_image_dir,
+    store_temp_file,
+    stream_file_to_temp,
 )
 from open_prices.users.factories import SessionFactory
 
@@ -207,7 +221,7 @@ class ProofQuerySetTest(TestCase):
         self.assertEqual(Proof.objects.has_tag("unknown").count(), 0)
 
 
-class ProofChallengeQuerySetAndPropertyTest(TestCase):
+class ProofChallengeQuerySetAndPropertyTest(ProcessCacheResetMixin, TestCase):
     @classmethod
     def setUpTestData(cls):
         cls.challenge_ongoing = ChallengeFactory(
@@ -695,8 +709,60 @@ class ProofModelUpdateTest(TestCase):
         )
         self.location_osm_1.refresh_from_db()
         self.location_osm_2.refresh_from_db()
-        self.assertEqual(self.location_osm_1.proof_count, 1)  # TODO: should be 0
-        self.assertEqual(self.location_osm_2.proof_count, 0)  # TODO: should be 1
+        self.assertEqual(self.location_osm_1.proof_count, 0)
+        self.assertEqual(self.location_osm_2.proof_count, 1)
+
+    def test_proof_dirty_fields(self):
+        proof = Proof.objects.get(id=self.proof_price_tag.id)
+        self.assertEqual(proof.get_dirty_fields(), set())
+        proof.currency = "USD"
+        proof.tags.append("test")  # in-place
+        self.assertEqual(proof.get_dirty_fields(), {"currency", "tags"})
+        proof.save()
+        self.assertTrue(proof.has_changed(["currency"]))
+        self.assertEqual(proof.get_dirty_fields(), set())
+        # partial save: only the saved fields are tracked
+        proof.currency = "EUR"
+        proof.set_tag("test-2", save=True)
+        self.assertFalse(proof.has_changed(["currency"]))
+        self.assertEqual(proof.get_dirty_fields(), {"currency"})
+
+    def test_proof_update_without_price_fields_change_skips_prices(self):
+        proof = Proof.objects.get(id=self.proof_price_tag.id)
+        price = proof.prices.first()
+        price_history_count = price.history.count()
+        with self.assertNumQueries(2):  # UPDATE + history INSERT
+            proof.set_tag("test", save=True)
+        proof.update_price_count()
+        self.assertEqual(price.history.count(), price_history_count)
+
+    def test_proof_update_prices_set_based(self):
+        PriceFactory.create_batch(
+            5,
+            proof_id=self.proof_price_tag.id,
+            location_osm_id=self.location_osm_1.osm_id,
+            location_osm_type=self.location_osm_1.osm_type,
+            currency="EUR",
+            date="2024-06-30",
+        )
+        proof = Proof.objects.get(id=self.proof_price_tag.id)
+        price_updated_dict = dict(proof.prices.values_list("id", "updated"))
+        proof.currency = "USD"
+        # the number of queries does not depend on the number of prices
+        # (1 SELECT, 1 UPDATE & 1 history INSERT, 1 duplicates resolution,
+        # 1 rollups refresh, 1 history buckets refresh)
+        with CaptureQueriesContext(connection) as queries:
+            proof.save()
+        self.assertLess(len(queries), 6 + 2 * 2 + 6 + 8)
+        for price in proof.prices.all():
+            self.assertEqual(price.currency, "USD")
+            self.assertEqual(price.dedup_fingerprint, price.get_dedup_fingerprint())
+            self.assertGreater(price.updated, price_updated_dict[price.id])
+            self.assertEqual(price.history.first().updated, price.updated)
+            self.assertEqual(
+                price.history.first().history_change_reason,
+                "Proof.update_location() method",
+            )
 
 
 class ProofModelDeleteTest(TestCase):
@@ -995,6 +1061,32 @@ class MLModelTest(TestCase):
                 receipt_anonymization_prediction.delete()
                 proof.delete()
 
+    def test_run_and_save_proof_prediction_reduced_decode(self):
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            file_path = Path(tmpdirname) / "1.jpg"
+            cv2.imwrite(file_path.as_posix(), np.zeros((1000, 2000, 3), np.uint8))
+            proof = ProofFactory(
+                file_path=file_path, type=proof_constants.TYPE_SHOP_IMPORT
+            )
+            with (
+                unittest.mock.patch(
+                    "open_prices.proofs.ml.classification.predict_proof_type",
+                    return_value=[("SHELF", 0.98), ("PRICE_TAG", 0.02)],
+                ) as mock_predict_proof_type,
+                unittest.mock.patch(
+                    "open_prices.proofs.ml.open_image_cv2"
+                ) as mock_open_image_cv2,
+            ):
+                run_and_save_proof_prediction(proof)
+                # decoded at 1/8 scale (longest side >= 224)
+                image = mock_predict_proof_type.call_args.args[0]
+                self.assertEqual(image.shape, (125, 250, 3))
+                # no full resolution decode (no detection, no receipt models)
+                mock_open_image_cv2.assert_not_called()
+            # the decoded images are scoped to the run
+            self.assertEqual(len(decoded_image_cache.image_dict), 0)
+            proof.delete()
+
     def test_run_and_save_proof_prediction_for_price_tag_proof(self):
         predict_proof_type_response = [
             ("SHELF", 0.9786477088928223),
@@ -1190,7 +1282,7 @@ class MLModelTest(TestCase):
                         self.image, proof, run_extraction=False
                     )
         self.assertIsNone(result)
-        price_tags = PriceTag.objects.filter(proof=proof).all()
+        price_tags = PriceTag.objects.filter(proof=proof).order_by("id")
         self.assertEqual(len(price_tags), 2)
         self.assertEqual(price_tags[0].bounding_box, [0.5, 0.5, 1.0, 1.0])
         self.assertEqual(price_tags[0].tags, ["invalid"])
@@ -1248,7 +1340,7 @@ class MLModelTest(TestCase):
                     )
         after = timezone.now()
         self.assertEqual(len(results), 2)
-        price_tags = PriceTag.objects.filter(proof=proof).all()
+        price_tags = PriceTag.objects.filter(proof=proof).order_by("id")
         self.assertEqual(len(price_tags), 2)
 
         price_tag = results[0]
@@ -1337,6 +1429,46 @@ class TestSelectProofImageDir(TestCase):
             selected_dir = select_proof_image_dir(images_dir, max_images_per_dir=1)
             self.assertEqual(selected_dir, images_dir / "0002")
 
+    def test_select_proof_image_dir_counter(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            images_dir = Path(tmpdir) / "images"
+            images_dir.mkdir()
+            (images_dir / "0003").mkdir()
+            self.assertEqual(allocate_proof_image_slot(images_dir, 2), (3, 1))
+            # the directories are not listed anymore
+            with unittest.mock.patch.object(Path, "iterdir") as mock_iterdir:
+                self.assertEqual(allocate_proof_image_slot(images_dir, 2), (3, 2))
+                self.assertEqual(allocate_proof_image_slot(images_dir, 2), (4, 1))
+                mock_iterdir.assert_not_called()
+            # corrupted counter file: re-initialized from the directories
+            (images_dir / proof_constants.PROOF_IMAGE_DIR_COUNTER_FILENAME).write_text(
+                "x"
+            )
+            self.assertEqual(allocate_proof_image_slot(images_dir, 2), (3, 1))
+
+    def test_allocate_proof_image_slot_concurrent(self):
+        max_images_per_dir = 10
+        with tempfile.TemporaryDirectory() as tmpdir:
+            images_dir = Path(tmpdir) / "images"
+            images_dir.mkdir()
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                slot_list = list(
+                    executor.map(
+                        lambda _: allocate_proof_image_slot(
+                            images_dir, max_images_per_dir
+                        ),
+                        range(205),
+                    )
+                )
+            # no slot given twice, no directory over its cap
+            self.assertEqual(len(set(slot_list)), 205)
+            dir_image_count = Counter(dir_id for dir_id, _ in slot_list)
+            self.assertEqual(sorted(dir_image_count), list(range(1, 22)))
+            self.assertTrue(
+                all(count <= max_images_per_dir for count in dir_image_count.values())
+            )
+            self.assertEqual(dir_image_count[21], 5)
+
 
 class PriceTagQuerySetTest(TestCase):
     @classmethod
@@ -2016,6 +2148,38 @@ class TestComputeFileMd5(TestCase):
         self.assertEqual(computed_md5, expected_md5)
 
 
+class TestStreamFileToTemp(TestCase):
+    def test_stream_file_to_temp(self):
+        # noise: several chunks
+        fp = io.BytesIO()
+        Image.fromarray(np.random.randint(0, 256, (300, 300, 3), dtype=np.uint8)).save(
+            fp, format="PNG"
+        )
+        content = fp.getvalue()
+        self.assertGreater(len(content), 3 * InMemoryUploadedFile.DEFAULT_CHUNK_SIZE)
+        django_file = InMemoryUploadedFile(
+            file=io.BytesIO(content),
+            field_name="file",
+            name="test.png",
+            content_type="image/png",
+            size=len(content),
+            charset=None,
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            images_dir = Path(tmpdir) / "images"
+            temp_file_path, md5_hash = stream_file_to_temp(django_file, images_dir)
+            self.assertEqual(md5_hash, hashlib.md5(content).hexdigest())
+            self.assertEqual(temp_file_path.parent, images_dir)
+            self.assertEqual(temp_file_path.read_bytes(), content)
+            # moved to a numbered directory
+            file_path, mimetype = store_temp_file(temp_file_path, django_file)
+            self.assertFalse(temp_file_path.exists())
+            self.assertTrue(file_path.startswith("0001/"))
+            self.assertTrue(file_path.endswith(".png"))
+            self.assertEqual(mimetype, "image/png")
+            self.assertEqual((images_dir / file_path).read_bytes(), content)
+
+
 @override_settings(IMAGES_DIR=Path(tempfile.mkdtemp()))
 class PriceTagImageTest(TestCase):
     def setUp(self):
@@ -2068,6 +2232,107 @@ class PriceTagImageTest(TestCase):
         self.assertFalse(os.path.exists(price_tag.image_path_full))
 
 
+@override_settings(IMAGES_DIR=Path(tempfile.mkdtemp()))
+class ProofImageDerivativesTest(TestCase):
+    def setUp(self):
+        self.temp_dir = settings.IMAGES_DIR
+        (self.temp_dir / "0001").mkdir(parents=True)
+        Image.new("RGB", (800, 400), color="red").save(
+            self.temp_dir / "0001" / "proof.jpg"
+        )
+        self.proof = ProofFactory(
+            type=proof_constants.TYPE_PRICE_TAG,
+            file_path="0001/proof.jpg",
+            mimetype="image/jpeg",
+            image_derivatives_status=proof_constants.IMAGE_DERIVATIVES_STATUS_PENDING,
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_generate_proof_image_derivatives(self):
+        # generated by the (sync) task
+        self.proof.refresh_from_db()
+        self.assertEqual(
+            self.proof.image_derivatives_status,
+            proof_constants.IMAGE_DERIVATIVES_STATUS_READY,
+        )
+        self.assertEqual(self.proof.image_thumb_path, "0001/proof.400.jpg")
+        with Image.open(self.proof.image_thumb_path_full) as thumb:
+            self.assertEqual(thumb.size, (400, 200))
+        price_tag = PriceTagFactory(proof=self.proof, bounding_box=[0.0, 0.0, 0.5, 0.5])
+        price_tag.refresh_from_db()
+        self.assertEqual(
+            price_tag.image_status, proof_constants.IMAGE_DERIVATIVES_STATUS_READY
+        )
+        with Image.open(price_tag.image_path_full) as cropped:
+            self.assertEqual(cropped.size, (400, 200))
+        # bounding box update: regenerated
+        price_tag.bounding_box = [0.0, 0.0, 0.25, 0.25]
+        price_tag.save(update_fields=["bounding_box"])
+        with Image.open(price_tag.image_path_full) as cropped:
+            self.assertEqual(cropped.size, (200, 100))
+        # other updates: nothing to do (the image is not decoded)
+        with unittest.mock.patch.object(Image, "open") as mock_open:
+            price_tag.tags = ["test"]
+            price_tag.save(update_fields=["tags"])
+            generate_proof_image_derivatives(self.proof)
+            mock_open.assert_not_called()
+
+    def test_generate_proof_image_derivatives_reduced_decode(self):
+        Image.new("RGB", (3200, 1600), color="red").save(
+            self.temp_dir / "0001" / "large.jpg"
+        )
+        with unittest.mock.patch(
+            "open_prices.proofs.utils.ImageOps.exif_transpose",
+            wraps=ImageOps.exif_transpose,
+        ) as mock_exif_transpose:
+            proof = ProofFactory(
+                file_path="0001/large.jpg",
+                mimetype="image/jpeg",
+                image_derivatives_status=proof_constants.IMAGE_DERIVATIVES_STATUS_PENDING,
+            )
+            # no price tag crops: decoded at 1/4 scale
+            self.assertEqual(mock_exif_transpose.call_args.args[0].size, (800, 400))
+        proof.refresh_from_db()
+        with Image.open(proof.image_thumb_path_full) as thumb:
+            self.assertEqual(thumb.size, (400, 200))
+
+    def test_generate_proof_image_derivatives_failed(self):
+        proof = ProofFactory(
+            type=proof_constants.TYPE_PRICE_TAG,
+            file_path="0001/missing.jpg",
+            mimetype="image/jpeg",
+            image_derivatives_status=proof_constants.IMAGE_DERIVATIVES_STATUS_PENDING,
+        )
+        price_tag = PriceTagFactory(proof=proof, bounding_box=[0.0, 0.0, 0.5, 0.5])
+        proof.refresh_from_db()
+        price_tag.refresh_from_db()
+        self.assertEqual(
+            proof.image_derivatives_status,
+            proof_constants.IMAGE_DERIVATIVES_STATUS_FAILED,
+        )
+        self.assertIsNone(proof.image_thumb_path)
+        self.assertEqual(
+            price_tag.image_status, proof_constants.IMAGE_DERIVATIVES_STATUS_FAILED
+        )
+
+    def test_generate_proof_image_derivatives_command(self):
+        price_tag = PriceTagFactory(proof=self.proof, bounding_box=[0.0, 0.0, 0.5, 0.5])
+        self.proof.refresh_from_db()
+        os.remove(self.proof.image_thumb_path_full)
+        os.remove(price_tag.image_path_full)
+        # pending: nothing to do
+        management.call_command("generate_proof_image_derivatives", "--delay=0")
+        self.assertFalse(os.path.exists(price_tag.image_path_full))
+        # regenerate
+        management.call_command(
+            "generate_proof_image_derivatives", "--all", "--delay=0"
+        )
+        self.assertTrue(os.path.exists(price_tag.image_path_full))
+        self.assertTrue(os.path.exists(self.proof.image_thumb_path_full))
+
+
 class CropImageTest(TestCase):
     def test_crop_image_full_image(self):
         with tempfile.TemporaryDirectory() as tmpdir:
@@ -2140,6 +2405,96 @@ class CropImageTest(TestCase):
             self.assertEqual(result[0, 0, 1], 128)
             self.assertEqual(result[0, 0, 2], 64)
 
+    def test_crop_image_is_a_view(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            image_path = Path(tmpdir) / "test.png"
+            cv2.imwrite(image_path.as_posix(), np.zeros((100, 100, 3), np.uint8))
+
+            result_1 = crop_image(image_path, (0.0, 0.0, 0.5, 0.5))
+            result_2 = crop_image(image_path, (0.5, 0.5, 1.0, 1.0))
+            # both crops are views into the same (read-only) decoded image
+            self.assertTrue(np.shares_memory(result_1.base, result_2.base))
+            self.assertFalse(result_1.flags.writeable)
+
+
+class DecodedImageCacheTest(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.image_path = Path(self.tmpdir.name) / "test.png"
+        cv2.imwrite(self.image_path.as_posix(), np.zeros((50, 50, 3), np.uint8))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_get_decodes_once(self):
+        cache = DecodedImageCache()
+        image_1 = cache.get(self.image_path)
+        image_2 = cache.get(str(self.image_path))
+        self.assertIs(image_1, image_2)
+        self.assertEqual(cache.decode_count, 1)
+        self.assertFalse(image_1.flags.writeable)
+
+    def test_get_file_changed(self):
+        cache = DecodedImageCache()
+        cache.get(self.image_path)
+        # rewritten (as the anonymized receipts)
+        cv2.imwrite(self.image_path.as_posix(), np.zeros((20, 20, 3), np.uint8))
+        image = cache.get(self.image_path)
+        self.assertEqual(image.shape, (20, 20, 3))
+        self.assertEqual(cache.decode_count, 2)
+
+    def test_get_lru_eviction(self):
+        cache = DecodedImageCache(max_size=2)
+        image_path_list = [self.image_path]
+        for i in range(2):
+            image_path = Path(self.tmpdir.name) / f"test_{i}.png"
+            cv2.imwrite(image_path.as_posix(), np.zeros((50, 50, 3), np.uint8))
+            image_path_list.append(image_path)
+        cache.get(image_path_list[0])
+        cache.get(image_path_list[1])
+        cache.get(image_path_list[0])  # most recently used
+        cache.get(image_path_list[2])  # evicts image_path_list[1]
+        self.assertEqual(len(cache.image_dict), 2)
+        cache.get(image_path_list[0])
+        self.assertEqual(cache.decode_count, 3)
+        cache.get(image_path_list[1])
+        self.assertEqual(cache.decode_count, 4)
+
+    def test_get_missing_file(self):
+        cache = DecodedImageCache()
+        self.assertIsNone(cache.get(Path(self.tmpdir.name) / "missing.png"))
+        self.assertEqual(len(cache.image_dict), 0)
+
+    def test_cleared_after_task(self):
+        decoded_image_cache.get(self.image_path)
+        self.assertTrue(decoded_image_cache.image_dict)
+        post_execute_in_worker.send(sender="test", func=None, task={})
+        self.assertEqual(len(decoded_image_cache.image_dict), 0)
+
+
+class ReducedDecodeTest(TestCase):
+    def test_get_image_reduction_factor(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            image_path = Path(tmpdir) / "test.jpg"
+            cv2.imwrite(image_path.as_posix(), np.zeros((1000, 2000, 3), np.uint8))
+            self.assertEqual(get_image_reduction_factor(image_path, 224), 8)
+            self.assertEqual(get_image_reduction_factor(image_path, 300), 4)
+            self.assertEqual(get_image_reduction_factor(image_path, 1000), 2)
+            self.assertEqual(get_image_reduction_factor(image_path, 1500), 1)
+            # not an image
+            self.assertEqual(get_image_reduction_factor(Path(tmpdir), 224), 1)
+
+    def test_open_image_cv2_min_size(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            image_path = Path(tmpdir) / "test.jpg"
+            cv2.imwrite(image_path.as_posix(), np.zeros((1000, 2000, 3), np.uint8))
+            self.assertEqual(open_image_cv2(image_path).shape, (1000, 2000, 3))
+            for cached in (False, True):
+                image = open_image_cv2(image_path, cached=cached, min_size=300)
+                self.assertEqual(image.shape, (250, 500, 3))
+            image = open_image_cv2(image_path, rgb=True, min_size=224)
+            self.assertEqual(image.shape, (125, 250, 3))
+
 
 class GenerateImageThumbnailCv2Test(TestCase):
     def test_image_smaller_than_max_size_returns_unchanged(self):
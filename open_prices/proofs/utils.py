@@ -1,8 +1,12 @@
+import fcntl
 import hashlib
 import logging
 import os
 import random
 import string
+import tempfile
+import threading
+from collections import OrderedDict, defaultdict
 from mimetypes import guess_extension
 from pathlib import Path
 from typing import Literal
@@ -11,12 +15,14 @@ import cv2
 import numpy as np
 from django.conf import settings
 from django.core.files.uploadedfile import InMemoryUploadedFile, TemporaryUploadedFile
+from django.utils import timezone
 from PIL import Image, ImageOps
 
 from open_prices.common import utils
 from open_prices.prices import constants as price_constants
 from open_prices.prices.models import Price
-from open_prices.proofs.models import PriceTag, ReceiptItem
+from open_prices.proofs import constants as proof_constants
+from open_prices.proofs.models import PriceTag, Proof, ReceiptItem
 
 logger = logging.getLogger(__name__)
 
@@ -63,18 +69,17 @@ def generate_relative_path(
     return f"{current_dir_id_str}/{file_stem}{extension}"
 
 
-def crop_image(
-    image_file_path_full: str | Path, bounding_box: tuple[float, float, float, float]
+def crop_image_array(
+    image: np.ndarray, bounding_box: tuple[float, float, float, float]
 ) -> np.ndarray:
-    """Crop the image at the given path using the bounding box.
+    """Crop the (decoded) image using the bounding box.
 
-    :param image_file_path_full: the full path to the image file
+    :param image: the image as a numpy array
     :param bounding_box: the bounding box to crop, in the format
         (y_min, x_min, y_max, x_max) with values between 0 and 1
-    :return: the cropped image as a numpy array (uint8, BGR format)
+    :return: the cropped image as a numpy array (same format as the image)
     """
     y_min, x_min, y_max, x_max = bounding_box
-    image = cv2.imread(str(image_file_path_full), cv2.IMREAD_COLOR)
     (left, right, top, bottom) = (
         x_min * image.shape[1],
         x_max * image.shape[1],
@@ -84,51 +89,193 @@ def crop_image(
     return image[int(top) : int(bottom), int(left) : int(right)]
 
 
+# reduction factor -> cv2.imread flag (JPEG images are decoded directly at
+# the reduced scale, other formats are decoded then resized)
+IMREAD_COLOR_FLAG_DICT = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def get_image_reduction_factor(image_path: str | Path, min_size: int) -> int:
+    """Get the largest decode reduction factor (1, 2, 4 or 8) keeping the
+    longest side of the image >= min_size (models resize the longest side
+    to their input size).
+
+    Only the image header is read.
+    """
+    try:
+        with Image.open(image_path) as img:
+            width, height = img.size
+    except Exception:
+        return 1
+    for reduction_factor in (8, 4, 2):
+        if max(width, height) // reduction_factor >= min_size:
+            return reduction_factor
+    return 1
+
+
+class DecodedImageCache:
+    """Small LRU cache of decoded images (numpy arrays, BGR format), keyed on
+    the path & mtime: the ML steps of a proof (detection, then classification &
+    extraction of each price tag crop) decode its image once.
+
+    The cached arrays are read-only (crops are views into them): callers
+    must copy them before any in-place change.
+
+    Scoped to a task (cleared after each django-q task, see
+    common/apps.py) or to a synchronous ML run.
+    """
+
+    def __init__(
+        self, max_size: int = proof_constants.DECODED_IMAGE_CACHE_MAX_SIZE
+    ) -> None:
+        self.max_size = max_size
+        self.image_dict: OrderedDict[tuple, np.ndarray] = OrderedDict()
+        self.decode_count = 0
+        self.lock = threading.Lock()
+
+    def get(
+        self, image_path: str | Path, reduction_factor: int = 1
+    ) -> np.ndarray | None:
+        """
+        :param reduction_factor: decode at 1/reduction_factor scale (see
+            get_image_reduction_factor), defaults to 1 (full resolution)
+        :return: the decoded image, None if it cannot be read (as cv2.imread)
+        """
+        image_path = str(image_path)
+        try:
+            stat = os.stat(image_path)
+        except OSError:
+            return None
+        # a file rewritten (e.g. anonymized) gets a new key: the mtime alone
+        # may not change within the filesystem timestamp granularity
+        key = (
+            image_path,
+            stat.st_mtime_ns,
+            stat.st_ino,
+            stat.st_size,
+            reduction_factor,
+        )
+        with self.lock:
+            if key in self.image_dict:
+                self.image_dict.move_to_end(key)
+                return self.image_dict[key]
+        image = cv2.imread(image_path, IMREAD_COLOR_FLAG_DICT[reduction_factor])
+        self.decode_count += 1
+        if image is None:
+            return None
+        image.flags.writeable = False
+        with self.lock:
+            self.image_dict[key] = image
+            while len(self.image_dict) > self.max_size:
+                self.image_dict.popitem(last=False)
+        return image
+
+    def clear(self) -> None:
+        with self.lock:
+            self.image_dict.clear()
+
+
+decoded_image_cache = DecodedImageCache()
+
+
+def task_post_execute_clear_decoded_image_cache(sender, func, task, **kwargs):
+    decoded_image_cache.clear()
+
+
+def crop_image(
+    image_file_path_full: str | Path, bounding_box: tuple[float, float, float, float]
+) -> np.ndarray:
+    """Crop the image at the given path using the bounding box.
+
+    The image is decoded once (see DecodedImageCache): the crop is a
+    (read-only) view into the cached image.
+
+    :param image_file_path_full: the full path to the image file
+    :param bounding_box: the bounding box to crop, in the format
+        (y_min, x_min, y_max, x_max) with values between 0 and 1
+    :return: the cropped image as a numpy array (uint8, BGR format)
+    """
+    image = decoded_image_cache.get(image_file_path_full)
+    return crop_image_array(image, bounding_box)
+
+
 def generate_thumbnail(
+    image: Image.Image,
     current_dir: Path,
     current_dir_id_str: str,
     file_stem: str,
     extension: str,
     mimetype: str,
     thumbnail_size: int = settings.THUMBNAIL_SIZE,
-) -> str | None:
-    """Generate a thumbnail for the image at the given path."""
-    if not mimetype.startswith("image"):
-        return None
-    file_full_path = generate_full_path(current_dir, file_stem, extension)
-    with Image.open(file_full_path) as img:
-        try:
-            img_thumb = img.copy()
-        except OSError:
-            return None
-        # set any rotation info
-        img_thumb = ImageOps.exif_transpose(img)
-        # transform into a thumbnail
-        img_thumb.thumbnail((thumbnail_size, thumbnail_size), Image.Resampling.LANCZOS)
-        image_thumb_full_path = generate_full_path(
-            current_dir, f"{file_stem}.{thumbnail_size}", extension
-        )
-        # avoid 'cannot write mode RGBA/LA/P as JPEG' error
-        if mimetype in ("image/jpeg",) and img_thumb.mode in ("RGBA", "LA", "P"):
-            img_thumb = img_thumb.convert("RGB")
-        # save (exif will be stripped)
-        img_thumb.save(image_thumb_full_path)
-        return generate_relative_path(
-            current_dir_id_str,
-            f"{file_stem}.{thumbnail_size}",
-            extension,
-        )
+) -> str:
+    """Generate a thumbnail of the (decoded, rotated) image, next to it.
+
+    :return: the relative path of the thumbnail
+    """
+    img_thumb = image.copy()
+    # transform into a thumbnail
+    img_thumb.thumbnail((thumbnail_size, thumbnail_size), Image.Resampling.LANCZOS)
+    image_thumb_full_path = generate_full_path(
+        current_dir, f"{file_stem}.{thumbnail_size}", extension
+    )
+    # avoid 'cannot write mode RGBA/LA/P as JPEG' error
+    if mimetype in ("image/jpeg",) and img_thumb.mode in ("RGBA", "LA", "P"):
+        img_thumb = img_thumb.convert("RGB")
+    # save (exif will be stripped)
+    img_thumb.save(image_thumb_full_path)
+    return generate_relative_path(
+        current_dir_id_str,
+        f"{file_stem}.{thumbnail_size}",
+        extension,
+    )
+
+
+def stream_file_to_temp(
+    file: InMemoryUploadedFile | TemporaryUploadedFile,
+    images_dir: Path | None = None,
+) -> tuple[Path, str]:
+    """Write the uploaded file to a temporary file in the images directory,
+    chunk by chunk, computing its MD5 hash on the way.
+
+    The memory used is bounded by the chunk size (not the image size), and
+    the file is read only once. The temporary file is on the same filesystem
+    as the image directories: it can then be moved there atomically (see
+    store_temp_file), or removed if the upload is a duplicate.
+
+    :param file: the uploaded file
+    :param images_dir: the directory where the images are stored, defaults to
+        settings.IMAGES_DIR
+    :return: the temporary file path and the MD5 hash of the file
+    """
+    if images_dir is None:
+        images_dir = settings.IMAGES_DIR
+    images_dir.mkdir(exist_ok=True, parents=True)
+    md5_hash = hashlib.md5()
+    with tempfile.NamedTemporaryFile(
+        dir=images_dir, prefix=".upload-", delete=False
+    ) as temp_file:
+        for chunk in file.chunks():
+            md5_hash.update(chunk)
+            temp_file.write(chunk)
+    return Path(temp_file.name), md5_hash.hexdigest()
 
 
-def store_file(
+def store_temp_file(
+    temp_file_path: Path,
     file: InMemoryUploadedFile | TemporaryUploadedFile,
-) -> tuple[str, str, str | None]:
+) -> tuple[str, str]:
     """
-    Create a file in the images directory with a random name and the
-    correct extension.
+    Move the temporary file (see stream_file_to_temp) to the images directory,
+    with a random name and the correct extension.
+    The thumbnail is generated later (see generate_proof_image_derivatives).
 
-    :param file: the file to save
-    :return: the file path, the mimetype and the thumbnail path
+    :param temp_file_path: the temporary file path
+    :param file: the uploaded file (for its content type)
+    :return: the file path and the mimetype
     """
     # Generate a random name for the file
     # This name will be used to display the image to the client, so it shouldn't be discoverable  # noqa
@@ -137,19 +284,15 @@ def store_file(
     # We store the images in directories containing up to 1000 images
     # Once we reach 1000 images, we create a new directory by increasing the directory ID  # noqa
     # This is used to prevent the base image directory from containing too many files  # noqa
-    current_dir = select_proof_image_dir(settings.IMAGES_DIR)
-    current_dir.mkdir(exist_ok=True, parents=True)
+    current_dir = select_proof_image_dir(temp_file_path.parent)
+    current_dir.mkdir(exist_ok=True)
     file_full_path = generate_full_path(current_dir, file_stem, extension)
-    # write the content of the file to the new file
-    with file_full_path.open("wb") as f:
-        f.write(file.file.read())
-    # create a thumbnail
-    image_thumb_path = generate_thumbnail(
-        current_dir, current_dir.name, file_stem, extension, mimetype
-    )
+    # same filesystem: atomic rename
+    temp_file_path.replace(file_full_path)
+    file_full_path.chmod(0o644)  # NamedTemporaryFile creates 0o600 files
     # Build file_path
     file_path = generate_relative_path(current_dir.name, file_stem, extension)
-    return (file_path, mimetype, image_thumb_path)
+    return (file_path, mimetype)
 
 
 def save_anonymized_receipt(
@@ -252,28 +395,75 @@ def compute_file_md5_from_path(file_path: Path) -> str:
     return md5_hash.hexdigest()
 
 
-def select_proof_image_dir(images_dir: Path, max_images_per_dir: int = 1_000) -> Path:
-    """Select the directory where to store the image.
+def get_proof_image_dir_state(images_dir: Path) -> tuple[int, int]:
+    """Scan the images directory: highest directory ID and its number of files.
 
-    We create a new directory when the current one contains more than 1000
-    images. The directories are named with a 4-digit number, starting at 0001.
+    Only used to initialize the directory counter (see allocate_proof_image_slot).
 
     :param images_dir: the directory where the images are stored
-    :param max_images_per_dir: the maximum number of images per directory
-    :return: the selected directory
+    :return: the current directory ID and its number of files
     """
     current_dir_id = max(
         (int(p.name) for p in images_dir.iterdir() if p.is_dir() and p.name.isdigit()),
         default=1,
     )
-    current_dir_id_str = f"{current_dir_id:04d}"
-    current_dir = images_dir / current_dir_id_str
-    if current_dir.exists() and len(list(current_dir.iterdir())) >= max_images_per_dir:
-        # if the current directory contains 1000 images, we create a new one
-        current_dir_id += 1
-        current_dir_id_str = f"{current_dir_id:04d}"
-        current_dir = images_dir / current_dir_id_str
-    return current_dir
+    current_dir = images_dir / f"{current_dir_id:04d}"
+    if not current_dir.exists():
+        return current_dir_id, 0
+    return current_dir_id, sum(1 for _ in current_dir.iterdir())
+
+
+def allocate_proof_image_slot(
+    images_dir: Path,
+    max_images_per_dir: int = proof_constants.PROOF_IMAGE_MAX_IMAGES_PER_DIR,
+) -> tuple[int, int]:
+    """Allocate a (directory ID, slot) pair for a new image, without listing
+    the directories.
+
+    The current directory ID and its image count are kept in a counter file
+    in the images directory, updated under an exclusive lock (flock): the
+    concurrent uploads (workers, processes) never overshoot the directory cap.
+    The counter file is initialized (or repaired) by scanning the directories.
+
+    :param images_dir: the directory where the images are stored
+    :param max_images_per_dir: the maximum number of images per directory
+    :return: the directory ID and the slot (1 to max_images_per_dir) in it
+    """
+    counter_path = images_dir / proof_constants.PROOF_IMAGE_DIR_COUNTER_FILENAME
+    fd = os.open(counter_path, os.O_RDWR | os.O_CREAT, 0o644)
+    with os.fdopen(fd, "r+") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)  # released when the file is closed
+        try:
+            current_dir_id, image_count = map(int, f.read().split())
+        except ValueError:  # new (empty) or corrupted counter file
+            current_dir_id, image_count = get_proof_image_dir_state(images_dir)
+        if image_count >= max_images_per_dir:
+            # the current directory is full, we switch to a new one
+            current_dir_id += 1
+            image_count = 0
+        image_count += 1
+        f.seek(0)
+        f.truncate()
+        f.write(f"{current_dir_id} {image_count}")
+        f.flush()
+    return current_dir_id, image_count
+
+
+def select_proof_image_dir(
+    images_dir: Path,
+    max_images_per_dir: int = proof_constants.PROOF_IMAGE_MAX_IMAGES_PER_DIR,
+) -> Path:
+    """Select the directory where to store the image.
+
+    We create a new directory when the current one contains 1000 images.
+    The directories are named with a 4-digit number, starting at 0001.
+
+    :param images_dir: the directory where the images are stored
+    :param max_images_per_dir: the maximum number of images per directory
+    :return: the selected directory
+    """
+    current_dir_id, _ = allocate_proof_image_slot(images_dir, max_images_per_dir)
+    return images_dir / f"{current_dir_id:04d}"
 
 
 def cleanup_price_tag_prediction_barcode(barcode: str) -> str:
@@ -382,48 +572,126 @@ def get_price_tag_image_path(price_tag_id: int) -> str:
     return f"price-tags/{part1}/{part2}/{filename}"
 
 
-def generate_price_tag_image(price_tag: PriceTag) -> None:
-    """Crop the price tag from the proof image and save it to disk.
+def generate_proof_image_derivatives(proof: Proof, regenerate: bool = False) -> None:
+    """Decode the proof image once, and generate its pending derivatives:
+    the thumbnail & the price tag crops.
 
-    The cropped image is saved in WebP format, using the price tag's ID to
-    determine the file path.
-
-    The structure of the path is as follows:
+    The crops are saved in WebP format, using the price tag's ID to
+    determine the file path (see get_price_tag_image_path):
     /img/price-tags/000/200/000200000.webp (for price_tag_id = 200000)
 
-    :param price_tag: The price tag object containing the proof and bounding
-        box.
+    :param proof: the proof
+    :param regenerate: regenerate all the derivatives, not only the pending
+        ones (backfills)
     """
-    if not price_tag.proof.file_path:
-        return
-
-    if not os.path.exists(price_tag.proof.file_path_full):
+    pending = proof_constants.IMAGE_DERIVATIVES_STATUS_PENDING
+    generate_thumb = regenerate or proof.image_derivatives_status == pending
+    price_tag_queryset = proof.price_tags.only("id", "bounding_box")
+    if not regenerate:
+        price_tag_queryset = price_tag_queryset.filter(image_status=pending)
+    price_tag_list = list(price_tag_queryset)
+    if not (generate_thumb or price_tag_list):
+        # nothing pending (e.g. already done by a previous task)
         return
 
-    try:
-        cropped_img = crop_image(price_tag.proof.file_path_full, price_tag.bounding_box)
-        output_path = price_tag.image_path_full
-
-        # Ensure output directory exists
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-
-        # Save as WebP
-        # quality=80 is the default on Pillow for WebP, we keep the same value here
-        # imwrite expects image in BGR format, which is what crop_image returns
-        cv2.imwrite(output_path, cropped_img, [cv2.IMWRITE_WEBP_QUALITY, 80])
-    except Exception as e:
-        logger.error(f"Error generating price tag image for {price_tag.id}: {e}")
-
+    image = None
+    if proof.file_path_full and os.path.exists(proof.file_path_full):
+        try:
+            with Image.open(proof.file_path_full) as img:
+                if not price_tag_list:
+                    # only the thumbnail: decode JPEGs at a reduced scale
+                    # (same margin as Image.thumbnail's reducing_gap)
+                    ratio = settings.THUMBNAIL_SIZE * 2 / max(img.size)
+                    img.draft(None, (int(img.width * ratio), int(img.height * ratio)))
+                # decode once, and set any rotation info
+                image = ImageOps.exif_transpose(img)
+        except Exception as e:
+            logger.error(f"Error decoding the image of proof {proof.id}: {e}")
+    status = (
+        proof_constants.IMAGE_DERIVATIVES_STATUS_READY
+        if image is not None
+        else proof_constants.IMAGE_DERIVATIVES_STATUS_FAILED
+    )
 
-def open_image_cv2(image_path: str | Path, rgb: bool = False) -> np.ndarray:
+    if generate_thumb:
+        # bump updated: conditional GET (see ConditionalGetMixin)
+        update_kwargs = {"image_derivatives_status": status, "updated": timezone.now()}
+        if image is not None:
+            file_path = Path(proof.file_path)
+            update_kwargs["image_thumb_path"] = generate_thumbnail(
+                image,
+                settings.IMAGES_DIR / file_path.parent,
+                file_path.parent.as_posix(),
+                file_path.stem,
+                file_path.suffix,
+                proof.mimetype or "",
+            )
+        # no signals, no history: derived data
+        Proof.all_objects.filter(id=proof.id).update(**update_kwargs)
+        for field_name, value in update_kwargs.items():
+            setattr(proof, field_name, value)
+
+    if price_tag_list:
+        price_tag_status_dict = defaultdict(list)  # status -> price tag ids
+        # imwrite expects images in BGR format
+        image_array = (
+            cv2.cvtColor(np.asarray(image.convert("RGB")), cv2.COLOR_RGB2BGR)
+            if image is not None
+            else None
+        )
+        for price_tag in price_tag_list:
+            price_tag_status = status
+            if image_array is not None:
+                try:
+                    cropped_image = crop_image_array(
+                        image_array, price_tag.bounding_box
+                    )
+                    os.makedirs(
+                        os.path.dirname(price_tag.image_path_full), exist_ok=True
+                    )
+                    # quality=80 is the default on Pillow for WebP, we keep the same value here
+                    cv2.imwrite(
+                        price_tag.image_path_full,
+                        cropped_image,
+                        [cv2.IMWRITE_WEBP_QUALITY, 80],
+                    )
+                except Exception as e:
+                    logger.error(
+                        f"Error generating price tag image for {price_tag.id}: {e}"
+                    )
+                    price_tag_status = proof_constants.IMAGE_DERIVATIVES_STATUS_FAILED
+            price_tag_status_dict[price_tag_status].append(price_tag.id)
+        for price_tag_status, price_tag_id_list in price_tag_status_dict.items():
+            PriceTag.objects.filter(id__in=price_tag_id_list).update(
+                image_status=price_tag_status, updated=timezone.now()
+            )
+
+
+def open_image_cv2(
+    image_path: str | Path,
+    rgb: bool = False,
+    cached: bool = False,
+    min_size: int | None = None,
+) -> np.ndarray:
     """Open an image using OpenCV.
 
     :param image_path: the path to the image file
     :param rgb: whether to convert the image to RGB format
+    :param cached: whether to go through the decoded image cache (the
+        returned BGR image is then read-only), defaults to False
+    :param min_size: the size needed by the downstream model: the image is
+        decoded at the smallest scale keeping its longest side >= min_size,
+        defaults to None (full resolution)
     :return: the image as a numpy array in RGB format if rgb=True (default is False),
         otherwise in BGR format
     """
-    image = cv2.imread(str(image_path), cv2.IMREAD_COLOR)  # type: ignore
+    reduction_factor = (
+        get_image_reduction_factor(image_path, min_size) if min_size else 1
+    )
+    if cached:
+        image = decoded_image_cache.get(image_path, reduction_factor)
+    else:
+        image = cv2.imread(str(image_path), IMREAD_COLOR_FLAG_DICT[reduction_factor])  # type: ignore
     if rgb:
         image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)  # type: ignore
     return image  # type: ignore
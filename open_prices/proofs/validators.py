@@ -38,12 +38,8 @@ def validate_proof_location_rules(instance):
     """
     errors = dict()
     if instance.location_id:
-        location = None
-        from open_prices.locations.models import Location
-
-        try:
-            location = Location.objects.get(id=instance.location_id)
-        except Location.DoesNotExist:
+        location = utils.get_related_object(instance, "location")
+        if location is None:
             utils.add_validation_error(
                 errors,
                 "location",
@@ -5,6 +5,7 @@ from django.test import TestCase
 from open_prices.badges import constants as badge_constants
 from open_prices.badges.factories import BadgeFactory
 from open_prices.challenges.factories import ChallengeFactory
+from open_prices.common.testing import ProcessCacheResetMixin
 from open_prices.locations import constants as location_constants
 from open_prices.locations.factories import LocationFactory
 from open_prices.prices import constants as price_constants
@@ -38,7 +39,7 @@ class TotalStatsSaveTest(TestCase):
         self.assertRaises(IntegrityError, TotalStats.objects.create)
 
 
-class TotalStatsTest(TestCase):
+class TotalStatsTest(ProcessCacheResetMixin, TestCase):
     @classmethod
     def setUpTestData(cls):
         cls.total_stats = TotalStats.get_solo()
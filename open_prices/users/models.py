@@ -3,6 +3,8 @@ from django.db.models import Count, F, Func, OuterRef, Subquery
 from django.db.models.functions import Coalesce, ExtractYear
 from django.utils import timezone
 
+from open_prices.common.models import CounterDelta
+
 
 class UserQuerySet(models.QuerySet):
     def has_prices(self):
@@ -125,6 +127,7 @@ class User(models.Model):
     def update_price_count(self):
         from open_prices.prices.models import Price
 
+        CounterDelta.objects.discard(self, ["price_count"])
         self.price_count = Price.objects.filter(owner=self.user_id).count()
         self.price_type_product_count = (
             Price.objects.filter(owner=self.user_id).has_type_product().count()
@@ -187,6 +190,7 @@ class User(models.Model):
     def update_proof_count(self):
         from open_prices.proofs.models import Proof
 
+        CounterDelta.objects.discard(self, ["proof_count"])
         self.proof_count = Proof.objects.filter(owner=self.user_id).count()
         self.proof_kind_community_count = (
             Proof.objects.filter(owner=self.user_id).has_kind_community().count()